@@ -1,39 +1,58 @@
-from docling.document_converter import DocumentConverter
-from utils.sitemap import get_sitemap_urls
-
-converter = DocumentConverter()
-
-# --------------------------------------------------------------
-# Basic PDF extraction
-# --------------------------------------------------------------
-
-result = converter.convert("https://arxiv.org/pdf/2408.09869")
-
-document = result.document
-markdown_output = document.export_to_markdown()
-json_output = document.export_to_dict()
-
-print(markdown_output)
-
-# --------------------------------------------------------------
-# Basic HTML extraction
-# --------------------------------------------------------------
-
-result = converter.convert("https://ds4sd.github.io/docling/")
-
-document = result.document
-markdown_output = document.export_to_markdown()
-print(markdown_output)
-
-# --------------------------------------------------------------
-# Scrape multiple pages using the sitemap
-# --------------------------------------------------------------
-
-sitemap_urls = get_sitemap_urls("https://ds4sd.github.io/docling/")
-conv_results_iter = converter.convert_all(sitemap_urls)
-
-docs = []
-for result in conv_results_iter:
-    if result.document:
-        document = result.document
-        docs.append(document)
+from utils.converter import convert
+from utils.ingest import crawl_and_convert, iter_documents
+from utils.pdf import ParallelPdfConverter
+from utils.sitemap import iter_sitemap_entries
+
+# convert() uses the converter daemon (python -m utils.converter serve) when it's
+# running, so the models are already loaded. Otherwise it converts in-process and
+# only loads the models the document needs (e.g. no OCR for PDFs with a text layer).
+
+# The main guard is required by multiprocessing on platforms that spawn workers:
+# they re-import this script, and must not convert anything while doing so.
+if __name__ == "__main__":
+    # --------------------------------------------------------------
+    # Basic PDF extraction
+    # --------------------------------------------------------------
+
+    document = convert("https://arxiv.org/pdf/2408.09869")
+    markdown_output = document.export_to_markdown()
+    json_output = document.export_to_dict()
+
+    print(markdown_output)
+
+    # --------------------------------------------------------------
+    # Basic HTML extraction
+    # --------------------------------------------------------------
+
+    document = convert("https://ds4sd.github.io/docling/")
+    markdown_output = document.export_to_markdown()
+    print(markdown_output)
+
+    # --------------------------------------------------------------
+    # Scrape multiple pages using the sitemap
+    # --------------------------------------------------------------
+
+    # Convert the pages in a process pool. Each finished document is written to
+    # data/docs and checkpointed in a manifest, so re-running resumes where it
+    # stopped. For large sites, stream the sitemap (including nested sitemap
+    # indexes) instead of building the full URL list up front.
+    entries = iter_sitemap_entries("https://ds4sd.github.io/docling/")
+    stats = crawl_and_convert(
+        (entry.url for entry in entries), output_dir="data/docs", max_workers=4
+    )
+    print(stats)
+
+    # Stream the converted documents back from disk instead of keeping them all in memory
+    for document in iter_documents("data/docs"):
+        print(document.name)
+
+    # --------------------------------------------------------------
+    # Convert a large PDF on all cores
+    # --------------------------------------------------------------
+
+    # Page ranges are converted in a pool of worker processes that each load the
+    # models once, then merged back into one document in page order
+    with ParallelPdfConverter(pages_per_part=2, min_pages=4) as parallel_converter:
+        parallel_converter.warm_up()
+        document = parallel_converter.convert("https://arxiv.org/pdf/2408.09869")
+    print(document.export_to_markdown())
@@ -1,8 +1,11 @@
-from docling.chunking import HybridChunker
-from docling.document_converter import DocumentConverter
+import lancedb
 from dotenv import load_dotenv
 from openai import OpenAI
-from utils.tokenizer import OpenAITokenizerWrapper
+from utils.chunking import StreamingHybridChunker, write_chunks
+from utils.docstore import DocumentStore
+from utils.pdf import ParallelPdfConverter
+from utils.schema import open_chunks_table
+from utils.tokenizer import ChunkerTokenizer, OpenAITokenizerWrapper
 
 load_dotenv()
 
@@ -12,27 +15,61 @@ client = OpenAI()
 
 tokenizer = OpenAITokenizerWrapper()  # Load our custom tokenizer for OpenAI
 MAX_TOKENS = 8191  # text-embedding-3-large's maximum context length
+BATCH_SIZE = 256  # Rows per Arrow record batch written to LanceDB
 
+# Set to True to convert the source again even if data/docs has a current copy
+RECONVERT = False
 
-# --------------------------------------------------------------
-# Extract the data
-# --------------------------------------------------------------
 
-converter = DocumentConverter()
-result = converter.convert("https://arxiv.org/pdf/2408.09869")
+# The main guard is required by multiprocessing on platforms that spawn workers
+if __name__ == "__main__":
+    # --------------------------------------------------------------
+    # Extract the data
+    # --------------------------------------------------------------
 
+    # Pages are converted in parallel by a pool of worker processes, each with its
+    # own DocumentConverter, and merged back into one document in page order.
+    # Small parts suit this short paper, the defaults suit PDFs with hundreds of pages.
+    def convert_pdf(source: str):
+        with ParallelPdfConverter(pages_per_part=2, min_pages=4) as converter:
+            return converter.convert(source)
 
-# --------------------------------------------------------------
-# Apply hybrid chunking
-# --------------------------------------------------------------
+    # Converted documents are kept in data/docs, so re-running with different
+    # chunker settings loads the document instead of converting it again, as
+    # long as the source answers 304 Not Modified
+    source = "https://arxiv.org/pdf/2408.09869"
+    store = DocumentStore()
+    document = store.get_or_convert(source, convert_pdf, refresh=RECONVERT)
 
-chunker = HybridChunker(
-    tokenizer=tokenizer,
-    max_tokens=MAX_TOKENS,
-    merge_peers=True,
-)
+    # --------------------------------------------------------------
+    # Apply hybrid chunking
+    # --------------------------------------------------------------
 
-chunk_iter = chunker.chunk(dl_doc=result.document)
-chunks = list(chunk_iter)
+    # ChunkerTokenizer counts integer token ids and caches counts per text span,
+    # which is all HybridChunker needs. The streaming variant yields chunks lazily
+    # instead of building the full list of chunks first.
+    chunker = StreamingHybridChunker(
+        tokenizer=ChunkerTokenizer(tokenizer=tokenizer, max_tokens=MAX_TOKENS),
+        merge_peers=True,
+    )
 
-len(chunks)
+    chunk_iter = chunker.chunk(dl_doc=document)
+
+    # --------------------------------------------------------------
+    # Stream the chunks into LanceDB
+    # --------------------------------------------------------------
+
+    # Only new or changed chunks are embedded and written, in fixed-size record
+    # batches, so vector memory stays bounded by BATCH_SIZE even for documents
+    # with thousands of pages
+    db = lancedb.connect("data/lancedb")
+    table = open_chunks_table(db, "docling")
+
+    stats = write_chunks(
+        table,
+        chunk_iter,
+        source=source,
+        doc_hash=store.doc_hash(source),
+        batch_size=BATCH_SIZE,
+    )
+    print(f"Chunks: {stats}")
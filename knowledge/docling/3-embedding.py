@@ -1,13 +1,23 @@
-from typing import List
-
 import lancedb
-from docling.chunking import HybridChunker
-from docling.document_converter import DocumentConverter
 from dotenv import load_dotenv
-from lancedb.embeddings import get_registry
-from lancedb.pydantic import LanceModel, Vector
 from openai import OpenAI
-from utils.tokenizer import OpenAITokenizerWrapper
+from utils.chunking import StreamingHybridChunker
+from utils.converter import convert
+from utils.corpus import shard_table_name
+from utils.dedup import Deduplicator
+from utils.docstore import DocumentStore
+from utils.embedding_cache import EmbeddingCache
+from utils.embeddings import BatchEmbedder
+from utils.index import MIN_ROWS_FOR_INDEX, refresh_fts_index, refresh_index
+from utils.incremental import (
+    delete_missing_sources,
+    is_unchanged,
+    sync_document,
+)
+from utils.quantization import VectorStorage
+from utils.schema import open_chunks_table
+from utils.telemetry import span, telemetry
+from utils.tokenizer import ChunkerTokenizer, OpenAITokenizerWrapper
 
 load_dotenv()
 
@@ -18,27 +28,32 @@ client = OpenAI()
 tokenizer = OpenAITokenizerWrapper()  # Load our custom tokenizer for OpenAI
 MAX_TOKENS = 8191  # text-embedding-3-large's maximum context length
 
+# Documents that make up the corpus
+SOURCES = ["https://arxiv.org/pdf/2408.09869"]
 
-# --------------------------------------------------------------
-# Extract the data
-# --------------------------------------------------------------
+# Set to True to drop the table and re-embed everything
+FULL_REFRESH = False
 
-converter = DocumentConverter()
-result = converter.convert("https://arxiv.org/pdf/2408.09869")
+# How vectors are stored: VectorStorage("float16"), VectorStorage("float32", dims=1024)
+# (Matryoshka truncation) or VectorStorage("binary") / VectorStorage("binary_int8"),
+# searched by sign bits and rescored against the float32 query. Compare them with python -m benchmarks.quantization.
+# Changing it requires a FULL_REFRESH.
+VECTOR_STORAGE = VectorStorage()
 
+# Set to a tenant or collection name to ingest SOURCES into its own shard
+# (table docling-<name>, see utils/corpus.py) instead of the shared docling table.
+# Re-ingesting a shard leaves every other shard untouched.
+SHARD = None
 
-# --------------------------------------------------------------
-# Apply hybrid chunking
-# --------------------------------------------------------------
+# Set to False to store every chunk, even when another source already has the same
+# or a near-identical chunk (e.g. navigation and footers of crawled pages)
+DEDUPLICATE = True
 
-chunker = HybridChunker(
-    tokenizer=tokenizer,
-    max_tokens=MAX_TOKENS,
-    merge_peers=True,
-)
+# Stored documents are revalidated against their source first (a conditional GET
+# for URLs) and only converted again when it changed. Set to True to convert the
+# sources again regardless.
+RECONVERT = False
 
-chunk_iter = chunker.chunk(dl_doc=result.document)
-chunks = list(chunk_iter)
 
 # --------------------------------------------------------------
 # Create a LanceDB database and table
@@ -47,64 +62,84 @@ chunks = list(chunk_iter)
 # Create a LanceDB database
 db = lancedb.connect("data/lancedb")
 
+# The schema (ChunkMetadata and Chunks) lives in utils/schema.py so the other
+# scripts can share it. Besides the text, vector and metadata, every row keeps
+# its source and content hashes so we can re-ingest incrementally. An existing
+# table is checked against it: one created by an older version needs a
+# FULL_REFRESH.
+table_name = shard_table_name(SHARD) if SHARD else "docling"
+table = open_chunks_table(db, table_name, VECTOR_STORAGE, overwrite=FULL_REFRESH)
 
-# Get the OpenAI embedding function
-func = get_registry().get("openai").create(name="text-embedding-3-large")
-
-
-# Define a simplified metadata schema
-class ChunkMetadata(LanceModel):
-    """
-    You must order the fields in alphabetical order.
-    This is a requirement of the Pydantic implementation.
-    """
-
-    filename: str | None
-    page_numbers: List[int] | None
-    title: str | None
-
-
-# Define the main Schema
-class Chunks(LanceModel):
-    text: str = func.SourceField()
-    vector: Vector(func.ndims()) = func.VectorField()  # type: ignore
-    metadata: ChunkMetadata
-
-
-table = db.create_table("docling", schema=Chunks, mode="overwrite")
 
 # --------------------------------------------------------------
-# Prepare the chunks for the table
+# Extract, chunk and sync every document
 # --------------------------------------------------------------
 
-# Create table with processed chunks
-processed_chunks = [
-    {
-        "text": chunk.text,
-        "metadata": {
-            "filename": chunk.meta.origin.filename,
-            "page_numbers": [
-                page_no
-                for page_no in sorted(
-                    set(
-                        prov.page_no
-                        for item in chunk.meta.doc_items
-                        for prov in item.prov
-                    )
-                )
-            ]
-            or None,
-            "title": chunk.meta.headings[0] if chunk.meta.headings else None,
-        },
-    }
-    for chunk in chunks
-]
-
-# --------------------------------------------------------------
-# Add the chunks to the table (automatically embeds the text)
-# --------------------------------------------------------------
+# Embed in token-budgeted batches with adaptive concurrency instead of relying on
+# the embedding function's defaults. Pass base_url to point it at a mock server.
+# Vectors are cached on disk by content, so identical chunks are only embedded once.
+cache = EmbeddingCache()
+embedder = BatchEmbedder(tokenizer=tokenizer, cache=cache)
+
+# ChunkerTokenizer counts integer token ids and caches counts per text span,
+# which is all HybridChunker needs. The streaming variant yields chunks lazily,
+# so sync_document can embed and write them batch by batch.
+chunker = StreamingHybridChunker(
+    tokenizer=ChunkerTokenizer(tokenizer=tokenizer, max_tokens=MAX_TOKENS),
+    merge_peers=True,
+)
 
-table.add(processed_chunks)
+store = DocumentStore()
+
+# MinHash LSH index of the stored chunks. A chunk that duplicates one of them is
+# not embedded again, its source is added to the existing row's sources instead.
+dedup = Deduplicator.from_table(table) if DEDUPLICATE else None
+
+for source in SOURCES:
+    # Every stage below runs in a span under this one (see utils/telemetry.py)
+    with span("ingest", source=source):
+        # Loaded from data/docs if it was converted before and the source still
+        # answers 304 Not Modified, otherwise converted by the converter daemon
+        # when it's running (see utils/converter.py)
+        document = store.get_or_convert(source, convert, refresh=RECONVERT)
+
+        # Skip chunking and embedding entirely when the document didn't change. The
+        # hash was computed once when the document was stored.
+        doc_hash = store.doc_hash(source)
+        if is_unchanged(table, source, doc_hash):
+            print(f"{source}: unchanged")
+            continue
+
+        # Chunks are collected straight into Arrow columns one batch at a time
+        # and written as record batches. Only new or changed chunks are
+        # embedded, chunks that disappeared are deleted.
+        stats = sync_document(
+            table,
+            source,
+            doc_hash,
+            chunker.chunk(dl_doc=document),
+            embed=embedder.embed,
+            dedup=dedup,
+        )
+        telemetry.inc("docling_chunks_total", stats.chunks)
+        print(f"{source}: {stats}")
+
+# Remove documents that are no longer part of the corpus
+delete_missing_sources(table, SOURCES)
+print(f"Embedding: {embedder.stats}")
+print(f"Embedding cache: {cache.stats}")
+if dedup is not None:
+    print(f"Duplicates: {dedup.stats}")
+
+# Keep the ANN index in sync with the new rows. Small tables are searched exactly.
+if table.count_rows() >= MIN_ROWS_FOR_INDEX:
+    print(f"Index: {refresh_index(table)}")
+
+# Full-text (BM25) index for hybrid search in the chat app
+print(f"Full-text index: {refresh_fts_index(table)}")
+
+# Spans and metrics of this run, summarize them with python -m utils.telemetry summary
+print(f"Telemetry: {telemetry.export()}")
 
 # --------------------------------------------------------------
 # Load the table
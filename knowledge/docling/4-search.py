@@ -1,4 +1,16 @@
 import lancedb
+from dotenv import load_dotenv
+from openai import OpenAI
+from utils.embedding_cache import EmbeddingCache, embed_query
+from utils.index import SearchParams, vector_search
+
+load_dotenv()
+
+# Initialize OpenAI client (make sure you have OPENAI_API_KEY in your environment variables)
+client = OpenAI()
+
+# Query vectors are cached on disk, so repeating a query costs no API call
+cache = EmbeddingCache()
 
 # --------------------------------------------------------------
 # Connect to the database
@@ -19,5 +31,10 @@ table = db.open_table("docling")
 # Search the table
 # --------------------------------------------------------------
 
-result = table.search(query="what's docling?", query_type="vector").limit(3)
+query_vector = embed_query("what's docling?", cache, client)
+# nprobes and refine_factor trade recall for latency once the table has an
+# ANN index (python -m utils.index build), see python -m benchmarks.index
+params = SearchParams(nprobes=20, refine_factor=10)
+result = vector_search(table, query_vector, limit=3, params=params)
 result.to_pandas()
+print(f"Embedding cache: {cache.stats}")
@@ -1,7 +1,29 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
 import streamlit as st
 import lancedb
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
+from utils.context import ContextPacker
+from utils.corpus import Corpus
+from utils.embedding_cache import EmbeddingCache, embed_query
+from utils.index import SearchParams
+from utils.rag import (
+    SEARCH_PARAMS,
+    answer_events,
+    iter_sync,
+    open_table,
+    retrieve,
+)
+from utils.retrieval import SearchResult
+from utils.semantic_cache import SemanticCache, replay
+from utils.server import iter_events
+from utils.telemetry import span, telemetry
+from utils.tokenizer import OpenAITokenizerWrapper
 
 # Load environment variables
 load_dotenv()
@@ -9,6 +31,26 @@ load_dotenv()
 # Initialize OpenAI client
 client = OpenAI()
 
+# Set to the URL of the RAG service (python -m utils.server) to use this page as
+# a thin client, otherwise retrieval and generation run inside Streamlit
+API_URL = os.getenv("RAG_API_URL")
+
+# Set RAG_SHARDS=acme,globex to search only these tenants' shards (see
+# utils/corpus.py) instead of the shared docling table
+SHARDS = [shard for shard in os.getenv("RAG_SHARDS", "").split(",") if shard] or None
+
+# Set to True to retrieve more candidates and keep the best ones by a local
+# cross-encoder, so fewer chunks go into the prompt
+RERANK = False
+
+# Token budgets for retrieved chunks and chat history, so the prompt (and time to
+# first token) doesn't grow with the length of the conversation
+packer = ContextPacker(
+    OpenAITokenizerWrapper("o200k_base"),  # gpt-4o-mini's encoding
+    context_budget=3000,
+    history_budget=1500,
+)
+
 
 # Initialize LanceDB connection
 @st.cache_resource
@@ -18,77 +60,170 @@ def init_db():
     Returns:
         LanceDB table object
     """
-    db = lancedb.connect("data/lancedb")
-    return db.open_table("docling")
+    return open_table()
 
 
-def get_context(query: str, table, num_results: int = 5) -> str:
-    """Search the database for relevant context.
+@st.cache_resource
+def init_corpus():
+    """Open the sharded corpus once, shared across sessions.
+
+    Returns:
+        Corpus that keeps each shard's table open
+    """
+    return Corpus()
 
-    Args:
-        query: User's question
-        table: LanceDB table object
-        num_results: Number of results to return
+
+@st.cache_resource
+def init_cache():
+    """Initialize the on-disk embedding cache shared across sessions.
 
     Returns:
-        str: Concatenated context from relevant chunks with source information
+        EmbeddingCache for the table's embedding model
     """
-    results = table.search(query).limit(num_results).to_pandas()
-    contexts = []
+    return EmbeddingCache()
 
-    for _, row in results.iterrows():
-        # Extract metadata
-        filename = row["metadata"]["filename"]
-        page_numbers = row["metadata"]["page_numbers"]
-        title = row["metadata"]["title"]
 
-        # Build source citation
-        source_parts = []
-        if filename:
-            source_parts.append(filename)
-        if page_numbers:
-            source_parts.append(f"p. {', '.join(str(p) for p in page_numbers)}")
+@st.cache_resource
+def init_semantic_cache():
+    """Initialize the cache of answered questions shared across sessions.
 
-        source = f"\nSource: {' - '.join(source_parts)}"
-        if title:
-            source += f"\nTitle: {title}"
+    Returns:
+        SemanticCache that is invalidated whenever the docling table changes
+    """
+    db = lancedb.connect("data/lancedb")
+    return SemanticCache(db, corpus=init_db(), threshold=0.95)
 
-        contexts.append(f"{row['text']}{source}")
 
-    return "\n\n".join(contexts)
+@st.cache_resource
+def init_event_loop():
+    """Start the event loop the in-process answers run on, shared across sessions.
 
+    Returns:
+        Event loop running in a daemon thread
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+@st.cache_resource
+def init_async_client():
+    """Initialize the OpenAI client the in-process answers stream from.
+
+    Returns:
+        AsyncOpenAI client, used on the loop of init_event_loop
+    """
+    return AsyncOpenAI()
 
-def get_chat_response(messages, context: str) -> str:
-    """Get streaming response from OpenAI API.
+
+@st.cache_resource
+def init_reranker():
+    """Load the cross-encoder once, shared across sessions.
+
+    Returns:
+        Reranker running on CPU
+    """
+    # Imported here so torch is only loaded when reranking is enabled
+    from utils.rerank import Reranker
+
+    # torch's thread count is left alone: it is process-wide and Streamlit runs
+    # every session in this process
+    return Reranker()
+
+
+def get_context(
+    query: str,
+    table,
+    num_results: int = 5,
+    params: SearchParams = SEARCH_PARAMS,
+    hybrid: bool = True,
+    query_vector=None,
+    timings: Optional[Dict[str, float]] = None,
+    rerank: bool = RERANK,
+    shards: Optional[List[str]] = SHARDS,
+) -> List[SearchResult]:
+    """Search the database for relevant context.
 
     Args:
-        messages: Chat history
-        context: Retrieved context from database
+        query: User's question
+        table: LanceDB table object
+        num_results: Number of results to return
+        params: ANN search parameters (nprobes, refine_factor)
+        hybrid: Fuse vector search with full-text (BM25) search when the table
+            has a full-text index
+        query_vector: Embedded query, embedded here if not given
+        timings: Dict that receives the latency of each step in milliseconds
+        rerank: Pick the num_results best of more candidates with a cross-encoder
+        shards: Search only these corpus shards, in parallel, instead of table
 
     Returns:
-        str: Model's response
+        List[SearchResult]: Relevant chunks with their source information
     """
-    system_prompt = f"""You are a helpful assistant that answers questions based on the provided context.
-    Use only the information from the context to answer questions. If you're unsure or the context
-    doesn't contain the relevant information, say so.
-    
-    Context:
-    {context}
+    timings = {} if timings is None else timings
+    # The search and rerank spans of retrieve() nest under this one
+    with span("retrieve", shards=",".join(shards) if shards else None):
+        if query_vector is None:
+            start = time.perf_counter()
+            query_vector = embed_query(query, init_cache(), client)
+            timings["embed_ms"] = (time.perf_counter() - start) * 1000
+
+        reranker = init_reranker() if rerank else None
+        if shards:
+            return init_corpus().search(
+                query,
+                query_vector,
+                shards,
+                num_results,
+                params,
+                hybrid,
+                timings=timings,
+                reranker=reranker,
+            )
+        return retrieve(
+            table,
+            query,
+            query_vector,
+            num_results,
+            params,
+            hybrid,
+            timings=timings,
+            reranker=reranker,
+        )
+
+
+def answer(messages: List[Dict[str, str]]) -> Iterator[Tuple[str, dict]]:
+    """Answer the last message in-process, with the same pipeline as the RAG service.
+
+    Args:
+        messages: Chat history ending with the user's question
+
+    Yields:
+        ("results", ...), ("token", ...) for each piece of the answer, ("done", ...)
     """
 
-    messages_with_context = [{"role": "system", "content": system_prompt}, *messages]
+    def search(prompt: str, query_vector, timings: Dict[str, float]):
+        return get_context(
+            prompt, init_db(), query_vector=query_vector, timings=timings
+        )
 
-    # Create the streaming response
-    stream = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages_with_context,
-        temperature=0.7,
-        stream=True,
+    events = answer_events(
+        messages,
+        search,
+        init_async_client(),
+        init_cache(),
+        packer,
+        # The answer cache follows the docling table, so sharded searches don't use it
+        None if SHARDS else init_semantic_cache(),
     )
+    return iter_sync(events, init_event_loop())
 
-    # Use Streamlit's built-in streaming capability
-    response = st.write_stream(stream)
-    return response
+
+def format_timings(timings: Dict[str, float]) -> str:
+    """Format step latencies as "embed 12.3 ms, vector 4.5 ms, ..."."""
+    return ", ".join(
+        f"{step.removesuffix('_ms').replace('_', ' ')} {ms:.1f} ms"
+        for step, ms in timings.items()
+    )
 
 
 # Initialize Streamlit app
@@ -98,9 +233,6 @@ st.title("📚 Document Q&A")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-# Initialize database connection
-table = init_db()
-
 # Display chat messages
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -115,9 +247,20 @@ if prompt := st.chat_input("Ask a question about the document"):
     # Add user message to chat history
     st.session_state.messages.append({"role": "user", "content": prompt})
 
+    if API_URL:
+        events = iter_events(API_URL, st.session_state.messages, shards=SHARDS)
+    else:
+        events = answer(st.session_state.messages)
+
     # Get relevant context
     with st.status("Searching document...", expanded=False) as status:
-        context = get_context(prompt, table)
+        event, data = next(events)
+        if event == "error":
+            st.error(data["message"])
+            st.stop()
+        results = [SearchResult(**fields) for fields in data["results"]]
+        cache_hit = data["cache_hit"]
+
         st.markdown(
             """
             <style>
@@ -145,27 +288,22 @@ if prompt := st.chat_input("Ask a question about the document"):
             unsafe_allow_html=True,
         )
 
+        if not API_URL:
+            st.caption(f"Embedding cache: {init_cache().stats}")
+        if cache_hit:
+            st.caption(
+                f"Answer cache hit ({cache_hit['similarity']:.1%} similar to "
+                f'"{cache_hit["prompt"]}")'
+            )
         st.write("Found relevant sections:")
-        for chunk in context.split("\n\n"):
-            # Split into text and metadata parts
-            parts = chunk.split("\n")
-            text = parts[0]
-            metadata = {
-                line.split(": ")[0]: line.split(": ")[1]
-                for line in parts[1:]
-                if ": " in line
-            }
-
-            source = metadata.get("Source", "Unknown source")
-            title = metadata.get("Title", "Untitled section")
-
+        for result in results:
             st.markdown(
                 f"""
                 <div class="search-result">
                     <details>
-                        <summary>{source}</summary>
-                        <div class="metadata">Section: {title}</div>
-                        <div style="margin-top: 8px;">{text}</div>
+                        <summary>{result.source or "Unknown source"}</summary>
+                        <div class="metadata">Section: {result.title or "Untitled section"} (score {result.score:.3f})</div>
+                        <div style="margin-top: 8px;">{result.text}</div>
                     </details>
                 </div>
             """,
@@ -173,9 +311,35 @@ if prompt := st.chat_input("Ask a question about the document"):
             )
 
     # Display assistant response first
+    done: Dict = {}
+
+    def tokens() -> Iterator[str]:
+        for event, data in events:
+            if event == "token":
+                # Stream a cached answer so it looks the same as a fresh one
+                yield from replay(data["text"]) if cache_hit else [data["text"]]
+            elif event == "done":
+                done.update(data)
+            elif event == "error":
+                raise RuntimeError(data["message"])
+
     with st.chat_message("assistant"):
-        # Get model response with streaming
-        response = get_chat_response(st.session_state.messages, context)
+        response = st.write_stream(tokens())
+
+    # The answer is complete, so the breakdown covers the whole turn
+    with status:
+        st.caption(f"Turn latency: {format_timings(done['timings'])}")
+        if done["prompt"]:
+            st.caption(
+                f"Prompt: {done['prompt']['context_tokens']} context tokens "
+                f"({done['prompt']['dropped_results']} chunks left out), "
+                f"{done['prompt']['history_tokens']} history tokens "
+                f"({done['prompt']['dropped_messages']} messages left out)"
+            )
 
     # Add assistant response to chat history
     st.session_state.messages.append({"role": "assistant", "content": response})
+
+    # Spans and metrics of this turn (the RAG service exports its own)
+    if not API_URL:
+        telemetry.export()
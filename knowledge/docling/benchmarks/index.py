@@ -0,0 +1,73 @@
+"""Recall-vs-latency benchmark of the ANN index against exact search.
+
+Uses vectors stored in the table as queries and sweeps nprobes/refine_factor.
+Run from knowledge/docling after building an index (python -m utils.index build):
+
+    python -m benchmarks.index [--k 10] [--queries 100]
+"""
+
+import argparse
+import time
+from typing import List
+
+import lancedb
+import numpy as np
+
+from utils.index import INDEX_NAME, SearchParams, vector_search
+
+NPROBES = [1, 5, 10, 20, 50]
+REFINE_FACTORS = [None, 5, 20]
+
+
+def row_ids(query) -> set:
+    return set(query.with_row_id(True).select([]).to_arrow()["_rowid"].to_pylist())
+
+
+def percentile(timings: List[float], p: float) -> float:
+    return float(np.percentile(timings, p)) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uri", default="data/lancedb")
+    parser.add_argument("--table", default="docling")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    table = lancedb.connect(args.uri).open_table(args.table)
+    if table.index_stats(INDEX_NAME) is None:
+        raise SystemExit("No index found, run `python -m utils.index build` first")
+
+    sample = table.search().select(["vector"]).limit(args.queries).to_arrow()
+    queries = sample["vector"].to_numpy(zero_copy_only=False)
+
+    # Ground truth from a brute-force scan
+    exact, exact_timings = [], []
+    for vector in queries:
+        start = time.perf_counter()
+        exact.append(row_ids(table.search(vector).limit(args.k).bypass_vector_index()))
+        exact_timings.append(time.perf_counter() - start)
+
+    print(f"{table.count_rows()} rows, {len(queries)} queries, k={args.k}")
+    print(f"{'exact':<24} recall=1.000 p50={percentile(exact_timings, 50):7.2f}ms")
+
+    for nprobes in NPROBES:
+        for refine_factor in REFINE_FACTORS:
+            params = SearchParams(nprobes=nprobes, refine_factor=refine_factor)
+            recalls, timings = [], []
+            for vector, truth in zip(queries, exact):
+                start = time.perf_counter()
+                found = row_ids(vector_search(table, vector, args.k, params))
+                timings.append(time.perf_counter() - start)
+                recalls.append(len(found & truth) / len(truth))
+
+            label = f"nprobes={nprobes} refine={refine_factor}"
+            print(
+                f"{label:<24} recall={np.mean(recalls):.3f} "
+                f"p50={percentile(timings, 50):7.2f}ms p95={percentile(timings, 95):7.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
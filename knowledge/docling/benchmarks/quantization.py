@@ -0,0 +1,137 @@
+"""Vector size, disk size, search latency and recall@k of the vector storage modes.
+
+Copies the float32 docling table into one table per storage mode (re-encoding
+the stored vectors, no API calls) and searches each with the same queries.
+Recall is measured against an exact float32 search. The vector size counts the
+vector columns each mode stores and reads (sign bits plus int8 codes for
+binary_int8), the disk size the whole table. Uses vectors stored in the
+table as queries, or embeds the questions of a file through the embedding
+cache. Run from knowledge/docling:
+
+    python -m benchmarks.quantization [--modes float16 binary@1024] [--k 10]
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import Iterator, List
+
+import lancedb
+import numpy as np
+import pyarrow as pa
+
+from utils.index import search_vectors
+from utils.quantization import VectorStorage, parse_storage
+from utils.schema import chunks_schema
+
+MODES = [
+    "float32",
+    "float32@1024",
+    "float16",
+    "float16@1024",
+    "binary",
+    "binary@1024",
+    "binary_int8",
+    "binary_int8@1024",
+]
+
+
+def percentile(timings: List[float], p: float) -> float:
+    return float(np.percentile(timings, p)) * 1000
+
+
+def directory_size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def copy_table(source, db, name: str, storage: VectorStorage, batch_size: int = 4096):
+    """Write the source table's rows with vectors encoded as storage."""
+    schema = chunks_schema(storage)
+
+    def batches() -> Iterator[pa.RecordBatch]:
+        for batch in source.to_arrow().to_batches(max_chunksize=batch_size):
+            vectors = batch.column("vector").flatten().to_numpy()
+            columns = dict(zip(batch.schema.names, batch.columns))
+            columns.update(storage.encode(vectors.reshape(batch.num_rows, -1)))
+            yield pa.RecordBatch.from_arrays(
+                [columns[field.name] for field in schema], schema=schema
+            )
+
+    table = db.create_table(name, schema=schema, mode="overwrite")
+    table.add(pa.RecordBatchReader.from_batches(schema, batches()))
+    return table
+
+
+def load_queries(table, args) -> np.ndarray:
+    if not args.questions:
+        sample = table.search().select(["vector"]).limit(args.queries).to_arrow()
+        return sample["vector"].to_numpy(zero_copy_only=False)
+
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    from utils.embedding_cache import EmbeddingCache, embed_query
+
+    load_dotenv()
+    with open(args.questions) as f:
+        questions = [line.strip() for line in f if line.strip()]
+    cache, client = EmbeddingCache(), OpenAI()
+    return [embed_query(question, cache, client) for question in questions]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uri", default="data/lancedb")
+    parser.add_argument("--table", default="docling")
+    parser.add_argument("--out", default="data/lancedb_quantization")
+    parser.add_argument("--modes", nargs="+", default=MODES, help="mode[@dims]")
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--questions", help="file with one question per line")
+    args = parser.parse_args()
+
+    source = lancedb.connect(args.uri).open_table(args.table)
+    if VectorStorage.from_schema(source.schema) != VectorStorage():
+        raise SystemExit("The source table must store full float32 vectors")
+    queries = load_queries(source, args)
+
+    # Ground truth from a brute-force float32 scan
+    exact = [
+        set(
+            source.search(vector)
+            .limit(args.k)
+            .bypass_vector_index()
+            .select(["chunk_id"])
+            .to_arrow()["chunk_id"]
+            .to_pylist()
+        )
+        for vector in queries
+    ]
+
+    db = lancedb.connect(args.out)
+    print(f"{source.count_rows()} rows, {len(queries)} queries, k={args.k}")
+    for mode in args.modes:
+        storage = parse_storage(mode, args.rescore_factor)
+        name = f"{storage.mode}_{storage.dims}"
+        table = copy_table(source, db, name, storage)
+        size = directory_size(Path(args.out) / f"{name}.lance")
+
+        recalls, timings = [], []
+        for vector, truth in zip(queries, exact):
+            start = time.perf_counter()
+            results = search_vectors(table, vector, args.k, columns=["chunk_id"])
+            timings.append(time.perf_counter() - start)
+            found = set(results["chunk_id"].to_pylist())
+            recalls.append(len(found & truth) / len(truth))
+
+        print(
+            f"{str(storage):<18} vector={storage.bytes_per_vector:6d}B "
+            f"size={size / 1024 / 1024:8.1f}MB "
+            f"recall@{args.k}={np.mean(recalls):.3f} "
+            f"p50={percentile(timings, 50):7.2f}ms p95={percentile(timings, 95):7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""End-to-end retrieval quality and latency benchmark driven by a golden Q&A file.
+
+Converts the golden file's sources into the benchmark's own docstore, chunks
+and embeds them into a fresh table (like 3-embedding.py), then retrieves
+for every question with the same retrieve() as get_context in 5-chat.py.
+Embeddings come from a deterministic local stand-in by default, so runs are
+offline and repeatable. Writes a JSON report to diff between commits. Run from
+knowledge/docling:
+
+    python -m benchmarks.rag [--golden benchmarks/golden.jsonl] [--max-tokens 512]
+        [--k 5] [--dedup] [--embedding hash|openai] [--out report.json]
+
+Each line of the golden file is a JSON object with a "question", the "source"
+that answers it, and "contains": terms of which a relevant chunk contains at
+least one as whole words (case-insensitive, any whitespace between words). Pick
+terms specific to the answer: a term found in most chunks makes recall
+meaningless. Optional "pages" also require a page overlap.
+
+Converted sources are kept in --docs across runs, so conversion is reported
+separately and excluded from the ingestion throughput.
+"""
+
+import argparse
+import json
+import re
+import shutil
+import subprocess
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Pattern
+
+import lancedb
+import numpy as np
+from docling.chunking import HybridChunker
+
+from utils.converter import convert
+from utils.dedup import Deduplicator
+from utils.docstore import DocumentStore
+from utils.index import MIN_ROWS_FOR_INDEX, refresh_fts_index, refresh_index
+from utils.incremental import sync_document
+from utils.mock_embeddings import hash_embedding
+from utils.quantization import parse_storage
+from utils.rag import retrieve
+from utils.retrieval import SearchResult
+from utils.schema import chunks_schema
+from utils.tokenizer import ChunkerTokenizer, OpenAITokenizerWrapper
+
+TABLE_NAME = "docling"
+
+
+def load_golden(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@lru_cache(maxsize=None)
+def needle_pattern(needle: str) -> Pattern:
+    """Whole-word, case-insensitive pattern of a term, e.g. "MIT" but not "limit"."""
+    words = r"\s+".join(map(re.escape, needle.split()))
+    return re.compile(rf"(?<!\w){words}(?!\w)", re.IGNORECASE)
+
+
+def is_relevant(result: SearchResult, expected: dict) -> bool:
+    """Whether a result contains one of the expected terms (on the expected pages)."""
+    if not any(
+        needle_pattern(needle).search(result.text) for needle in expected["contains"]
+    ):
+        return False
+    pages = expected.get("pages")
+    return not pages or bool(set(pages) & set(result.pages))
+
+
+def percentiles(timings: List[float]) -> Dict[str, float]:
+    return {
+        f"p{p}": round(float(np.percentile(timings, p)) * 1000, 3) for p in (50, 95, 99)
+    }
+
+
+def directory_size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def embedding_function(name: str) -> Callable[[List[str]], List]:
+    """Batch embedding function: the local hash stand-in or the OpenAI API."""
+    if name == "hash":
+        return lambda texts: [hash_embedding(text) for text in texts]
+
+    from dotenv import load_dotenv
+
+    from utils.embedding_cache import EmbeddingCache
+    from utils.embeddings import BatchEmbedder
+
+    load_dotenv()
+    return BatchEmbedder(cache=EmbeddingCache()).embed
+
+
+def ingest(sources: List[str], table, args, embed) -> dict:
+    """Convert, chunk and embed the sources into table, timing each stage."""
+    chunker = HybridChunker(
+        tokenizer=ChunkerTokenizer(
+            tokenizer=OpenAITokenizerWrapper(), max_tokens=args.max_tokens
+        ),
+        merge_peers=not args.no_merge_peers,
+    )
+    store = DocumentStore(args.docs)
+    dedup = Deduplicator() if args.dedup else None
+    timings = {"chunk": 0.0, "embed": 0.0, "write": 0.0}
+    chunks = duplicates = 0
+    converted: List[str] = []
+
+    def counted_convert(source):
+        converted.append(source)
+        return convert(source)
+
+    def timed_chunks(iterator):
+        iterator = iter(iterator)
+        while True:
+            start = time.perf_counter()
+            chunk = next(iterator, None)
+            timings["chunk"] += time.perf_counter() - start
+            if chunk is None:
+                return
+            yield chunk
+
+    def timed_embed(texts):
+        start = time.perf_counter()
+        vectors = embed(texts)
+        timings["embed"] += time.perf_counter() - start
+        return vectors
+
+    # Whether a source needs converting depends on earlier runs, so conversion
+    # is timed on its own. The benchmark sources are fixed: no revalidation.
+    start = time.perf_counter()
+    documents = [
+        store.get_or_convert(
+            source, counted_convert, refresh=args.reconvert, revalidate=False
+        )
+        for source in sources
+    ]
+    convert_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for source, document in zip(sources, documents):
+        stage = time.perf_counter()
+        doc_hash = store.doc_hash(source)
+        stats = sync_document(
+            table,
+            source,
+            doc_hash,
+            timed_chunks(chunker.chunk(dl_doc=document)),
+            embed=timed_embed,
+            dedup=dedup,
+        )
+        chunks += stats.chunks
+        duplicates += stats.duplicates
+        timings["write"] += time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    if table.count_rows() >= MIN_ROWS_FOR_INDEX:
+        refresh_index(table)
+    refresh_fts_index(table)
+    timings["index"] = time.perf_counter() - stage
+    seconds = time.perf_counter() - start
+
+    # Chunking and embedding run inside the writes
+    timings["write"] -= timings["chunk"] + timings["embed"]
+    return {
+        "convert": {
+            "converted": len(converted),
+            "loaded": len(sources) - len(converted),
+            "seconds": round(convert_seconds, 3),
+        },
+        "documents": len(sources),
+        "chunks": chunks,
+        "duplicates": duplicates,
+        "seconds": round(seconds, 3),
+        "docs_per_sec": round(len(sources) / seconds, 3),
+        "chunks_per_sec": round(chunks / seconds, 3),
+        "stage_seconds": {stage: round(t, 3) for stage, t in timings.items()},
+    }
+
+
+def evaluate(table, golden: List[dict], args, embed) -> dict:
+    """Retrieve for every golden question and score the ranking."""
+    per_question, timings = [], []
+    for expected in golden:
+        vector = embed([expected["question"]])[0]
+        start = time.perf_counter()
+        results = retrieve(
+            table, expected["question"], vector, args.k, hybrid=not args.no_hybrid
+        )
+        timings.append(time.perf_counter() - start)
+
+        rank = next(
+            (i for i, result in enumerate(results, 1) if is_relevant(result, expected)),
+            None,
+        )
+        per_question.append({"question": expected["question"], "rank": rank})
+
+    ranks = [entry["rank"] for entry in per_question]
+    return {
+        "questions": len(golden),
+        "k": args.k,
+        "recall_at_k": round(np.mean([rank is not None for rank in ranks]), 4),
+        "mrr": round(np.mean([1 / rank if rank else 0.0 for rank in ranks]), 4),
+        "latency_ms": percentiles(timings),
+        "per_question": per_question,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--golden", default="benchmarks/golden.jsonl")
+    parser.add_argument("--uri", default="data/benchmark_lancedb")
+    parser.add_argument("--docs", default="data/benchmark_docs", help="docstore")
+    parser.add_argument("--max-tokens", type=int, default=8191)
+    parser.add_argument("--no-merge-peers", action="store_true")
+    parser.add_argument("--k", type=int, default=5, help="num_results per query")
+    parser.add_argument("--no-hybrid", action="store_true")
+    parser.add_argument("--storage", default="float32", help="mode[@dims]")
+    parser.add_argument("--dedup", action="store_true", help="collapse duplicates")
+    parser.add_argument("--embedding", choices=["hash", "openai"], default="hash")
+    parser.add_argument("--reconvert", action="store_true")
+    parser.add_argument("--out", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    golden = load_golden(args.golden)
+    sources = list(dict.fromkeys(entry["source"] for entry in golden))
+    embed = embedding_function(args.embedding)
+
+    # Start from an empty database so every run chunks, embeds and indexes the
+    # same work
+    shutil.rmtree(args.uri, ignore_errors=True)
+    db = lancedb.connect(args.uri)
+    table = db.create_table(
+        TABLE_NAME, schema=chunks_schema(parse_storage(args.storage))
+    )
+
+    report = {
+        "commit": git_commit(),
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "golden",
+                "max_tokens",
+                "no_merge_peers",
+                "k",
+                "no_hybrid",
+                "storage",
+                "dedup",
+                "embedding",
+            )
+        },
+        "ingest": ingest(sources, table, args, embed),
+        "retrieval": evaluate(table, golden, args, embed),
+        "index": {
+            "rows": table.count_rows(),
+            "bytes": directory_size(Path(args.uri) / f"{TABLE_NAME}.lance"),
+        },
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        Path(args.out).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+
+    retrieval = report["retrieval"]
+    print(
+        f"recall@{args.k}={retrieval['recall_at_k']} mrr={retrieval['mrr']} "
+        f"p95={retrieval['latency_ms']['p95']}ms "
+        f"chunks/sec={report['ingest']['chunks_per_sec']}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""End-to-end latency and prompt tokens with and without cross-encoder reranking.
+
+Without reranking, the over-fetched candidates all go into the prompt. With
+reranking, only the top k of them do. Reranking costs retrieval time and saves
+prompt tokens, so each question is also answered with the chat model: the
+report shows retrieval time, time to first token and total time from the
+question to the full answer. Query vectors go through the embedding cache, so
+repeated runs don't call the API for them. Run from knowledge/docling:
+
+    python -m benchmarks.rerank [--candidates 20] [--k 5] [--questions questions.txt]
+        [--no-generate]
+
+With --no-generate only retrieval is timed, without calling the chat model.
+"""
+
+import argparse
+import os
+import time
+from typing import Dict, List
+
+import lancedb
+import numpy as np
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from utils.embedding_cache import EmbeddingCache, embed_query
+from utils.rag import CHAT_MODEL, TEMPERATURE, build_messages, retrieve
+from utils.rerank import Reranker
+from utils.retrieval import join_contexts
+from utils.tokenizer import OpenAITokenizerWrapper
+
+QUESTIONS = [
+    "What is Docling?",
+    "Which models does Docling use for layout analysis?",
+    "How does TableFormer recognize table structure?",
+    "Which input formats are supported?",
+    "How fast is PDF conversion on a CPU?",
+    "What OCR engine can Docling use?",
+    "How is the document exported to Markdown or JSON?",
+    "What license is Docling released under?",
+]
+
+
+def percentile(timings: List[float], p: float) -> float:
+    return float(np.percentile(timings, p)) * 1000
+
+
+def generate(client, question: str, results, timings: Dict[str, List[float]]) -> None:
+    """Stream an answer from the retrieved results, timing first token and total."""
+    start = time.perf_counter()
+    stream = client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=build_messages([{"role": "user", "content": question}], results),
+        temperature=TEMPERATURE,
+        stream=True,
+    )
+    first_token = None
+    for chunk in stream:
+        if first_token is None and chunk.choices and chunk.choices[0].delta.content:
+            first_token = time.perf_counter() - start
+    timings["first_token"].append(
+        time.perf_counter() - start if first_token is None else first_token
+    )
+    timings["generate"].append(time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uri", default="data/lancedb")
+    parser.add_argument("--table", default="docling")
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--questions", help="file with one question per line")
+    parser.add_argument("--no-generate", action="store_true", help="retrieval only")
+    args = parser.parse_args()
+
+    load_dotenv()
+    table = lancedb.connect(args.uri).open_table(args.table)
+    questions = QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    cache = EmbeddingCache()
+    client = OpenAI()
+    vectors = [embed_query(question, cache, client) for question in questions]
+    tokenizer = OpenAITokenizerWrapper("o200k_base")  # gpt-4o-mini's encoding
+    # The benchmark owns its process, so split the cores between the batches
+    reranker = Reranker(torch_threads=max(1, (os.cpu_count() or 1) // 4))
+    reranker.score("warm up", ["warm up"])
+
+    runs = {
+        f"top {args.candidates}": lambda q, v: retrieve(table, q, v, args.candidates),
+        f"rerank {args.candidates} -> {args.k}": lambda q, v: retrieve(
+            table, q, v, args.k, reranker=reranker, candidates=args.candidates
+        ),
+    }
+
+    print(f"{table.count_rows()} rows, {len(questions)} questions")
+    for name, run in runs.items():
+        timings: Dict[str, List[float]] = {
+            "retrieve": [],
+            "first_token": [],
+            "generate": [],
+        }
+        tokens = []
+        for question, vector in zip(questions, vectors):
+            start = time.perf_counter()
+            results = run(question, vector)
+            timings["retrieve"].append(time.perf_counter() - start)
+            tokens.append(tokenizer.count_tokens(join_contexts(results)))
+            if not args.no_generate:
+                generate(client, question, results, timings)
+
+        retrieve_ms = timings["retrieve"]
+        line = (
+            f"{name:<20} retrieve p50={percentile(retrieve_ms, 50):7.1f}ms "
+            f"p95={percentile(retrieve_ms, 95):7.1f}ms "
+            f"prompt tokens={np.mean(tokens):7.0f}"
+        )
+        if not args.no_generate:
+            # From the question to the first token and to the full answer
+            first_token = np.add(retrieve_ms, timings["first_token"]).tolist()
+            total = np.add(retrieve_ms, timings["generate"]).tolist()
+            line += (
+                f" first token p50={percentile(first_token, 50):7.1f}ms "
+                f"p95={percentile(first_token, 95):7.1f}ms "
+                f"total p50={percentile(total, 50):7.1f}ms "
+                f"p95={percentile(total, 95):7.1f}ms"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
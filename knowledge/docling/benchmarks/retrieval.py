@@ -0,0 +1,88 @@
+"""Per-query latency and allocations of the Arrow result path vs. the pandas round-trip.
+
+Uses vectors stored in the table as queries. Run from knowledge/docling:
+
+    python -m benchmarks.retrieval [--queries 100] [--k 5]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import lancedb
+import numpy as np
+
+from utils.index import vector_search
+from utils.retrieval import format_contexts
+
+
+def pandas_context(table, vector, k: int) -> str:
+    """The previous get_context: to_pandas() + iterrows()."""
+    results = vector_search(table, vector, k).to_pandas()
+    contexts = []
+
+    for _, row in results.iterrows():
+        filename = row["metadata"]["filename"]
+        page_numbers = row["metadata"]["page_numbers"]
+        title = row["metadata"]["title"]
+
+        source_parts = []
+        if filename:
+            source_parts.append(filename)
+        if page_numbers is not None and len(page_numbers):
+            source_parts.append(f"p. {', '.join(str(p) for p in page_numbers)}")
+
+        source = f"\nSource: {' - '.join(source_parts)}"
+        if title:
+            source += f"\nTitle: {title}"
+
+        contexts.append(f"{row['text']}{source}")
+
+    return "\n\n".join(contexts)
+
+
+def arrow_context(table, vector, k: int) -> str:
+    """Arrow results projected to text and metadata, formatted with compute kernels."""
+    results = vector_search(table, vector, k).select(["text", "metadata"]).to_arrow()
+    return "\n\n".join(format_contexts(results))
+
+
+def measure(name: str, run, table, queries, k: int) -> str:
+    timings = []
+    for vector in queries:
+        start = time.perf_counter()
+        output = run(table, vector, k)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    for vector in queries:
+        run(table, vector, k)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{name:<8} p50={np.percentile(timings, 50) * 1000:7.2f}ms "
+        f"p95={np.percentile(timings, 95) * 1000:7.2f}ms peak_alloc={peak / 1024:8.0f}KB"
+    )
+    return output
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uri", default="data/lancedb")
+    parser.add_argument("--table", default="docling")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    table = lancedb.connect(args.uri).open_table(args.table)
+    sample = table.search().select(["vector"]).limit(args.queries).to_arrow()
+    queries = sample["vector"].to_numpy(zero_copy_only=False)
+
+    legacy = measure("pandas", pandas_context, table, queries, args.k)
+    arrow = measure("arrow", arrow_context, table, queries, args.k)
+    print(f"identical output: {legacy == arrow}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare the HybridChunker token-counting fast path with the string round-trip wrapper.
+
+Run from knowledge/docling:
+
+    python -m benchmarks.tokenizer [path/to/document.md]
+"""
+
+import sys
+import time
+import tracemalloc
+from typing import Callable, List
+
+from utils.tokenizer import OpenAITokenizerWrapper
+
+REPEATS = 3
+
+
+def load_paragraphs(path: str | None) -> List[str]:
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [p for p in f.read().split("\n\n") if p.strip()]
+
+    # Synthetic stand-in for a large PDF export
+    return [
+        f"Section {i}. Docling converts PDF, DOCX and HTML into a unified document "
+        f"representation with layout analysis, table structure recognition and OCR. "
+        * (1 + i % 5)
+        for i in range(2000)
+    ]
+
+
+def chunker_workload(paragraphs: List[str], count: Callable[[str], int]) -> int:
+    """Mimic HybridChunker: count every item, then re-count growing windows of items."""
+    total = sum(count(p) for p in paragraphs)
+    for start in range(0, len(paragraphs), 20):
+        for end in range(start + 1, min(start + 20, len(paragraphs)) + 1):
+            total += count("\n".join(paragraphs[start:end]))
+    return total
+
+
+def legacy_count(wrapper: OpenAITokenizerWrapper) -> Callable[[str], int]:
+    """The previous wrapper: str tokens, parsed back to ints, vocab rebuilt per call."""
+    encoding = wrapper.tokenizer
+
+    def count(text: str) -> int:
+        tokens = [str(t) for t in encoding.encode(text)]
+        return len([int(t) for t in tokens])
+
+    return count
+
+
+def measure(name: str, run: Callable[[], object]) -> None:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{name:<28} best={min(timings) * 1000:9.1f}ms  peak_alloc={peak / 1024:9.0f}KB"
+    )
+
+
+if __name__ == "__main__":
+    paragraphs = load_paragraphs(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"{len(paragraphs)} paragraphs")
+
+    wrapper = OpenAITokenizerWrapper()
+    legacy = legacy_count(wrapper)
+    vocab_size = wrapper.vocab_size
+
+    measure("legacy tokenize", lambda: chunker_workload(paragraphs, legacy))
+    measure(
+        "legacy get_vocab x10",
+        lambda: [dict(enumerate(range(vocab_size))) for _ in range(10)],
+    )
+
+    def fast():
+        # Fresh wrapper per run so the cache only helps within one document
+        fast_wrapper = OpenAITokenizerWrapper()
+        fast_wrapper.count_tokens_batch(paragraphs)
+        return chunker_workload(paragraphs, fast_wrapper.count_tokens)
+
+    measure("fast count_tokens", fast)
+    measure("fast get_vocab x10", lambda: [wrapper.get_vocab() for _ in range(10)])
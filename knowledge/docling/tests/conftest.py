@@ -0,0 +1,27 @@
+import lancedb
+import pytest
+import tiktoken
+
+from utils import tokenizer as tokenizer_module
+from utils.schema import chunks_schema
+from utils.tokenizer import OpenAITokenizerWrapper
+
+
+@pytest.fixture
+def table(tmp_path):
+    """Empty Chunks table with full float32 vectors."""
+    return lancedb.connect(tmp_path).create_table("docling", schema=chunks_schema())
+
+
+@pytest.fixture
+def wrapper(monkeypatch):
+    """OpenAITokenizerWrapper with one token per byte and room for 8 counts."""
+    # A local encoding, so the tests don't download one
+    encoding = tiktoken.Encoding(
+        name="bytes",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+    monkeypatch.setattr(tokenizer_module, "get_encoding", lambda name: encoding)
+    return OpenAITokenizerWrapper(cache_size=8)
@@ -0,0 +1,36 @@
+import pytest
+
+from tests.test_incremental import FOOTER, INTRO, TABLES, chunk, embed, rows
+from utils.incremental import is_unchanged
+
+pytest.importorskip("docling")
+
+from utils.chunking import write_chunks  # noqa: E402
+
+
+def test_write_chunks_only_embeds_changed_chunks(table):
+    embedded = []
+
+    def counting_embed(texts):
+        embedded.extend(texts)
+        return embed(texts)
+
+    write_chunks(
+        table,
+        [chunk(INTRO, "a.pdf", 1), chunk(FOOTER, "a.pdf", 2)],
+        "a",
+        "a1",
+        embed=counting_embed,
+    )
+    stats = write_chunks(
+        table,
+        [chunk(INTRO, "a.pdf", 1), chunk(TABLES, "a.pdf", 3)],
+        "a",
+        "a2",
+        embed=counting_embed,
+    )
+
+    assert (stats.added, stats.deleted, stats.unchanged) == (1, 1, 1)
+    assert embedded == [INTRO, FOOTER, TABLES]
+    assert set(rows(table)) == {INTRO, TABLES}
+    assert is_unchanged(table, "a", "a2")
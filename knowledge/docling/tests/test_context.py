@@ -0,0 +1,73 @@
+from utils.context import MESSAGE_OVERHEAD, ContextPacker
+from utils.retrieval import SearchResult
+
+
+def result(text, score, chunk_id, filename="a.pdf", pages=(1,)):
+    citation = f"\nSource: {filename}"
+    return SearchResult(
+        text, filename, list(pages), None, score, chunk_id, text + citation
+    )
+
+
+CITATION = len("\nSource: a.pdf")
+
+
+def test_results_larger_than_the_budget_are_truncated(wrapper):
+    packer = ContextPacker(wrapper, context_budget=100, min_truncated_tokens=20)
+    long = result("word " * 60, 0.9, "long")
+
+    kept, used = packer.pack_results([result("tiny", 0.1, "tiny", pages=[2]), long])
+
+    # The most relevant result is cut to the budget instead of being dropped
+    assert [r.chunk_id for r in kept] == ["long"]
+    assert used == 100
+    assert kept[0].context == kept[0].text + "\nSource: a.pdf"
+    assert len(kept[0].text) == 100 - CITATION
+
+
+def test_small_remainders_skip_to_results_that_fit(wrapper):
+    packer = ContextPacker(wrapper, context_budget=100, min_truncated_tokens=30)
+    first = result("a" * (75 - CITATION), 0.9, "first")
+    second = result("b" * 40, 0.8, "second", pages=[2])
+    third = result("c", 0.7, "third", pages=[3])
+
+    kept, used = packer.pack_results([first, second, third])
+
+    assert [r.chunk_id for r in kept] == ["first", "third"]
+    assert used == 75 + 1 + CITATION
+
+
+def test_overlapping_results_from_the_same_pages_are_dropped(wrapper):
+    packer = ContextPacker(wrapper, context_budget=1000)
+    text = "Docling converts PDF documents into a structured representation"
+    results = [
+        result(text, 0.9, "best"),
+        result(text + " quickly", 0.8, "repeat"),
+        result(text, 0.7, "other page", pages=[5]),
+    ]
+
+    kept, _ = packer.pack_results(results)
+
+    assert [r.chunk_id for r in kept] == ["best", "other page"]
+
+
+def test_history_is_truncated_and_oldest_messages_dropped(wrapper):
+    packer = ContextPacker(wrapper, history_budget=61, max_message_tokens=10)
+    messages = [
+        {"role": "user", "content": "oldest " * 10},
+        {"role": "assistant", "content": "earlier answer " * 10},
+        {"role": "user", "content": "follow-up"},
+        {"role": "assistant", "content": "recent answer " * 10},
+        {"role": "user", "content": "current question"},
+    ]
+
+    kept, used = packer.pack_history(messages)
+
+    assert kept[-1]["content"] == "current question"
+    assert [message["content"] for message in kept[:-1]] == [
+        "earlier an",
+        "follow-up",
+        "recent ans",
+    ]
+    assert used == len("current question") + 29 + 4 * MESSAGE_OVERHEAD
+    assert used <= packer.history_budget
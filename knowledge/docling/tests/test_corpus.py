@@ -0,0 +1,77 @@
+import numpy as np
+
+from utils.corpus import Corpus
+from utils import corpus as corpus_module
+from utils.index import build_fts_index, has_fts_index
+from utils.schema import func
+
+
+def unit(index, noise=0.0):
+    vector = np.zeros(func.ndims(), dtype=np.float32)
+    vector[index] = 1.0
+    vector[-1] = noise
+    return vector / np.linalg.norm(vector)
+
+
+def row(chunk_id, text, vector):
+    return {
+        "text": text,
+        "vector": vector,
+        "metadata": {"filename": None, "page_numbers": None, "title": None},
+        "source": chunk_id,
+        "doc_hash": chunk_id,
+        "chunk_id": chunk_id,
+        "sources": [chunk_id],
+        "source_hashes": [],
+        "minhash": None,
+    }
+
+
+def test_fan_out_fuses_legs_across_shards(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    hybrid = corpus.table("hybrid", create=True)
+    hybrid.add(
+        [
+            row("a1", "zebra crossing rules", unit(0)),
+            row("a2", "parking rules", unit(1)),
+        ]
+    )
+    build_fts_index(hybrid)
+    corpus.table("vector", create=True).add(
+        [row("b1", "crossing rules", unit(0, noise=0.1)), row("b2", "rules", unit(2))]
+    )
+
+    results = corpus.search("zebra", unit(0), num_results=3)
+    corpus.close()
+
+    # Ranks are fused once across shards, so scores are comparable: a1 is first
+    # in both merged legs, b1 is second by vector distance
+    assert [result.chunk_id for result in results][:2] == ["a1", "b1"]
+    assert results[0].score > results[1].score
+
+
+def test_fts_index_check_is_cached_until_compact(tmp_path, monkeypatch):
+    checks = []
+
+    def counting_has_fts_index(table):
+        checks.append(table.name)
+        return has_fts_index(table)
+
+    monkeypatch.setattr(corpus_module, "has_fts_index", counting_has_fts_index)
+    corpus = Corpus(str(tmp_path), read_consistency_interval=None)
+    for shard in ("a", "b"):
+        corpus.table(shard, create=True).add(
+            [row(f"{shard}1", "zebra crossing rules", unit(0))]
+        )
+
+    for _ in range(3):
+        corpus.search("zebra", unit(0), num_results=2)
+    assert len(checks) == 2
+
+    # compact() builds the missing full-text indexes, so the shards are checked again
+    corpus.compact()
+    results = corpus.search("zebra", unit(0), num_results=2)
+    corpus.close()
+
+    assert len(checks) == 4
+    assert {result.chunk_id for result in results} == {"a1", "b1"}
@@ -0,0 +1,68 @@
+import os
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from docling_core.types.doc import DoclingDocument
+
+from utils import docstore
+from utils.docstore import DocumentStore
+from utils.fetch import Fetcher, HTTPCache
+
+
+def converter(calls):
+    def convert(source):
+        calls.append(source)
+        return DoclingDocument(name=f"v{len(calls)}")
+
+    return convert
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    root = tmp_path / "site"
+    root.mkdir()
+    handler = partial(SimpleHTTPRequestHandler, directory=root)
+    handler.func.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    fetcher = Fetcher(HTTPCache(tmp_path / "http_cache"), max_retries=0)
+    monkeypatch.setattr(docstore, "shared_fetcher", lambda: fetcher)
+    yield root, f"http://127.0.0.1:{server.server_port}"
+    fetcher.close()
+    server.shutdown()
+
+
+def test_remote_source_is_reconverted_only_when_modified(tmp_path, site):
+    root, base_url = site
+    (root / "doc.html").write_text("<p>one</p>")
+    url = f"{base_url}/doc.html"
+    store, calls = DocumentStore(tmp_path / "docs"), []
+
+    assert store.get_or_convert(url, converter(calls)).name == "v1"
+    # The test converter doesn't fetch, so the first check downloads it
+    assert store.get_or_convert(url, converter(calls)).name == "v2"
+    # 304 Not Modified
+    assert store.get_or_convert(url, converter(calls)).name == "v2"
+
+    # Last-Modified has a resolution of seconds
+    (root / "doc.html").write_text("<p>two</p>")
+    stat = (root / "doc.html").stat()
+    os.utime(root / "doc.html", (stat.st_atime, stat.st_mtime + 10))
+    assert store.get_or_convert(url, converter(calls)).name == "v3"
+    assert store.get_or_convert(url, converter(calls), revalidate=False).name == "v3"
+
+
+def test_local_source_is_reconverted_when_modified(tmp_path):
+    source = tmp_path / "doc.md"
+    source.write_text("one")
+    store, calls = DocumentStore(tmp_path / "docs"), []
+
+    store.get_or_convert(str(source), converter(calls))
+    assert store.get_or_convert(str(source), converter(calls)).name == "v1"
+
+    stat = store.file(str(source)).stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert store.get_or_convert(str(source), converter(calls)).name == "v2"
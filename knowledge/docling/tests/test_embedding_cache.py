@@ -0,0 +1,38 @@
+import numpy as np
+
+from utils.embedding_cache import EmbeddingCache
+
+
+def open_cache(path, capacity=2):
+    return EmbeddingCache(path, model="test", dims=3, capacity=capacity)
+
+
+def test_writers_share_slots(tmp_path):
+    # Two handles on the same files stand in for two processes
+    first, second = open_cache(tmp_path), open_cache(tmp_path)
+    first.put_many(["a"], [[1, 1, 1]])
+    second.put_many(["b"], [[2, 2, 2]])
+
+    assert first.get_many(["a", "b"])[0].tolist() == [1, 1, 1]
+    assert first.get_many(["b"])[0].tolist() == [2, 2, 2]
+    assert second.get_many(["a"])[0].tolist() == [1, 1, 1]
+
+
+def test_evicted_slot_is_a_miss(tmp_path):
+    first, second = open_cache(tmp_path), open_cache(tmp_path)
+    first.put_many(["a", "b"], [[1, 1, 1], [2, 2, 2]])
+    assert first.get_many(["b"])[0] is not None
+
+    # "a" is least recently used, so "c" takes its slot
+    second.put_many(["c"], [[3, 3, 3]])
+    assert first.get_many(["a"]) == [None]
+    np.testing.assert_array_equal(first.get_many(["c"])[0], [3, 3, 3])
+
+
+def test_stale_index_never_returns_another_vector(tmp_path):
+    first, second = open_cache(tmp_path), open_cache(tmp_path)
+    first.put_many(["a"], [[1, 1, 1]])
+    first.get_many(["a"])
+    # Overwrite the key behind the index's back, as a crashed writer could
+    second._keys[0] = np.frombuffer(second.key("z"), dtype=np.uint8)
+    assert first.get_many(["a"]) == [None]
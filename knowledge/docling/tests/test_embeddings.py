@@ -0,0 +1,53 @@
+import httpx
+import numpy as np
+import pytest
+
+from utils import embeddings
+from utils.embeddings import BatchEmbedder, _retry_after
+from utils.mock_embeddings import hash_embedding, serve
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    # Four requests per second, anything above gets a 429 with retry-after-ms
+    server = serve(port=0, requests_per_second=4)
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+
+
+def test_embeds_through_the_throttled_mock_server(mock_server, wrapper, monkeypatch):
+    hints = []
+    on_throttle = embeddings.AdaptiveLimiter.on_throttle
+
+    def recording_on_throttle(self, retry_after=None):
+        hints.append(retry_after)
+        on_throttle(self, retry_after)
+
+    monkeypatch.setattr(
+        embeddings.AdaptiveLimiter, "on_throttle", recording_on_throttle
+    )
+    texts = [f"chunk number {i} about Docling" for i in range(32)]
+    embedder = BatchEmbedder(
+        tokenizer=wrapper, max_batch_size=4, concurrency=8, base_url=mock_server
+    )
+
+    vectors = embedder.embed(texts)
+
+    assert len(vectors) == len(texts)
+    assert all(len(vector) == 3072 for vector in vectors)
+    # In input order, although batches finish out of order
+    np.testing.assert_allclose(
+        vectors, [hash_embedding(text) for text in texts], rtol=1e-6
+    )
+    assert embedder.stats.requests == 8
+    assert embedder.stats.throttled > 0
+    # Every 429 paused new requests for the server's retry-after-ms
+    assert hints and set(hints) == {0.2}
+
+
+def test_retry_after_headers():
+    assert _retry_after(httpx.Headers({"retry-after-ms": "250"})) == 0.25
+    assert _retry_after(httpx.Headers({"retry-after": "3"})) == 3.0
+    assert _retry_after(httpx.Headers({"retry-after": "Wed, 21 Oct"})) is None
+    assert _retry_after(httpx.Headers()) is None
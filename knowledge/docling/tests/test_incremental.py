@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from utils.dedup import Deduplicator
+from utils.incremental import (
+    delete_missing_sources,
+    is_unchanged,
+    stored_doc_hash,
+    sync_document,
+)
+from utils.schema import chunks_schema
+
+
+def chunk(text, filename, page):
+    return SimpleNamespace(
+        text=text,
+        meta=SimpleNamespace(
+            doc_items=[SimpleNamespace(prov=[SimpleNamespace(page_no=page)])],
+            origin=SimpleNamespace(filename=filename),
+            headings=None,
+        ),
+    )
+
+
+def embed(texts):
+    return np.ones((len(texts), chunks_schema().field("vector").type.list_size))
+
+
+FOOTER = "Copyright 2024 the Docling authors, all rights reserved worldwide"
+INTRO = "Docling converts PDF documents into a structured representation"
+TABLES = "TableFormer recognizes the structure of tables in the converted pages"
+
+
+def sync(table, dedup, source, doc_hash, *chunks):
+    return sync_document(table, source, doc_hash, chunks, embed=embed, dedup=dedup)
+
+
+def rows(table):
+    return {
+        row["text"]: row for row in table.search().limit(None).to_arrow().to_pylist()
+    }
+
+
+def test_duplicates_release_and_ownership(table):
+    dedup = Deduplicator()
+
+    # Add
+    stats = sync(
+        table, dedup, "a", "a1", chunk(INTRO, "a.pdf", 1), chunk(FOOTER, "a.pdf", 2)
+    )
+    assert (stats.added, stats.duplicates) == (2, 0)
+
+    # Duplicate: b only has the footer a already stored
+    stats = sync(table, dedup, "b", "b1", chunk(FOOTER, "b.pdf", 5))
+    assert (stats.added, stats.duplicates) == (0, 1)
+    assert rows(table)[FOOTER]["sources"] == ["a", "b"]
+    # b owns no row, but its hash is known, so it isn't re-synced every run
+    assert stored_doc_hash(table, "b") == "b1"
+    assert is_unchanged(table, "b", "b1")
+
+    # Release: a drops the footer. The row showed a's citation, so it goes, and
+    # b is synced again to write its own copy.
+    stats = sync(
+        table, dedup, "a", "a2", chunk(INTRO, "a.pdf", 1), chunk(TABLES, "a.pdf", 3)
+    )
+    assert (stats.added, stats.deleted) == (1, 1)
+    assert FOOTER not in rows(table)
+    assert not is_unchanged(table, "b", "b1")
+    assert is_unchanged(table, "a", "a2")
+
+    # Ownership moves to b with b's own citation
+    stats = sync(table, dedup, "b", "b1", chunk(FOOTER, "b.pdf", 5))
+    assert (stats.added, stats.duplicates) == (1, 0)
+    footer = rows(table)[FOOTER]
+    assert (footer["source"], footer["doc_hash"]) == ("b", "b1")
+    assert footer["metadata"]["filename"] == "b.pdf"
+    assert footer["metadata"]["page_numbers"] == [5]
+    assert is_unchanged(table, "b", "b1")
+
+    # a duplicates b's footer again, then b leaves the corpus
+    sync(table, dedup, "a", "a3", chunk(INTRO, "a.pdf", 1), chunk(FOOTER, "a.pdf", 2))
+    assert rows(table)[FOOTER]["sources"] == ["b", "a"]
+    assert delete_missing_sources(table, ["a"]) == 1
+    assert set(rows(table)) == {INTRO}
+    assert not is_unchanged(table, "a", "a3")
+
+    # The next run indexes the table again
+    dedup = Deduplicator.from_table(table)
+    sync(table, dedup, "a", "a3", chunk(INTRO, "a.pdf", 1), chunk(FOOTER, "a.pdf", 2))
+    assert rows(table)[FOOTER]["metadata"]["filename"] == "a.pdf"
+    assert is_unchanged(table, "a", "a3")
+
+
+def test_sync_consumes_chunks_in_windows(table):
+    texts = [f"{INTRO} part {i}" for i in range(5)]
+    pulled, embedded = [], []
+
+    def chunks(texts):
+        for i, text in enumerate(texts):
+            pulled.append(text)
+            yield chunk(text, "a.pdf", i + 1)
+
+    def windowed_embed(texts):
+        embedded.append((len(pulled), list(texts)))
+        return embed(texts)
+
+    stats = sync_document(
+        table, "a", "a1", chunks(texts), embed=windowed_embed, batch_size=2
+    )
+    assert stats.added == 5
+    # Each window is embedded before the next chunks are pulled
+    assert embedded == [(2, texts[:2]), (4, texts[2:4]), (5, texts[4:])]
+
+    # Stale rows are found across windows: only the changed chunk is embedded
+    embedded.clear()
+    changed = texts[:3] + [TABLES] + texts[4:]
+    stats = sync_document(
+        table, "a", "a2", chunks(changed), embed=windowed_embed, batch_size=2
+    )
+    assert (stats.added, stats.deleted, stats.unchanged) == (1, 1, 4)
+    assert [batch for _, batch in embedded] == [[TABLES]]
+    assert set(rows(table)) == set(changed)
+    assert is_unchanged(table, "a", "a2")
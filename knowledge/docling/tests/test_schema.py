@@ -0,0 +1,28 @@
+import lancedb
+import pyarrow as pa
+import pytest
+
+from utils.quantization import VectorStorage
+from utils.schema import chunks_schema, open_chunks_table
+
+
+def test_old_table_needs_a_full_refresh(tmp_path):
+    db = lancedb.connect(tmp_path)
+    old_schema = pa.schema(
+        [field for field in chunks_schema() if field.name != "source_hashes"]
+    )
+    db.create_table("docling", schema=old_schema)
+
+    with pytest.raises(ValueError, match="source_hashes.*FULL_REFRESH"):
+        open_chunks_table(db, "docling")
+
+    table = open_chunks_table(db, "docling", overwrite=True)
+    assert "source_hashes" in table.schema.names
+    assert open_chunks_table(db, "docling").schema == table.schema
+
+
+def test_storage_change_needs_a_full_refresh(tmp_path):
+    db = lancedb.connect(tmp_path)
+    open_chunks_table(db, "docling")
+    with pytest.raises(ValueError, match="float32 vectors, not binary"):
+        open_chunks_table(db, "docling", VectorStorage("binary"))
@@ -0,0 +1,28 @@
+from types import SimpleNamespace
+
+import lancedb
+import numpy as np
+
+from utils.schema import func
+from utils.semantic_cache import SemanticCache, history_key
+
+
+def conversation(*contents):
+    roles = ["user", "assistant"]
+    return [{"role": roles[i % 2], "content": c} for i, c in enumerate(contents)]
+
+
+def test_answers_are_scoped_to_the_conversation(tmp_path):
+    cache = SemanticCache(lancedb.connect(tmp_path), corpus=SimpleNamespace(version=1))
+    vector = np.ones(func.ndims(), dtype=np.float32)
+
+    first = conversation("What is Docling?", "A converter.", "How fast is it?")
+    cache.store(vector, "How fast is it?", "[]", "Fast.", history_key(first))
+
+    # The same follow-up after another question must not reuse the answer
+    other = conversation("What is LanceDB?", "A database.", "How fast is it?")
+    assert cache.lookup(vector, history_key(other)) is None
+    assert cache.lookup(vector, history_key(first)).answer == "Fast."
+
+    # First questions share an empty history
+    assert history_key(conversation("a")) == history_key(conversation("b"))
@@ -0,0 +1,158 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from utils.context import PackedPrompt
+from utils.server import ChatRequest, RAGService, _Broadcast, create_app
+
+
+class EchoService:
+    async def answer(self, request):
+        yield "done", {"question": request.messages[-1].content}
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Shutdown exports telemetry to data/telemetry
+    monkeypatch.chdir(tmp_path)
+    with TestClient(create_app(service=EchoService())) as client:
+        yield client
+
+
+@pytest.mark.parametrize(
+    "messages",
+    [[], [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hi"}]],
+)
+def test_chat_rejects_requests_without_a_question(client, messages):
+    response = client.post("/chat", json={"messages": messages})
+    assert response.status_code == 422
+
+
+def test_chat_streams_events(client):
+    response = client.post(
+        "/chat", json={"messages": [{"role": "user", "content": "What is Docling?"}]}
+    )
+    assert response.status_code == 200
+    assert 'data: {"question": "What is Docling?"}' in response.text
+
+
+class FakeCompletions:
+    def __init__(self, pieces, fail_after=None):
+        self.pieces = pieces
+        self.fail_after = fail_after
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        return self._stream()
+
+    async def _stream(self):
+        for i, text in enumerate(self.pieces):
+            if i == self.fail_after:
+                raise RuntimeError("connection reset")
+            await asyncio.sleep(0.01)
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=text))]
+            )
+
+
+class FakeCache:
+    def get_many(self, texts):
+        return [np.zeros(3, np.float32) for _ in texts]
+
+
+class FakePacker:
+    def pack(self, results, messages):
+        return PackedPrompt(results, messages, 0, 0, 0, 0)
+
+
+class FakeService(RAGService):
+    """RAGService with the OpenAI API, caches and table replaced by fakes."""
+
+    def __init__(self, completions):
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        self.cache = FakeCache()
+        self.packer = FakePacker()
+        self.semantic_cache = None
+        self.reranker = None
+        self._executor = None
+        self._in_flight = {}
+        self._tasks = set()
+        self.coalesced = 0
+
+    def _search(self, request, prompt, vector, timings):
+        return []
+
+
+def question(text="What is Docling?"):
+    return ChatRequest(messages=[{"role": "user", "content": text}])
+
+
+async def collect(service, request):
+    return [event async for event in service.answer(request)]
+
+
+def tokens(events):
+    return [data["text"] for event, data in events if event == "token"]
+
+
+def test_identical_requests_share_one_answer():
+    completions = FakeCompletions(["Docling ", "converts ", "documents."])
+    service = FakeService(completions)
+
+    async def main():
+        return await asyncio.gather(
+            collect(service, question()),
+            collect(service, question()),
+            collect(service, question("Which OCR engine?")),
+        )
+
+    first, second, other = asyncio.run(main())
+    # One upstream call for the identical pair, one for the other question
+    assert completions.calls == 2
+    assert service.coalesced == 1
+    assert tokens(first) == tokens(second) == ["Docling ", "converts ", "documents."]
+    assert [event for event, _ in first] == [event for event, _ in second]
+    assert first[-1][0] == other[-1][0] == "done"
+    assert not service._in_flight
+
+
+def test_broadcast_replays_earlier_events_to_late_subscribers():
+    async def main():
+        broadcast = _Broadcast()
+        await broadcast.publish("results", {"results": []})
+        await broadcast.publish("token", {"text": "Docling"})
+        late = asyncio.create_task(
+            asyncio.wait_for(collect_broadcast(broadcast), timeout=1)
+        )
+        await asyncio.sleep(0)
+        await broadcast.publish("done", {})
+        await broadcast.close()
+        return await late
+
+    async def collect_broadcast(broadcast):
+        return [event async for event, _ in broadcast.subscribe()]
+
+    assert asyncio.run(main()) == ["results", "token", "done"]
+
+
+def test_error_mid_stream_reaches_every_subscriber():
+    completions = FakeCompletions(["Docling ", "converts "], fail_after=1)
+    service = FakeService(completions)
+
+    async def main():
+        return await asyncio.gather(
+            collect(service, question()), collect(service, question())
+        )
+
+    for events in asyncio.run(main()):
+        assert tokens(events) == ["Docling "]
+        assert events[-1] == ("error", {"message": "connection reset"})
+    assert completions.calls == 1
+    assert not service._in_flight
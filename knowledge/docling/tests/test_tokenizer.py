@@ -0,0 +1,13 @@
+def test_count_tokens_batch_survives_eviction(wrapper):
+    cached = [f"cached {i}" for i in range(7)]
+    wrapper.count_tokens_batch(cached)
+
+    # Storing the new counts evicts half of the cached ones mid-call
+    texts = cached + ["new one", "new two", "cached 0"]
+    assert wrapper.count_tokens_batch(texts) == [len(text) for text in texts]
+    assert len(wrapper._counts) <= 8
+
+
+def test_encode_passes_options_through(wrapper):
+    assert wrapper.encode("hello") == list(b"hello")
+    assert len(wrapper.encode("hello world", truncation=True, max_length=3)) == 3
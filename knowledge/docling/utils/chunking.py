@@ -0,0 +1,91 @@
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+
+from docling.chunking import HybridChunker
+from docling_core.transforms.chunker import DocChunk, DocMeta
+
+from utils.incremental import SyncStats, sync_document
+
+
+class StreamingHybridChunker(HybridChunker):
+    """HybridChunker that yields chunks lazily.
+
+    The stock HybridChunker materializes every intermediate chunk list before
+    returning. This variant splits and merges chunk by chunk, so only the
+    current merge window is held in memory.
+    """
+
+    def chunk(self, dl_doc, **kwargs) -> Iterator[DocChunk]:
+        doc_serializer = self.serializer_provider.get_serializer(doc=dl_doc)
+
+        def split() -> Iterator[DocChunk]:
+            for chunk in self._inner_chunker.chunk(dl_doc=dl_doc, **kwargs):
+                for item_chunk in self._split_by_doc_items(
+                    chunk, doc_serializer=doc_serializer
+                ):
+                    yield from self._split_using_plain_text(
+                        item_chunk, doc_serializer=doc_serializer
+                    )
+
+        if self.merge_peers:
+            return self._merge_stream(split())
+        return split()
+
+    def _merge_stream(self, chunks: Iterable[DocChunk]) -> Iterator[DocChunk]:
+        """Merge consecutive chunks with the same headings while they fit in max_tokens."""
+        window: List[DocChunk] = []
+        merged: Optional[DocChunk] = None
+        for chunk in chunks:
+            if window and chunk.meta.headings == window[0].meta.headings:
+                candidate = DocChunk(
+                    text=self.delim.join([c.text for c in window] + [chunk.text]),
+                    meta=DocMeta(
+                        doc_items=[
+                            item for c in [*window, chunk] for item in c.meta.doc_items
+                        ],
+                        headings=window[0].meta.headings,
+                        origin=chunk.meta.origin,
+                    ),
+                )
+                if self._count_chunk_tokens(doc_chunk=candidate) <= self.max_tokens:
+                    window.append(chunk)
+                    merged = candidate
+                    continue
+
+            if merged is not None:
+                yield merged
+            window = [chunk]
+            merged = chunk
+
+        if merged is not None:
+            yield merged
+
+
+def write_chunks(
+    table,
+    chunks: Iterable,
+    source: str,
+    doc_hash: str,
+    batch_size: int = 256,
+    embed: Optional[Callable[[List[str]], Sequence]] = None,
+) -> SyncStats:
+    """Write the chunks of one document to a Chunks table, replacing its previous rows.
+
+    Goes through sync_document: unchanged chunks (by chunk_id) are kept, only
+    new chunks are embedded, and they are added before the outdated rows are
+    removed, so the document is never missing from the table. Chunks are
+    consumed batch_size at a time and new rows are written as one streamed
+    add, so peak memory is bounded by batch_size, not by the document.
+
+    Args:
+        table: LanceDB table with the Chunks schema
+        chunks: Chunks produced by a chunker, consumed lazily
+        source: Identifier of the source document (URL or path)
+        doc_hash: Hash of the source document
+        batch_size: Number of rows per record batch
+        embed: Optional function returning one vector per text of a batch
+            (default: the table's embedding function, also applied per batch)
+
+    Returns:
+        SyncStats with the number of added, deleted and unchanged chunks
+    """
+    return sync_document(table, source, doc_hash, chunks, embed, batch_size)
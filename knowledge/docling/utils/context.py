@@ -0,0 +1,177 @@
+import re
+from dataclasses import dataclass, replace
+from typing import Dict, List, Tuple
+
+from utils.retrieval import SearchResult
+from utils.tokenizer import OpenAITokenizerWrapper
+
+# Tokens the chat format adds around each message
+MESSAGE_OVERHEAD = 4
+
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class PackedPrompt:
+    """Results and chat history that fit the token budgets."""
+
+    results: List[SearchResult]
+    messages: List[Dict[str, str]]
+    context_tokens: int
+    history_tokens: int
+    dropped_results: int
+    dropped_messages: int
+
+
+class ContextPacker:
+    """Fit retrieved chunks and chat history into fixed token budgets.
+
+    The prompt size, and with it time to first token and cost, stays the same
+    however many results are retrieved and however long the chat gets.
+    """
+
+    def __init__(
+        self,
+        tokenizer: OpenAITokenizerWrapper,
+        context_budget: int = 3000,
+        history_budget: int = 1500,
+        max_message_tokens: int = 300,
+        overlap_threshold: float = 0.8,
+        min_truncated_tokens: int = 200,
+    ):
+        """Initialize the packer.
+
+        Args:
+            tokenizer: Tokenizer matching the chat model's encoding
+            context_budget: Tokens available for retrieved chunks
+            history_budget: Tokens available for chat messages, including the
+                current question
+            max_message_tokens: Earlier messages are truncated to this length
+            overlap_threshold: Fraction of the smaller chunk's words found in a
+                higher-ranked chunk from the same pages for it to be a duplicate
+            min_truncated_tokens: A result that doesn't fit is cut down to the
+                remaining budget if at least this many tokens remain
+        """
+        self.tokenizer = tokenizer
+        self.context_budget = context_budget
+        self.history_budget = history_budget
+        self.max_message_tokens = max_message_tokens
+        self.overlap_threshold = overlap_threshold
+        self.min_truncated_tokens = min_truncated_tokens
+
+    def _overlaps(self, a: SearchResult, b: SearchResult, words: Dict) -> bool:
+        if a.filename != b.filename:
+            return False
+        if a.pages and b.pages and not set(a.pages) & set(b.pages):
+            return False
+        words_a, words_b = words[a.chunk_id], words[b.chunk_id]
+        smaller = min(len(words_a), len(words_b))
+        return bool(smaller) and len(words_a & words_b) / smaller >= (
+            self.overlap_threshold
+        )
+
+    def _truncate(self, result: SearchResult, max_tokens: int) -> SearchResult:
+        """Cut a result's text so its context fits max_tokens, keeping the citation."""
+        citation = result.context[len(result.text) :]
+        text_tokens = max_tokens - self.tokenizer.count_tokens(citation)
+        while True:
+            text = self.tokenizer.truncate(result.text, max(text_tokens, 0))
+            count = self.tokenizer.count_tokens(text + citation)
+            # Tokens can merge across the cut, so the sum may be off by one
+            if count <= max_tokens or text_tokens <= 0:
+                return replace(result, text=text, context=text + citation)
+            text_tokens -= count - max_tokens
+
+    def pack_results(
+        self, results: List[SearchResult]
+    ) -> Tuple[List[SearchResult], int]:
+        """Pick the most relevant non-overlapping results that fit the budget.
+
+        A result larger than the remaining budget is truncated to fit, so a long
+        but relevant chunk isn't dropped in favor of less relevant ones. When
+        fewer than min_truncated_tokens remain, it is skipped instead and a
+        smaller result may still fit.
+
+        Args:
+            results: Retrieved results
+
+        Returns:
+            Tuple of the kept results, by descending score, and their token count
+        """
+        ranked = sorted(results, key=lambda result: result.score, reverse=True)
+        counts = self.tokenizer.count_tokens_batch([r.context for r in ranked])
+        words = {r.chunk_id: set(_WORD.findall(r.text.lower())) for r in ranked}
+
+        kept: List[SearchResult] = []
+        used = 0
+        for result, count in zip(ranked, counts):
+            remaining = self.context_budget - used
+            if count > remaining and remaining < self.min_truncated_tokens:
+                continue  # A smaller, less relevant chunk may still fit
+            if any(self._overlaps(result, other, words) for other in kept):
+                continue
+            if count > remaining:
+                result = self._truncate(result, remaining)
+                count = self.tokenizer.count_tokens(result.context)
+            kept.append(result)
+            used += count
+        return kept, used
+
+    def pack_history(
+        self, messages: List[Dict[str, str]]
+    ) -> Tuple[List[Dict[str, str]], int]:
+        """Keep the most recent messages that fit the budget.
+
+        The last message (the current question) is always kept. Earlier ones are
+        truncated to max_message_tokens and dropped oldest first.
+
+        Args:
+            messages: Chat history, oldest first
+
+        Returns:
+            Tuple of the kept messages, oldest first, and their token count
+        """
+        if not messages:
+            return [], 0
+
+        *earlier, current = messages
+        content = self.tokenizer.truncate(
+            current["content"], self.history_budget - MESSAGE_OVERHEAD
+        )
+        kept = [{**current, "content": content}]
+        used = self.tokenizer.count_tokens(content) + MESSAGE_OVERHEAD
+
+        for message in reversed(earlier):
+            content = self.tokenizer.truncate(
+                message["content"], self.max_message_tokens
+            )
+            count = self.tokenizer.count_tokens(content) + MESSAGE_OVERHEAD
+            # Stop at the first message that doesn't fit, so no turn is skipped
+            if used + count > self.history_budget:
+                break
+            kept.append({**message, "content": content})
+            used += count
+        return kept[::-1], used
+
+    def pack(
+        self, results: List[SearchResult], messages: List[Dict[str, str]]
+    ) -> PackedPrompt:
+        """Pack retrieved results and chat history into their budgets.
+
+        Args:
+            results: Retrieved results
+            messages: Chat history ending with the current question
+
+        Returns:
+            PackedPrompt with what goes into the request
+        """
+        kept_results, context_tokens = self.pack_results(results)
+        kept_messages, history_tokens = self.pack_history(messages)
+        return PackedPrompt(
+            results=kept_results,
+            messages=kept_messages,
+            context_tokens=context_tokens,
+            history_tokens=history_tokens,
+            dropped_results=len(results) - len(kept_results),
+            dropped_messages=len(messages) - len(kept_messages),
+        )
@@ -0,0 +1,365 @@
+"""Converter factory, model artifact cache and a long-lived converter daemon.
+
+Building a DocumentConverter and loading its models takes seconds, which
+dominates short batch jobs. The daemon pays that once and serves conversions
+over a local Unix socket; scripts call convert(), which uses the daemon when
+it's running and falls back to converting in-process. Run from knowledge/docling:
+
+    python -m utils.converter serve               # start the daemon
+    python -m utils.converter convert <source>    # report first-document latency
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import pypdfium2
+from docling_core.types.doc import DoclingDocument
+from docling_core.types.io import DocumentStream
+
+from utils.fetch import shared_fetcher
+from utils.telemetry import span, telemetry
+
+ARTIFACTS_PATH = Path("data/models")
+SOCKET_PATH = "data/converter.sock"
+
+# Average characters per page below which a PDF is treated as scanned
+MIN_CHARS_PER_PAGE = 32
+
+_HEADER = struct.Struct(">Q")
+
+
+@dataclass
+class ConverterStats:
+    """Startup and first-document latency of a ConverterFactory."""
+
+    artifacts_seconds: float = 0.0
+    init_seconds: Dict[str, float] = field(default_factory=dict)
+    first_document_seconds: Optional[float] = None
+    documents: int = 0
+
+    def __str__(self) -> str:
+        init = ", ".join(f"{k} {v:.2f}s" for k, v in self.init_seconds.items())
+        first = (
+            f"{self.first_document_seconds:.2f}s"
+            if self.first_document_seconds is not None
+            else "-"
+        )
+        return (
+            f"artifacts={self.artifacts_seconds:.2f}s init=[{init}] "
+            f"first_document={first} documents={self.documents}"
+        )
+
+
+def _pdf_bytes(source: str | Path | DocumentStream) -> Optional[bytes]:
+    """Contents of the source if it's a PDF, checked by magic bytes."""
+    if isinstance(source, DocumentStream):
+        data = source.stream.getvalue()
+    else:
+        with open(source, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                return None
+            f.seek(0)
+            data = f.read()
+    return data if data[:5] == b"%PDF-" else None
+
+
+def needs_ocr(pdf: bytes | str | Path, sample_pages: int = 3) -> bool:
+    """Whether a PDF lacks a usable text layer (e.g. a scan).
+
+    Args:
+        pdf: Contents or path of the PDF
+        sample_pages: Number of leading pages to inspect
+
+    Returns:
+        True if the sampled pages average fewer than MIN_CHARS_PER_PAGE characters
+    """
+    document = pypdfium2.PdfDocument(pdf if isinstance(pdf, bytes) else str(pdf))
+    try:
+        pages = min(len(document), sample_pages)
+        chars = sum(
+            len(document[i].get_textpage().get_text_range().strip())
+            for i in range(pages)
+        )
+    finally:
+        document.close()
+    return pages > 0 and chars / pages < MIN_CHARS_PER_PAGE
+
+
+def ensure_artifacts(path: str | Path = ARTIFACTS_PATH) -> Path:
+    """Download docling's models to path once, so later runs load them from disk.
+
+    Args:
+        path: Artifact cache directory
+
+    Returns:
+        The artifact directory
+    """
+    path = Path(path)
+    marker = path / ".complete"
+    if not marker.exists():
+        from docling.utils.model_downloader import download_models
+
+        download_models(output_dir=path, progress=False, with_easyocr=True)
+        marker.touch()
+    return path
+
+
+class ConverterFactory:
+    """Builds DocumentConverters on first use, one per pipeline profile.
+
+    PDFs with a text layer get a converter without OCR, so the OCR models are
+    only loaded once a scanned PDF shows up. Other formats don't load any models.
+    """
+
+    def __init__(
+        self,
+        artifacts_path: Optional[str | Path] = ARTIFACTS_PATH,
+        tables: bool = True,
+    ):
+        """Initialize the factory without loading anything yet.
+
+        Args:
+            artifacts_path: Model cache directory, None to use docling's default
+                download location
+            tables: Run table structure recognition on PDFs
+        """
+        self.artifacts_path = artifacts_path
+        self.tables = tables
+        self.stats = ConverterStats()
+        self._converters: Dict[bool, object] = {}
+        self._lock = threading.Lock()
+
+    def get(self, ocr: bool = False):
+        """Return the converter for a profile, building it on first use.
+
+        Args:
+            ocr: Whether the PDF pipeline runs OCR
+
+        Returns:
+            DocumentConverter
+        """
+        with self._lock:
+            if ocr not in self._converters:
+                self._converters[ocr] = self._build(ocr)
+            return self._converters[ocr]
+
+    def _build(self, ocr: bool):
+        from docling.datamodel.base_models import InputFormat
+        from docling.datamodel.pipeline_options import PdfPipelineOptions
+        from docling.document_converter import DocumentConverter, PdfFormatOption
+
+        artifacts_path = None
+        if self.artifacts_path is not None:
+            start = time.perf_counter()
+            artifacts_path = ensure_artifacts(self.artifacts_path)
+            self.stats.artifacts_seconds += time.perf_counter() - start
+
+        options = PdfPipelineOptions(
+            artifacts_path=artifacts_path,
+            do_ocr=ocr,
+            do_table_structure=self.tables,
+        )
+        return DocumentConverter(
+            format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=options)}
+        )
+
+    def warm_up(self, ocr: bool = False) -> None:
+        """Load the PDF pipeline's models now instead of on the first document."""
+        from docling.datamodel.base_models import InputFormat
+
+        profile = "ocr" if ocr else "text"
+        start = time.perf_counter()
+        self.get(ocr).initialize_pipeline(InputFormat.PDF)
+        self.stats.init_seconds[profile] = time.perf_counter() - start
+
+    def convert(
+        self,
+        source: str | Path | DocumentStream,
+        ocr: Optional[bool] = None,
+        **kwargs,
+    ) -> DoclingDocument:
+        """Convert a document with the converter its content needs.
+
+        Args:
+            source: Path, URL or DocumentStream
+            ocr: Whether the document needs OCR (default: checked with needs_ocr).
+                Callers converting one PDF in several page ranges decide it once.
+            kwargs: Passed to DocumentConverter.convert (e.g. page_range)
+
+        Returns:
+            The converted document
+        """
+        start = time.perf_counter()
+        name = source.name if isinstance(source, DocumentStream) else str(source)
+        with span("convert", source=name, documents=1) as convert_span:
+            if urlparse(str(source)).scheme in ("http", "https"):
+                # Fetched once here through the pooled client and HTTP cache, named
+                # the same way docling names URL downloads
+                source = shared_fetcher().fetch(str(source)).to_stream()
+
+            if ocr is None:
+                pdf_bytes = _pdf_bytes(source)
+                ocr = pdf_bytes is not None and needs_ocr(pdf_bytes)
+            document = self.get(ocr).convert(source, **kwargs).document
+            convert_span.set_attribute("ocr", ocr)
+            convert_span.set_attribute("pages", len(document.pages))
+        telemetry.inc("docling_documents_total")
+
+        if self.stats.first_document_seconds is None:
+            self.stats.first_document_seconds = time.perf_counter() - start
+        self.stats.documents += 1
+        return document
+
+
+@lru_cache(maxsize=1)
+def default_factory() -> ConverterFactory:
+    """Factory shared by in-process conversions."""
+    return ConverterFactory()
+
+
+def _write_message(stream, payload: dict) -> None:
+    data = json.dumps(payload).encode("utf-8")
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def _read_message(stream) -> dict:
+    header = stream.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ConnectionError("Connection closed")
+    (size,) = _HEADER.unpack(header)
+    return json.loads(stream.read(size))
+
+
+class _ConvertHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        request = _read_message(self.rfile)
+        start = time.perf_counter()
+        try:
+            # One conversion at a time: the models already use every core
+            with self.server.convert_lock:
+                document = self.server.factory.convert(request["source"])
+            response = {"status": "ok", "document": document.export_to_dict()}
+        except Exception as e:
+            response = {"status": "error", "message": str(e)}
+
+        response["seconds"] = round(time.perf_counter() - start, 3)
+        print(f"{request['source']}: {response['status']} in {response['seconds']}s")
+        _write_message(self.wfile, response)
+
+
+class ConverterDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves conversions from warm converters over a Unix socket."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str = SOCKET_PATH, factory=None):
+        """Bind the socket, replacing a stale one from a previous run.
+
+        Args:
+            socket_path: Path of the Unix socket
+            factory: ConverterFactory to convert with (default: a new one)
+        """
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        Path(socket_path).parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(socket_path, _ConvertHandler)
+        self.factory = factory or ConverterFactory()
+        self.convert_lock = threading.Lock()
+
+
+def convert_remote(
+    source: str | Path, socket_path: str = SOCKET_PATH, timeout: float = 600
+) -> DoclingDocument:
+    """Convert a document with the running daemon.
+
+    Args:
+        source: Path or URL
+        socket_path: Path of the daemon's Unix socket
+        timeout: Seconds to wait for the conversion
+
+    Returns:
+        The converted document
+
+    Raises:
+        FileNotFoundError, ConnectionRefusedError: If no daemon is running
+        RuntimeError: If the conversion failed
+    """
+    # The daemon may run in another directory
+    if urlparse(str(source)).scheme not in ("http", "https"):
+        source = os.path.abspath(source)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        with sock.makefile("rwb") as stream:
+            _write_message(stream, {"source": str(source)})
+            response = _read_message(stream)
+
+    if response["status"] != "ok":
+        raise RuntimeError(f"Converting {source} failed: {response['message']}")
+    return DoclingDocument.model_validate(response["document"])
+
+
+def convert(source: str | Path, socket_path: str = SOCKET_PATH) -> DoclingDocument:
+    """Convert a document with the daemon if it's running, otherwise in-process.
+
+    Args:
+        source: Path or URL
+        socket_path: Path of the daemon's Unix socket
+
+    Returns:
+        The converted document
+    """
+    try:
+        return convert_remote(source, socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return default_factory().convert(source)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Docling converter daemon")
+    parser.add_argument("command", choices=["serve", "convert"])
+    parser.add_argument("source", nargs="?")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--ocr", action="store_true", help="also preload OCR models")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "serve":
+        factory = ConverterFactory()
+        factory.warm_up()
+        if args.ocr:
+            factory.warm_up(ocr=True)
+        with ConverterDaemon(args.socket, factory) as daemon:
+            print(f"Ready on {args.socket} after {time.perf_counter() - start:.2f}s")
+            print(factory.stats)
+            daemon.serve_forever()
+    elif args.source:
+        try:
+            document = convert_remote(args.source, args.socket)
+            mode = "daemon"
+        except (FileNotFoundError, ConnectionRefusedError):
+            document = default_factory().convert(args.source)
+            mode = f"in-process ({default_factory().stats})"
+        print(
+            f"{document.name}: {len(document.pages)} pages, first document in "
+            f"{time.perf_counter() - start:.2f}s via {mode}"
+        )
+    else:
+        parser.error("convert needs a source")
+
+
+if __name__ == "__main__":
+    main()
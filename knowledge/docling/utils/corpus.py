@@ -0,0 +1,376 @@
+"""Corpus sharded into one Chunks table per tenant or collection.
+
+Each shard is its own LanceDB table, so a tenant's queries only scan that
+tenant's vectors and re-ingesting one tenant only rewrites its shard. Searches
+are routed to the requested shards; spanning several shards fans out the
+vector and full-text legs in parallel and fuses the merged legs once. Run from
+knowledge/docling:
+
+    python -m utils.corpus stats
+    python -m utils.corpus compact [--shard acme] [--keep-days 7]
+"""
+
+import argparse
+import contextvars
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+import lancedb
+import pyarrow as pa
+
+from utils.index import (
+    MIN_ROWS_FOR_INDEX,
+    SearchParams,
+    has_fts_index,
+    refresh_fts_index,
+    refresh_index,
+    search_vectors,
+)
+from utils.quantization import VectorStorage
+from utils.rag import SEARCH_PARAMS, retrieve
+from utils.retrieval import (
+    RESULT_COLUMNS,
+    SearchResult,
+    reciprocal_rank_fusion,
+    to_results,
+)
+from utils.schema import open_chunks_table
+from utils.telemetry import span
+
+if TYPE_CHECKING:
+    from utils.rerank import Reranker
+
+# Shard tables are named docling-<shard>, next to the unsharded docling table
+SHARD_PREFIX = "docling-"
+
+SHARD_PATTERN = re.compile(r"[A-Za-z0-9_.]+")
+
+
+def shard_table_name(shard: str) -> str:
+    """Name of the LanceDB table holding a shard.
+
+    Raises:
+        ValueError: If the shard name isn't made of letters, digits, "_" and "."
+    """
+    if not SHARD_PATTERN.fullmatch(shard):
+        raise ValueError(f"Invalid shard name: {shard!r}")
+    return f"{SHARD_PREFIX}{shard}"
+
+
+@dataclass
+class ShardStats:
+    """Size and layout of one shard."""
+
+    shard: str
+    rows: int
+    fragments: int
+    small_fragments: int
+    versions: int
+    indices: int
+    bytes: int
+
+    def __str__(self) -> str:
+        return (
+            f"{self.shard}: rows={self.rows} fragments={self.fragments} "
+            f"(small={self.small_fragments}) versions={self.versions} "
+            f"indices={self.indices} size={self.bytes / 1024 / 1024:.1f}MB"
+        )
+
+
+class Corpus:
+    """Chunks tables sharded by tenant or collection, searched as one corpus."""
+
+    def __init__(
+        self,
+        uri: str = "data/lancedb",
+        storage: VectorStorage = VectorStorage(),
+        max_workers: int = 8,
+        read_consistency_interval: Optional[timedelta] = timedelta(seconds=10),
+    ):
+        """Connect to the database.
+
+        Args:
+            uri: LanceDB database location
+            storage: Vector storage of newly created shards
+            max_workers: Shards searched in parallel
+            read_consistency_interval: How often open shards check for new
+                versions, None to never check
+        """
+        self.db = lancedb.connect(
+            uri, read_consistency_interval=read_consistency_interval
+        )
+        self.storage = storage
+        self.read_consistency_interval = read_consistency_interval
+        self._tables: Dict[str, object] = {}
+        # Shard -> (time.monotonic() of the check, has a full-text index)
+        self._fts: Dict[str, Tuple[float, bool]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def shards(self) -> List[str]:
+        """Names of all shards, sorted."""
+        names, page_token = [], None
+        while True:
+            response = self.db.list_tables(page_token=page_token)
+            names += response.tables
+            page_token = response.page_token
+            if not page_token:
+                break
+        return sorted(
+            name[len(SHARD_PREFIX) :] for name in names if name.startswith(SHARD_PREFIX)
+        )
+
+    def table(self, shard: str, create: bool = False):
+        """Open a shard's table, kept open for later calls.
+
+        Args:
+            shard: Tenant or collection name
+            create: Create the shard if it doesn't exist yet
+
+        Returns:
+            LanceDB table with the Chunks schema
+        """
+        with self._lock:
+            if shard not in self._tables:
+                name = shard_table_name(shard)
+                if create:
+                    table = open_chunks_table(self.db, name, self.storage)
+                else:
+                    table = self.db.open_table(name)
+                self._tables[shard] = table
+            return self._tables[shard]
+
+    def _has_fts_index(self, shard: str) -> bool:
+        """Whether a shard has a full-text index, rechecked as often as its version.
+
+        Listing a table's indices on every query adds up across shards, so the
+        answer is cached. compact() forgets it, and an index built by another
+        process shows up after read_consistency_interval, like new rows.
+        """
+        checked = self._fts.get(shard)
+        now = time.monotonic()
+        interval = self.read_consistency_interval
+        if checked is None or (
+            interval is not None and now - checked[0] >= interval.total_seconds()
+        ):
+            checked = self._fts[shard] = (now, has_fts_index(self.table(shard)))
+        return checked[1]
+
+    def drop(self, shard: str) -> None:
+        """Delete a shard and all of its rows."""
+        with self._lock:
+            self._tables.pop(shard, None)
+            self._fts.pop(shard, None)
+            self.db.drop_table(shard_table_name(shard))
+
+    def search(
+        self,
+        query: str,
+        query_vector,
+        shards: Optional[Sequence[str]] = None,
+        num_results: int = 5,
+        params: SearchParams = SEARCH_PARAMS,
+        hybrid: bool = True,
+        timings: Optional[Dict[str, float]] = None,
+        reranker: Optional["Reranker"] = None,
+        candidates: Optional[int] = None,
+    ) -> List[SearchResult]:
+        """Search the given shards and merge their results.
+
+        A single shard is searched like an unsharded table. Several shards are
+        searched in parallel, each leg separately: the vector results of all
+        shards are merged by distance, the full-text results by BM25 score, and
+        the two merged lists are fused once with RRF. Fused scores of different
+        shards are never compared with each other. With a reranker, the fused
+        candidates are reranked once.
+
+        Args:
+            query: User's question
+            query_vector: Embedded question
+            shards: Shards to search (default: all)
+            num_results: Number of results to return
+            params: ANN search parameters
+            hybrid: Fuse vector and full-text search where a shard has a
+                full-text index
+            timings: Dict that receives the latency of each step in milliseconds
+            reranker: Cross-encoder that picks the num_results best candidates
+            candidates: Results retrieved for reranking (default: 4 * num_results)
+
+        Returns:
+            Relevant chunks from all searched shards, best first
+        """
+        timings = {} if timings is None else timings
+        shards = list(self.shards() if shards is None else shards)
+        if not shards:
+            return []
+        if len(shards) == 1:
+            return retrieve(
+                self.table(shards[0]),
+                query,
+                query_vector,
+                num_results,
+                params,
+                hybrid,
+                timings,
+                reranker,
+                candidates,
+                fts=hybrid and self._has_fts_index(shards[0]),
+            )
+
+        limit = (candidates or 4 * num_results) if reranker else num_results
+        # Like hybrid_search, each leg fetches extra candidates for the fusion
+        leg_limit = 4 * limit if hybrid else limit
+        start = time.perf_counter()
+        # Each shard's search runs in a copy of this context, so its spans nest
+        # under the caller's (see utils/telemetry.py)
+        futures = [
+            self._executor.submit(
+                contextvars.copy_context().run,
+                self._search_legs,
+                shard,
+                query,
+                query_vector,
+                leg_limit,
+                params,
+                hybrid,
+            )
+            for shard in shards
+        ]
+        legs = [future.result() for future in futures]
+        timings["search_ms"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        # Distances of one embedding model are comparable across shards
+        vector_results = _merge(
+            [vector for vector, _ in legs], "_distance", "ascending", leg_limit
+        )
+        fts_legs = [fts for _, fts in legs if fts is not None]
+        if fts_legs:
+            # BM25 statistics are per shard, so this merge is approximate, but
+            # RRF only uses the resulting ranks
+            fts_results = _merge(fts_legs, "_score", "descending", leg_limit)
+            fused = reciprocal_rank_fusion([vector_results, fts_results], limit)
+        else:
+            fused = vector_results.slice(0, limit)
+        merged = to_results(fused)
+        timings["fusion_ms"] = (time.perf_counter() - start) * 1000
+
+        if reranker is None:
+            return merged
+        start = time.perf_counter()
+        reranked = reranker.rerank(query, merged, num_results)
+        timings["rerank_ms"] = (time.perf_counter() - start) * 1000
+        return reranked
+
+    def _search_legs(
+        self,
+        shard: str,
+        query: str,
+        query_vector,
+        limit: int,
+        params: SearchParams,
+        hybrid: bool,
+    ) -> Tuple[pa.Table, Optional[pa.Table]]:
+        """Vector results and, with a full-text index, BM25 results of one shard."""
+        table = self.table(shard)
+        with span("search", shard=shard, limit=limit) as search_span:
+            vector_results = search_vectors(
+                table, query_vector, limit, params, RESULT_COLUMNS
+            )
+            hybrid = hybrid and self._has_fts_index(shard)
+            search_span.set_attribute("hybrid", hybrid)
+            if not hybrid:
+                return vector_results, None
+            fts_results = (
+                table.search(query, query_type="fts")
+                .limit(limit)
+                .select(RESULT_COLUMNS)
+                .to_arrow()
+            )
+        return vector_results, fts_results
+
+    def stats(self, shards: Optional[Sequence[str]] = None) -> List[ShardStats]:
+        """Row counts, fragments, versions and size of each shard."""
+        results = []
+        for shard in self.shards() if shards is None else shards:
+            table = self.table(shard)
+            stats = table.stats()
+            results.append(
+                ShardStats(
+                    shard=shard,
+                    rows=stats["num_rows"],
+                    fragments=stats["fragment_stats"]["num_fragments"],
+                    small_fragments=stats["fragment_stats"]["num_small_fragments"],
+                    versions=len(table.list_versions()),
+                    indices=stats["num_indices"],
+                    bytes=stats["total_bytes"],
+                )
+            )
+        return results
+
+    def compact(
+        self,
+        shards: Optional[Sequence[str]] = None,
+        keep: timedelta = timedelta(days=7),
+    ) -> Dict[str, str]:
+        """Merge small fragments, prune old versions and refresh each shard's indexes.
+
+        Args:
+            shards: Shards to compact (default: all)
+            keep: Versions newer than this stay readable for running queries
+
+        Returns:
+            Index refresh result per shard
+        """
+        results = {}
+        for shard in self.shards() if shards is None else shards:
+            table = self.table(shard)
+            table.optimize(cleanup_older_than=keep)
+            status = "compacted"
+            if table.count_rows() >= MIN_ROWS_FOR_INDEX:
+                status += f", index {refresh_index(table)}"
+            results[shard] = f"{status}, full-text index {refresh_fts_index(table)}"
+            self._fts.pop(shard, None)
+        return results
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+def _merge(results: List[pa.Table], column: str, order: str, limit: int) -> pa.Table:
+    """Concatenate one leg's results of every shard and keep the best rows."""
+    tables = [
+        table.select(RESULT_COLUMNS).append_column(
+            column, table[column].cast(pa.float64())
+        )
+        for table in results
+    ]
+    merged = pa.concat_tables(tables).sort_by([(column, order)])
+    return merged.slice(0, limit)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect and compact corpus shards")
+    parser.add_argument("command", choices=["stats", "compact"])
+    parser.add_argument("--uri", default="data/lancedb")
+    parser.add_argument("--shard", action="append", help="default: all shards")
+    parser.add_argument("--keep-days", type=float, default=7)
+    args = parser.parse_args()
+
+    corpus = Corpus(args.uri)
+    if args.command == "compact":
+        keep = timedelta(days=args.keep_days)
+        for shard, status in corpus.compact(args.shard, keep).items():
+            print(f"{shard}: {status}")
+
+    for stats in corpus.stats(args.shard):
+        print(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Exact and near-duplicate detection of chunks before they are embedded.
+
+Pages of a crawled site share navigation, footers and boilerplate sections, so
+the same chunk comes back from many sources. Every chunk gets a MinHash
+signature of its word shingles; chunks with an identical signature are exact
+duplicates, and locality-sensitive hashing over bands of the signature finds
+candidates whose estimated Jaccard similarity is above a threshold. A duplicate
+is stored once, its row lists every source it appears in (see sync_document).
+"""
+
+import re
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pyarrow as pa
+
+# Signature length: the Jaccard estimate has a standard error of about 0.04
+NUM_PERM = 128
+
+# Words per shingle
+SHINGLE_SIZE = 5
+
+_WORD = re.compile(r"\w+")
+
+# Fixed seed, signatures are stored in the table and compared across runs
+_rng = np.random.default_rng(20240816)
+_A = _rng.integers(1, 2**64, NUM_PERM, dtype=np.uint64, endpoint=False) | np.uint64(1)
+_B = _rng.integers(0, 2**64, NUM_PERM, dtype=np.uint64, endpoint=False)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    """Word n-grams of the lowercased text, ignoring punctuation and whitespace."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature of a text's shingles.
+
+    Each of the NUM_PERM hash functions is a multiply-add-shift hash of the
+    shingle's CRC32, and the signature keeps the minimum of each.
+
+    Returns:
+        uint32 array of length NUM_PERM
+    """
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text)),
+        dtype=np.uint64,
+    )
+    # uint64 arithmetic wraps around, the high 32 bits are the hash
+    values = (hashes[:, None] * _A + _B) >> np.uint64(32)
+    return values.min(axis=0).astype(np.uint32)
+
+
+def minhash_array(signatures: np.ndarray) -> pa.FixedSizeListArray:
+    """Signatures as the fixed-size list column stored in the Chunks table."""
+    return pa.FixedSizeListArray.from_arrays(
+        pa.array(signatures.reshape(-1), pa.uint32()), NUM_PERM
+    )
+
+
+@dataclass
+class DedupStats:
+    """Duplicates found by a Deduplicator."""
+
+    exact: int = 0
+    near: int = 0
+
+    def __str__(self) -> str:
+        return f"exact={self.exact} near={self.near}"
+
+
+class Deduplicator:
+    """MinHash LSH index of the stored chunks, to look up duplicates of new ones.
+
+    The signature is split into bands; two chunks become candidates when all
+    rows of any band agree, which happens with probability 1 - (1 - s^r)^b for
+    Jaccard similarity s. With 16 bands of 8 rows that is ~0.1 at s=0.5 and
+    ~0.98 at s=0.8. Candidates are then checked against the threshold.
+    """
+
+    def __init__(self, threshold: float = 0.8, bands: int = 16):
+        """Create an empty index.
+
+        Args:
+            threshold: Minimum estimated Jaccard similarity of near-duplicates
+            bands: Number of LSH bands, must divide NUM_PERM
+        """
+        if NUM_PERM % bands:
+            raise ValueError(f"bands must divide {NUM_PERM}, got {bands}")
+        self.threshold = threshold
+        self.bands = bands
+        self.stats = DedupStats()
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._exact: Dict[bytes, str] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [
+            defaultdict(set) for _ in range(bands)
+        ]
+
+    @classmethod
+    def from_table(cls, table, **kwargs) -> "Deduplicator":
+        """Index every row of a Chunks table that has a stored signature.
+
+        Args:
+            table: LanceDB table with the Chunks schema
+            kwargs: Passed to Deduplicator
+
+        Raises:
+            ValueError: If the table was created without the minhash column
+        """
+        if "minhash" not in table.schema.names:
+            raise ValueError(
+                "The table has no minhash column, recreate it with FULL_REFRESH"
+            )
+        dedup = cls(**kwargs)
+        rows = (
+            table.search()
+            .where("minhash IS NOT NULL")
+            .select(["chunk_id", "minhash"])
+            .limit(None)
+            .to_arrow()
+        )
+        signatures = (
+            rows["minhash"].combine_chunks().flatten().to_numpy().reshape(-1, NUM_PERM)
+        )
+        for chunk_id, signature in zip(rows["chunk_id"].to_pylist(), signatures):
+            dedup.add(chunk_id, signature)
+        return dedup
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._signatures
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [band.tobytes() for band in signature.reshape(self.bands, -1)]
+
+    def add(self, chunk_id: str, signature: np.ndarray) -> None:
+        """Index a stored chunk."""
+        self._signatures[chunk_id] = signature
+        self._exact.setdefault(signature.tobytes(), chunk_id)
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            bucket[key].add(chunk_id)
+
+    def remove(self, chunk_id: str) -> Optional[np.ndarray]:
+        """Drop a chunk from the index, e.g. after its row was deleted.
+
+        Returns:
+            The chunk's signature, or None if it wasn't indexed
+        """
+        signature = self._signatures.pop(chunk_id, None)
+        if signature is None:
+            return None
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            bucket[key].discard(chunk_id)
+            if not bucket[key]:
+                del bucket[key]
+
+        exact_key = signature.tobytes()
+        if self._exact.get(exact_key) == chunk_id:
+            del self._exact[exact_key]
+            # Another stored chunk may have the same signature
+            for other_id in self._candidates(signature):
+                if self._signatures[other_id].tobytes() == exact_key:
+                    self._exact[exact_key] = other_id
+                    break
+        return signature
+
+    def _candidates(self, signature: np.ndarray) -> Set[str]:
+        candidates: Set[str] = set()
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            candidates |= bucket.get(key, set())
+        return candidates
+
+    def find(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        """Look up the stored chunk a new chunk duplicates.
+
+        Args:
+            signature: MinHash signature of the new chunk
+
+        Returns:
+            chunk_id and estimated similarity of the most similar stored chunk
+            at or above the threshold, or None if the chunk is new
+        """
+        chunk_id = self._exact.get(signature.tobytes())
+        if chunk_id is not None:
+            self.stats.exact += 1
+            return chunk_id, 1.0
+
+        best: Optional[Tuple[str, float]] = None
+        for candidate in self._candidates(signature):
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = candidate, similarity
+        if best is not None:
+            self.stats.near += 1
+        return best
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """MinHash signatures of texts, one row per text."""
+        if not texts:
+            return np.empty((0, NUM_PERM), np.uint32)
+        return np.stack([minhash(text) for text in texts])
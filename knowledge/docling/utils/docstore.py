@@ -0,0 +1,219 @@
+"""Binary store of converted DoclingDocuments, keyed by source.
+
+Converting a PDF takes seconds per page, loading it back takes milliseconds.
+Documents are stored as msgpack behind a small header, so chunking experiments (different max_tokens, merge_peers, ...) run over the whole corpus
+without reconverting anything. Run from knowledge/docling:
+
+    python -m utils.docstore stats
+    python -m utils.docstore rechunk --max-tokens 512
+"""
+
+import argparse
+import os
+import time
+from hashlib import sha256
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple, Optional
+from urllib.parse import urlparse
+
+import httpx
+import msgpack
+from docling_core.types.doc import DoclingDocument
+
+from utils.fetch import shared_fetcher
+from utils.incremental import hash_document
+
+DOCSTORE_PATH = "data/docs"
+SUFFIX = ".msgpack"
+
+# Bytes read to decode the header, which holds the source and content hash
+HEADER_READ_SIZE = 4096
+
+
+class StoredDocument(NamedTuple):
+    source: str
+    doc_hash: str
+    document: DoclingDocument
+
+
+def source_key(source: str) -> str:
+    """Stable filename-safe key for a source URL or path."""
+    return sha256(source.encode("utf-8")).hexdigest()[:32]
+
+
+class DocumentStore:
+    """Directory of msgpack files, one per source.
+
+    Each file holds a small header (source and content hash) followed by the
+    document, so the header can be read without decoding the document.
+    """
+
+    def __init__(self, path: str | Path = DOCSTORE_PATH):
+        """Open (or create) the store.
+
+        Args:
+            path: Directory for the document files
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def file(self, source: str) -> Path:
+        """Path of the file holding a source's document."""
+        return self.path / f"{source_key(source)}{SUFFIX}"
+
+    def __contains__(self, source: str) -> bool:
+        return self.file(source).exists()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.path.glob(f"*{SUFFIX}"))
+
+    def put(
+        self, source: str, document: DoclingDocument, doc_hash: Optional[str] = None
+    ) -> Path:
+        """Store a document, replacing any previous version atomically.
+
+        Args:
+            source: URL or path the document was converted from
+            document: The converted document
+            doc_hash: Content hash, computed if not given
+
+        Returns:
+            Path of the written file
+        """
+        header = {"source": source, "doc_hash": doc_hash or hash_document(document)}
+        path = self.file(source)
+        tmp_path = path.with_suffix(f"{SUFFIX}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            packer = msgpack.Packer(use_bin_type=True)
+            f.write(packer.pack(header))
+            f.write(packer.pack(document.export_to_dict(mode="json")))
+        os.replace(tmp_path, path)
+        return path
+
+    def _read(self, path: Path, with_document: bool = True) -> StoredDocument:
+        with open(path, "rb") as f:
+            # The header is decoded from the first block only, so hash lookups
+            # don't read the document
+            unpacker = msgpack.Unpacker(f, raw=False, read_size=HEADER_READ_SIZE)
+            header = unpacker.unpack()
+            document = None
+            if with_document:
+                # The body is read in one go and decoded in full anyway
+                f.seek(unpacker.tell())
+                body = msgpack.unpackb(f.read(), raw=False)
+                document = DoclingDocument.model_validate(body)
+        return StoredDocument(header["source"], header["doc_hash"], document)
+
+    def get(self, source: str) -> Optional[DoclingDocument]:
+        """Load a source's document, or None if it isn't stored."""
+        path = self.file(source)
+        if not path.exists():
+            return None
+        return self._read(path).document
+
+    def doc_hash(self, source: str) -> Optional[str]:
+        """Content hash of a stored document, read without decoding the document."""
+        path = self.file(source)
+        if not path.exists():
+            return None
+        return self._read(path, with_document=False).doc_hash
+
+    def is_current(self, source: str) -> bool:
+        """Whether a stored document still matches its source.
+
+        URLs are revalidated with a conditional GET through the shared fetcher:
+        a 304 means the stored document is current, a 200 means the source
+        changed (or wasn't in the HTTP cache yet). Local files are current when
+        they weren't modified after the document was stored.
+
+        Raises:
+            httpx.HTTPStatusError: If the source is gone or keeps failing
+        """
+        path = self.file(source)
+        if not path.exists():
+            return False
+        if urlparse(source).scheme not in ("http", "https"):
+            return os.stat(source).st_mtime_ns <= path.stat().st_mtime_ns
+        try:
+            return shared_fetcher().fetch(source).not_modified
+        except httpx.TransportError:
+            # Offline: the stored document is the best we have
+            return True
+
+    def get_or_convert(
+        self,
+        source: str,
+        convert: Callable[[str], DoclingDocument],
+        refresh: bool = False,
+        revalidate: bool = True,
+    ) -> DoclingDocument:
+        """Load a stored document, converting and storing it on a miss.
+
+        Args:
+            source: URL or path
+            convert: Function converting a source into a DoclingDocument
+            refresh: Reconvert even if the document is stored
+            revalidate: Reconvert when the source changed since it was stored
+                (see is_current), otherwise trust the store
+
+        Returns:
+            The document
+        """
+        stale = refresh or (revalidate and not self.is_current(source))
+        document = None if stale else self.get(source)
+        if document is None:
+            document = convert(source)
+            self.put(source, document)
+        return document
+
+    def __iter__(self) -> Iterator[StoredDocument]:
+        """Lazily load every stored document, one at a time."""
+        for path in sorted(self.path.glob(f"*{SUFFIX}")):
+            yield self._read(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect and re-chunk the docstore")
+    parser.add_argument("command", choices=["stats", "rechunk"])
+    parser.add_argument("--path", default=DOCSTORE_PATH)
+    parser.add_argument("--max-tokens", type=int, default=8191)
+    parser.add_argument("--no-merge-peers", action="store_true")
+    args = parser.parse_args()
+
+    store = DocumentStore(args.path)
+    if args.command == "stats":
+        files = list(store.path.glob(f"*{SUFFIX}"))
+        size = sum(path.stat().st_size for path in files)
+        print(f"{len(files)} documents, {size / 1024 / 1024:.1f} MB")
+        return
+
+    from utils.chunking import StreamingHybridChunker
+    from utils.tokenizer import ChunkerTokenizer, OpenAITokenizerWrapper
+
+    chunker = StreamingHybridChunker(
+        tokenizer=ChunkerTokenizer(
+            tokenizer=OpenAITokenizerWrapper(), max_tokens=args.max_tokens
+        ),
+        merge_peers=not args.no_merge_peers,
+    )
+
+    documents = chunks = 0
+    chunk_seconds = 0.0
+    start = time.perf_counter()
+    for stored in store:
+        loaded = time.perf_counter()
+        chunks += sum(1 for _ in chunker.chunk(dl_doc=stored.document))
+        chunk_seconds += time.perf_counter() - loaded
+        documents += 1
+    load_seconds = time.perf_counter() - start - chunk_seconds
+
+    print(
+        f"{documents} documents -> {chunks} chunks "
+        f"(max_tokens={args.max_tokens}, merge_peers={not args.no_merge_peers}) "
+        f"in {time.perf_counter() - start:.1f}s: load {load_seconds:.1f}s, "
+        f"chunk {chunk_seconds:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import asyncio
+import threading
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from hashlib import blake2b
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+from utils.schema import EMBEDDING_MODEL, func
+
+KEY_SIZE = 16
+
+# Slots of the shared header file
+_GENERATION, _TICK = 0, 1
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters of an EmbeddingCache."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"hits={self.hits} misses={self.misses} evictions={self.evictions} "
+            f"hit_ratio={self.hit_ratio:.1%}"
+        )
+
+
+class EmbeddingCache:
+    """Persistent, content-addressed embedding cache backed by memory-mapped files.
+
+    Vectors are stored in a fixed-capacity float32 memmap keyed by a hash of
+    (model, text). When the cache is full, the least recently used entries are
+    overwritten.
+
+    Safe to share between threads and, on POSIX, between processes: every
+    lookup and store holds an exclusive lock on the cache's lock file, and the
+    in-memory slot index is rebuilt whenever another process has changed which
+    keys are stored. Every read also checks the slot's key, so a stale index
+    yields a miss, never another text's vector.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = "data/embedding_cache",
+        model: str = EMBEDDING_MODEL,
+        dims: int = func.ndims(),
+        capacity: int = 100_000,
+    ):
+        """Open (or create) the cache.
+
+        Args:
+            path: Directory for the cache files
+            model: Embedding model the vectors belong to
+            dims: Vector dimensions of the model
+            capacity: Maximum number of cached vectors
+        """
+        self.model = model
+        self.dims = dims
+        self.capacity = capacity
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        prefix = directory / f"{model}-{dims}-{capacity}"
+        self._vectors = self._open(
+            prefix.with_suffix(".vectors"), np.float32, (capacity, dims)
+        )
+        self._keys = self._open(
+            prefix.with_suffix(".keys"), np.uint8, (capacity, KEY_SIZE)
+        )
+        self._used = self._open(prefix.with_suffix(".used"), np.int64, (capacity,))
+        # Generation (bumped whenever a slot changes key) and LRU clock, shared
+        # by every process that opens the cache
+        self._header = self._open(prefix.with_suffix(".header"), np.int64, (2,))
+        self._lock_path = prefix.with_suffix(".lock")
+
+        self._index: Dict[bytes, int] = {}
+        self._free: List[int] = []
+        self._generation = -1
+        with self._locked():
+            if not self._header[_TICK]:
+                self._header[_TICK] = self._used.max(initial=0)
+
+    @contextmanager
+    def _locked(self):
+        """Hold the thread and file locks, with the slot index up to date."""
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self._generation != self._header[_GENERATION]:
+                    self._load_index()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self) -> None:
+        # In-memory index of the occupied slots, rebuilt from the key file
+        occupied = np.flatnonzero(self._used)
+        self._index = {self._keys[slot].tobytes(): int(slot) for slot in occupied}
+        self._free = [int(slot) for slot in np.flatnonzero(self._used == 0)[::-1]]
+        self._generation = int(self._header[_GENERATION])
+
+    def _touch(self, slot: int) -> None:
+        self._header[_TICK] += 1
+        self._used[slot] = self._header[_TICK]
+
+    @staticmethod
+    def _open(path: Path, dtype, shape) -> np.memmap:
+        mode = "r+" if path.exists() else "w+"
+        return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+    def key(self, text: str) -> bytes:
+        """Content address of a text for this cache's model."""
+        hasher = blake2b(digest_size=KEY_SIZE)
+        hasher.update(self.model.encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update(text.encode("utf-8"))
+        return hasher.digest()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Look up cached vectors.
+
+        Args:
+            texts: Texts to look up
+
+        Returns:
+            A vector per text, or None for texts that aren't cached
+        """
+        results: List[Optional[np.ndarray]] = []
+        with self._locked():
+            for text in texts:
+                key = self.key(text)
+                slot = self._index.get(key)
+                if slot is None or self._keys[slot].tobytes() != key:
+                    self.stats.misses += 1
+                    results.append(None)
+                    continue
+                self.stats.hits += 1
+                self._touch(slot)
+                results.append(np.array(self._vectors[slot]))
+        return results
+
+    def put_many(
+        self, texts: Sequence[str], vectors: Sequence[Sequence[float]]
+    ) -> None:
+        """Store vectors, evicting the least recently used entries when full.
+
+        Args:
+            texts: Texts that were embedded
+            vectors: Their vectors, in the same order
+        """
+        with self._locked():
+            changed = False
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                slot = self._index.get(key)
+                if slot is None:
+                    slot = self._allocate()
+                    self._index[key] = slot
+                    self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                    changed = True
+                self._touch(slot)
+                self._vectors[slot] = vector
+            if changed:
+                # Other processes reload their index before their next lookup
+                self._header[_GENERATION] += 1
+                self._generation = int(self._header[_GENERATION])
+            self.flush()
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+
+        slot = int(np.argmin(self._used))
+        self._index.pop(self._keys[slot].tobytes(), None)
+        self.stats.evictions += 1
+        return slot
+
+    def flush(self) -> None:
+        """Write pending changes to disk."""
+        self._vectors.flush()
+        self._keys.flush()
+        self._used.flush()
+        self._header.flush()
+
+    def embed(
+        self,
+        texts: Sequence[str],
+        compute: Callable[[List[str]], Sequence[Sequence[float]]],
+    ) -> List[np.ndarray]:
+        """Return vectors for texts, computing and caching only the misses.
+
+        Args:
+            texts: Texts to embed
+            compute: Function that embeds a list of texts (e.g. an API call)
+
+        Returns:
+            One vector per text, in input order
+        """
+        vectors = self.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Embed each distinct text once, even when it repeats within the batch
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            computed = dict(zip(unique, compute(unique)))
+            self.put_many(unique, [computed[text] for text in unique])
+            for i in missing:
+                vectors[i] = np.asarray(computed[texts[i]], dtype=np.float32)
+        return vectors  # type: ignore[return-value]
+
+
+def embed_query(query: str, cache: EmbeddingCache, client) -> np.ndarray:
+    """Embed a search query through the cache.
+
+    Args:
+        query: The user's query
+        cache: Embedding cache for the table's model
+        client: OpenAI client used on a cache miss
+
+    Returns:
+        The query vector
+    """
+
+    def compute(texts: List[str]) -> List[List[float]]:
+        response = client.embeddings.create(model=cache.model, input=texts)
+        return [item.embedding for item in response.data]
+
+    return cache.embed([query], compute)[0]
+
+
+async def aembed_query(
+    query: str, cache: EmbeddingCache, client, executor: Optional[Executor] = None
+) -> np.ndarray:
+    """Embed a search query through the cache with an async OpenAI client.
+
+    Cache lookups and stores wait for the cache's file lock and flush to disk,
+    so they run in the executor instead of blocking the event loop.
+
+    Args:
+        query: The user's query
+        cache: Embedding cache for the table's model
+        client: AsyncOpenAI client used on a cache miss
+        executor: Executor for the cache calls (default: the loop's default)
+
+    Returns:
+        The query vector
+    """
+    loop = asyncio.get_running_loop()
+    vector = (await loop.run_in_executor(executor, cache.get_many, [query]))[0]
+    if vector is None:
+        response = await client.embeddings.create(model=cache.model, input=[query])
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        await loop.run_in_executor(executor, cache.put_many, [query], [vector])
+    return vector
@@ -0,0 +1,267 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import httpx
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI, RateLimitError
+
+from utils.embedding_cache import EmbeddingCache
+from utils.schema import EMBEDDING_MODEL
+from utils.telemetry import span, telemetry
+from utils.tokenizer import OpenAITokenizerWrapper
+
+# OpenAI limits a single embeddings request to 2048 inputs and 300k tokens
+MAX_BATCH_SIZE = 2048
+MAX_BATCH_TOKENS = 300_000
+
+# Upper bound of the exponential backoff between retries, in seconds
+MAX_BACKOFF = 30
+
+
+def pack_batches(
+    token_counts: Sequence[int],
+    max_batch_tokens: int = MAX_BATCH_TOKENS,
+    max_batch_size: int = MAX_BATCH_SIZE,
+) -> List[List[int]]:
+    """Greedily pack inputs into batches that stay under a token budget.
+
+    Args:
+        token_counts: Number of tokens of every input
+        max_batch_tokens: Token budget per request
+        max_batch_size: Maximum number of inputs per request
+
+    Returns:
+        Batches of input indices, in input order
+    """
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    batch_tokens = 0
+    for i, count in enumerate(token_counts):
+        if batch and (
+            batch_tokens + count > max_batch_tokens or len(batch) >= max_batch_size
+        ):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += count
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that backs off on rate limits (AIMD).
+
+    The limit is halved on every 429 and grows by one after a window of
+    successful requests. A retry-after hint pauses all new requests.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.successes = 0
+        self.resume_at = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        self.successes += 1
+        if self.successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self.successes = 0
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        self.limit = max(self.minimum, self.limit // 2)
+        self.successes = 0
+        if retry_after:
+            self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
+
+
+def _retry_after(headers: httpx.Headers) -> Optional[float]:
+    """Read the server's back-off hint from rate-limit headers, in seconds."""
+    if "retry-after-ms" in headers:
+        return float(headers["retry-after-ms"]) / 1000
+    if "retry-after" in headers:
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            return None
+    return None
+
+
+@dataclass
+class EmbeddingStats:
+    """Counters for an embedding run."""
+
+    requests: int = 0
+    throttled: int = 0
+    tokens: int = 0
+    elapsed: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"requests={self.requests} throttled={self.throttled} "
+            f"tokens={self.tokens} elapsed={self.elapsed:.1f}s"
+        )
+
+
+class BatchEmbedder:
+    """Embeds texts in token-budgeted batches over a pooled async connection."""
+
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        tokenizer: Optional[OpenAITokenizerWrapper] = None,
+        max_batch_tokens: int = 100_000,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        concurrency: int = 4,
+        max_concurrency: int = 16,
+        max_retries: int = 8,
+        base_url: Optional[str] = None,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        """Initialize the embedder.
+
+        Args:
+            model: OpenAI embedding model
+            tokenizer: Tokenizer used to count tokens per input
+            max_batch_tokens: Token budget per request
+            max_batch_size: Maximum number of inputs per request
+            concurrency: Initial number of concurrent requests
+            max_concurrency: Upper bound for the adaptive concurrency
+            max_retries: Retries per batch on rate limits and transient errors
+            base_url: Alternative API endpoint, e.g. a local mock server
+            cache: Embedding cache consulted before calling the API
+        """
+        self.model = model
+        self.tokenizer = OpenAITokenizerWrapper() if tokenizer is None else tokenizer
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_url = base_url
+        self.cache = cache
+        self.stats = EmbeddingStats()
+
+    def _client(self) -> AsyncOpenAI:
+        # Retries are handled here so throttling feeds back into the concurrency limit
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+        return AsyncOpenAI(
+            base_url=self.base_url, max_retries=0, http_client=http_client
+        )
+
+    async def _embed_batch(
+        self, client: AsyncOpenAI, limiter: AdaptiveLimiter, texts: List[str]
+    ) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            start = time.perf_counter()
+            try:
+                with span("embed.request", inputs=len(texts), attempt=attempt):
+                    raw = await client.embeddings.with_raw_response.create(
+                        model=self.model, input=texts
+                    )
+            except RateLimitError as e:
+                self.stats.throttled += 1
+                limiter.on_throttle(
+                    _retry_after(e.response.headers) or min(2**attempt, MAX_BACKOFF)
+                )
+                continue
+            except (APIConnectionError, APIStatusError) as e:
+                if isinstance(e, APIStatusError) and e.status_code < 500:
+                    raise
+                if attempt == self.max_retries:
+                    raise
+                limiter.on_throttle(min(2**attempt, MAX_BACKOFF))
+                continue
+            finally:
+                await limiter.release()
+                telemetry.observe(
+                    "docling_embedding_api_wait_seconds", time.perf_counter() - start
+                )
+
+            # Slow down before we hit the limit when the server says we're close
+            if raw.headers.get("x-ratelimit-remaining-requests") == "0":
+                limiter.on_throttle(_retry_after(raw.headers))
+            else:
+                limiter.on_success()
+
+            response = raw.parse()
+            self.stats.requests += 1
+            self.stats.tokens += response.usage.total_tokens
+            return [
+                item.embedding for item in sorted(response.data, key=lambda d: d.index)
+            ]
+
+        raise RuntimeError(
+            f"Embedding batch still rate limited after {self.max_retries} retries"
+        )
+
+    async def aembed(self, texts: Sequence[str]) -> List[List[float]]:
+        """Embed texts concurrently.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            One vector per text, in input order
+        """
+        start = time.perf_counter()
+        with span("tokenize", texts=len(texts)) as tokenize_span:
+            counts = self.tokenizer.count_tokens_batch(texts)
+            tokenize_span.set_attribute("tokens", sum(counts))
+        telemetry.inc("docling_tokens_total", sum(counts))
+        batches = pack_batches(counts, self.max_batch_tokens, self.max_batch_size)
+        limiter = AdaptiveLimiter(self.concurrency, maximum=self.max_concurrency)
+
+        vectors: List[List[float]] = [[] for _ in texts]
+        async with self._client() as client:
+
+            async def run(batch: List[int]) -> None:
+                embeddings = await self._embed_batch(
+                    client, limiter, [texts[i] for i in batch]
+                )
+                for i, embedding in zip(batch, embeddings):
+                    vectors[i] = embedding
+
+            await asyncio.gather(*(run(batch) for batch in batches))
+
+        self.stats.elapsed += time.perf_counter() - start
+        return vectors
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """Synchronous wrapper around aembed that serves cached texts without API calls.
+
+        Runs aembed with asyncio.run, so it can't be called from inside a
+        running event loop (e.g. an async web handler); await aembed there
+        instead.
+        """
+        with span("embed", texts=len(texts)):
+            if self.cache is None:
+                return asyncio.run(self.aembed(texts))
+            vectors = self.cache.embed(
+                texts, lambda missing: asyncio.run(self.aembed(missing))
+            )
+            return [vector.tolist() for vector in vectors]
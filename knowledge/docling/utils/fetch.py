@@ -0,0 +1,456 @@
+"""Shared HTTP fetch layer with connection pooling and a local HTTP cache.
+
+One httpx.AsyncClient runs on a background event loop, so sitemap threads, the
+crawler and the converter all share its keep-alive connections (HTTP/2 when the
+h2 package is installed). Requests per host are limited, transient failures
+are retried with exponential backoff, and every response body is kept in
+data/http_cache with its ETag and Last-Modified. Fetching a cached URL again
+sends a conditional GET, so re-crawling an unchanged site mostly gets 304s and
+no bodies. Run from knowledge/docling:
+
+    python -m utils.fetch stats
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import io
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from functools import partial
+from hashlib import sha256
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, Optional, Set
+from urllib.parse import urlparse
+
+import httpx
+import msgpack
+from docling_core.types.io import DocumentStream
+from docling_core.utils.file import resolve_remote_filename
+from pydantic import AnyHttpUrl, TypeAdapter
+
+from utils.telemetry import span, telemetry
+
+HTTP_CACHE_PATH = "data/http_cache"
+SUFFIX = ".http"
+
+# Transient statuses worth retrying, everything else fails right away
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+USER_AGENT = "docling-knowledge-crawler"
+
+_http_url = TypeAdapter(AnyHttpUrl)
+
+
+@dataclass
+class CacheEntry:
+    """A cached response: validators from its headers and where its body starts."""
+
+    url: str
+    name: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_type: Optional[str]
+    path: Path
+    offset: int
+
+    def open(self) -> IO[bytes]:
+        """Open the body for reading."""
+        f = open(self.path, "rb")
+        f.seek(self.offset)
+        return f
+
+    def read(self) -> bytes:
+        with self.open() as f:
+            return f.read()
+
+    def to_stream(self) -> DocumentStream:
+        """The body as a DocumentStream, named the way docling names URL downloads."""
+        return DocumentStream(name=self.name, stream=io.BytesIO(self.read()))
+
+
+def read_entry(path: str | Path) -> CacheEntry:
+    """Read a cache file's header without reading its body."""
+    with open(path, "rb") as f:
+        unpacker = msgpack.Unpacker(f, raw=False)
+        header = unpacker.unpack()
+        offset = unpacker.tell()
+    return CacheEntry(**header, path=Path(path), offset=offset)
+
+
+class HTTPCache:
+    """Directory of cached responses, one file per URL.
+
+    Each file holds a small msgpack header (URL, filename and validators)
+    followed by the raw body, so a worker process can open the body directly.
+    """
+
+    def __init__(self, path: str | Path = HTTP_CACHE_PATH):
+        """Open (or create) the cache.
+
+        Args:
+            path: Directory for the cache files
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def file(self, url: str) -> Path:
+        """Path of the file holding a URL's response."""
+        return self.path / f"{sha256(url.encode('utf-8')).hexdigest()[:32]}{SUFFIX}"
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """The cached response for a URL, or None."""
+        path = self.file(url)
+        if not path.exists():
+            return None
+        return read_entry(path)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.path.glob(f"*{SUFFIX}"))
+
+    def size(self) -> int:
+        return sum(file.stat().st_size for file in self.path.glob(f"*{SUFFIX}"))
+
+
+@dataclass
+class FetchResult:
+    """Outcome of fetching one URL."""
+
+    url: str
+    status: int
+    entry: Optional[CacheEntry] = None
+    error: Optional[str] = None
+
+    @property
+    def not_modified(self) -> bool:
+        """Whether the server confirmed the cached body is still current."""
+        return self.status == 304
+
+    def to_stream(self) -> DocumentStream:
+        if self.entry is None:
+            raise ValueError(f"Failed to fetch {self.url}: {self.error}")
+        return self.entry.to_stream()
+
+
+@dataclass
+class FetchStats:
+    """Counters for the requests of a Fetcher."""
+
+    requests: int = 0
+    downloaded: int = 0
+    not_modified: int = 0
+    retries: int = 0
+    failed: int = 0
+    bytes: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"requests={self.requests} downloaded={self.downloaded} "
+            f"not_modified={self.not_modified} retries={self.retries} "
+            f"failed={self.failed} size={self.bytes / 1024 / 1024:.1f}MB"
+        )
+
+
+def _retry_after(headers: httpx.Headers) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Fetcher:
+    """Pooled HTTP client on a background event loop, usable from any thread.
+
+    fetch() blocks the calling thread, submit() returns a Future, and
+    afetch() can be awaited on the fetcher's own loop. Cache reads and writes
+    run in the loop's default executor, so disk I/O never holds up the other
+    requests in flight.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[HTTPCache] = None,
+        max_connections: int = 64,
+        max_per_host: int = 4,
+        max_retries: int = 4,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        timeout: float = 30.0,
+        http2: Optional[bool] = None,
+    ):
+        """Start the event loop and connection pool.
+
+        Args:
+            cache: HTTP cache for bodies and validators (default: data/http_cache)
+            max_connections: Connections kept open across all hosts
+            max_per_host: Concurrent requests to the same host
+            max_retries: Retries of timeouts, connection errors and 408/429/5xx
+            backoff: Delay before the first retry in seconds, doubled every retry
+            max_backoff: Upper bound of a single delay in seconds
+            timeout: Timeout of each request in seconds
+            http2: Use HTTP/2 (default: when the h2 package is installed)
+        """
+        # An empty HTTPCache is falsy (it has __len__)
+        self.cache = HTTPCache() if cache is None else cache
+        self.max_per_host = max_per_host
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = FetchStats()
+        if http2 is None:
+            http2 = importlib.util.find_spec("h2") is not None
+
+        self._hosts: Dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.max_per_host)
+        )
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="fetcher", daemon=True
+        )
+        self._thread.start()
+
+        async def create_client() -> httpx.AsyncClient:
+            return httpx.AsyncClient(
+                http2=http2,
+                follow_redirects=True,
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections,
+                ),
+                headers={"User-Agent": USER_AGENT},
+            )
+
+        self.client = self.submit_coroutine(create_client()).result()
+
+    def __enter__(self) -> "Fetcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def submit_coroutine(self, coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def submit(self, url: str) -> Future:
+        """Fetch a URL on the background loop.
+
+        Returns:
+            Future of the FetchResult, see afetch
+        """
+        return self.submit_coroutine(self.afetch(url))
+
+    def fetch(self, url: str) -> FetchResult:
+        """Fetch a URL, blocking until it's done. See afetch."""
+        return self.submit(url).result()
+
+    async def afetch(self, url: str) -> FetchResult:
+        """Fetch a URL, sending a conditional GET when it's cached.
+
+        Args:
+            url: http(s) URL
+
+        Returns:
+            FetchResult with status 200 and the new body, or 304 and the cached one
+
+        Raises:
+            httpx.HTTPStatusError: For error statuses, after retrying transient ones
+            httpx.TransportError: If the request still fails after max_retries
+        """
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(None, self.cache.get, url)
+        headers = {}
+        if cached and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+        host = self._hosts[urlparse(url).netloc]
+        with span("fetch", source=url) as fetch_span:
+            for attempt in range(self.max_retries + 1):
+                delay = None
+                try:
+                    async with host:
+                        self.stats.requests += 1
+                        result = await self._request(url, headers, cached)
+                    fetch_span.set_attribute("status", result.status)
+                    return result
+                except httpx.HTTPStatusError as e:
+                    if (
+                        e.response.status_code not in RETRY_STATUSES
+                        or attempt == self.max_retries
+                    ):
+                        self.stats.failed += 1
+                        raise
+                    delay = _retry_after(e.response.headers)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        self.stats.failed += 1
+                        raise
+
+                # Exponential backoff with jitter, outside the host's limit
+                self.stats.retries += 1
+                if delay is None:
+                    delay = min(self.max_backoff, self.backoff * 2**attempt)
+                    delay *= 0.5 + random.random()
+                await asyncio.sleep(min(delay, self.max_backoff))
+
+    async def _request(
+        self, url: str, headers: Dict[str, str], cached: Optional[CacheEntry]
+    ) -> FetchResult:
+        async with self.client.stream("GET", url, headers=headers) as response:
+            telemetry.inc(
+                "docling_http_responses_total", code=str(response.status_code)
+            )
+            if response.status_code == 304 and cached:
+                self.stats.not_modified += 1
+                return FetchResult(url, 304, cached)
+            response.raise_for_status()
+
+            # Streamed to a temp file, replaced atomically once complete
+            header = {
+                "url": url,
+                "name": resolve_remote_filename(
+                    http_url=_http_url.validate_python(str(response.url)),
+                    response_headers=response.headers,
+                ),
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "content_type": response.headers.get("content-type"),
+            }
+            path = self.cache.file(url)
+            tmp_path = path.with_suffix(
+                f"{SUFFIX}.{os.getpid()}.{threading.get_ident()}.{id(response)}.tmp"
+            )
+            loop = asyncio.get_running_loop()
+            try:
+                f = await loop.run_in_executor(None, open, tmp_path, "wb")
+                try:
+                    offset = await loop.run_in_executor(
+                        None, f.write, msgpack.packb(header, use_bin_type=True)
+                    )
+                    # Decoded from any Content-Encoding
+                    async for chunk in response.aiter_bytes():
+                        await loop.run_in_executor(None, f.write, chunk)
+                        self.stats.bytes += len(chunk)
+                finally:
+                    await loop.run_in_executor(None, f.close)
+                await loop.run_in_executor(None, os.replace, tmp_path, path)
+            finally:
+                await loop.run_in_executor(
+                    None, partial(tmp_path.unlink, missing_ok=True)
+                )
+
+        self.stats.downloaded += 1
+        return FetchResult(
+            url, response.status_code, CacheEntry(**header, path=path, offset=offset)
+        )
+
+    def map(
+        self, urls: Iterable[str], max_in_flight: int = 64
+    ) -> Iterator[FetchResult]:
+        """Fetch URLs concurrently, yielding results as they complete.
+
+        Failed fetches are yielded with error set instead of raising, so one bad
+        URL doesn't stop a crawl.
+
+        Args:
+            urls: URLs, consumed lazily
+            max_in_flight: Maximum number of fetches queued at once
+
+        Yields:
+            FetchResult for every URL, in completion order
+        """
+        pending: Dict[Future, str] = {}
+        urls = iter(urls)
+
+        def results(done: Set[Future]) -> Iterator[FetchResult]:
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    yield future.result()
+                except (httpx.HTTPError, ValueError) as e:
+                    status = (
+                        e.response.status_code
+                        if isinstance(e, httpx.HTTPStatusError)
+                        else 0
+                    )
+                    # First line only, httpx appends a link to the status docs
+                    error = str(e).splitlines()[0] if str(e) else type(e).__name__
+                    yield FetchResult(url, status, error=error)
+
+        try:
+            for url in urls:
+                if len(pending) >= max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from results(done)
+                pending[self.submit(url)] = url
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from results(done)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self) -> None:
+        """Cancel running fetches, close the connections and stop the event loop."""
+        if self._loop.is_closed():
+            return
+
+        async def shutdown() -> None:
+            tasks = asyncio.all_tasks() - {asyncio.current_task()}
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.client.aclose()
+
+        self.submit_coroutine(shutdown()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_shared: Optional[Fetcher] = None
+_shared_pid: Optional[int] = None
+_shared_lock = threading.Lock()
+
+
+def shared_fetcher() -> Fetcher:
+    """The process-wide Fetcher, created on first use.
+
+    A forked worker process gets its own, since the parent's event loop thread
+    doesn't exist in the child.
+    """
+    global _shared, _shared_pid
+    with _shared_lock:
+        if _shared is None or _shared_pid != os.getpid():
+            _shared, _shared_pid = Fetcher(), os.getpid()
+        return _shared
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect the HTTP cache")
+    parser.add_argument("command", choices=["stats"])
+    parser.add_argument("--path", default=HTTP_CACHE_PATH)
+    args = parser.parse_args()
+
+    cache = HTTPCache(args.path)
+    print(f"responses={len(cache)} size={cache.size() / 1024 / 1024:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
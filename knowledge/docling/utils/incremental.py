@@ -0,0 +1,387 @@
+import json
+import time
+from dataclasses import dataclass
+from hashlib import sha256
+from itertools import chain
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+)
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.quantization import VectorStorage
+from utils.telemetry import STAGE_SECONDS, span, telemetry
+
+if TYPE_CHECKING:
+    from utils.dedup import Deduplicator
+
+
+@dataclass
+class SyncStats:
+    """Row counts for an incremental sync of one document."""
+
+    added: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+
+    @property
+    def chunks(self) -> int:
+        """Number of distinct chunks in the document."""
+        return self.added + self.unchanged + self.duplicates
+
+    def __str__(self) -> str:
+        return (
+            f"added={self.added} deleted={self.deleted} unchanged={self.unchanged} "
+            f"duplicates={self.duplicates}"
+        )
+
+
+def quote_literal(value: str) -> str:
+    """Quote a string literal for a LanceDB SQL filter."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def hash_document(document) -> str:
+    """Content hash of a DoclingDocument.
+
+    Args:
+        document: The converted DoclingDocument
+
+    Returns:
+        Hex digest that only changes when the document content changes
+    """
+    payload = json.dumps(document.export_to_dict(), sort_keys=True, default=str)
+    return sha256(payload.encode("utf-8")).hexdigest()
+
+
+def hash_chunk_fields(
+    text: str,
+    filename: Optional[str],
+    page_numbers: Optional[List[int]],
+    title: Optional[str],
+) -> str:
+    """Content hash of a chunk (text plus metadata).
+
+    Args:
+        text: Text of the chunk
+        filename: File name of the source document
+        page_numbers: Pages the chunk appears on
+        title: First heading of the chunk
+
+    Returns:
+        Hex digest used as the chunk_id column
+    """
+    payload = json.dumps(
+        [
+            text,
+            {"filename": filename, "page_numbers": page_numbers, "title": title},
+        ],
+        sort_keys=True,
+    )
+    return sha256(payload.encode("utf-8")).hexdigest()
+
+
+def source_hash_entry(source: str, doc_hash: str) -> str:
+    """Entry of the source_hashes column recording a source's document hash."""
+    return f"{doc_hash} {source}"
+
+
+def _entries_of(source_hashes: Iterable[Optional[List[str]]], sources) -> Set[str]:
+    """The source_hashes entries of the given sources among rows' lists."""
+    return {
+        entry
+        for entries in source_hashes
+        for entry in entries or ()
+        if entry.split(" ", 1)[1] in sources
+    }
+
+
+def _list_literal(values: Iterable[str]) -> str:
+    return "[" + ", ".join(quote_literal(value) for value in values) + "]"
+
+
+def stored_doc_hash(table, source: str) -> Optional[str]:
+    """Return the document hash stored for a source, or None if it isn't indexed yet.
+
+    A source whose chunks all duplicate other sources' chunks owns no row, so
+    the hash is looked up in the source_hashes of every row listing the source.
+    """
+    rows = (
+        table.search()
+        .where(f"array_has(sources, {quote_literal(source)})")
+        .select(["source_hashes"])
+        .limit(1)
+        .to_list()
+    )
+    for entry in _entries_of((row["source_hashes"] for row in rows), {source}):
+        return entry.split(" ", 1)[0]
+    return None
+
+
+def is_unchanged(table, source: str, doc_hash: str) -> bool:
+    """Check whether a document can be skipped without re-chunking it."""
+    return stored_doc_hash(table, source) == doc_hash
+
+
+def _source_hashes(table, where: str) -> List[Optional[List[str]]]:
+    rows = table.search().where(where).select(["source_hashes"]).limit(None)
+    return rows.to_arrow().column("source_hashes").to_pylist()
+
+
+def invalidate_sources(table, sources: Collection[str]) -> None:
+    """Forget the document hashes of sources, so their next sync isn't skipped."""
+    if not sources:
+        return
+    where = f"array_has_any(sources, {_list_literal(sources)})"
+    entries = _entries_of(_source_hashes(table, where), set(sources))
+    if entries:
+        table.update(
+            where=where,
+            values_sql={
+                "source_hashes": f"array_except(source_hashes, {_list_literal(entries)})"
+            },
+        )
+
+
+def release_sources(table, sources: Collection[str], where: str = "true") -> int:
+    """Remove sources from the sources list of matching rows.
+
+    Rows left without any source are deleted, and so are rows whose owning
+    source (the source column) was removed: their text, citation and chunk_id
+    come from the owner. The other sources still listed on such a row are
+    invalidated, so their next sync writes the chunk again with their own
+    metadata (usually from the embedding cache).
+
+    Args:
+        table: LanceDB table with the Chunks schema
+        sources: Sources to remove
+        where: Filter restricting the rows to release
+
+    Returns:
+        Number of deleted rows
+    """
+    if not sources:
+        return 0
+    match = f"({where}) AND array_has_any(sources, {_list_literal(sources)})"
+    entries = _entries_of(_source_hashes(table, match), set(sources))
+    values = {"sources": f"array_except(sources, {_list_literal(sources)})"}
+    if entries:
+        values["source_hashes"] = (
+            f"array_except(source_hashes, {_list_literal(entries)})"
+        )
+    table.update(where=match, values_sql=values)
+
+    orphaned = "NOT array_has(sources, source)"
+    remaining = (
+        table.search().where(orphaned).select(["sources"]).limit(None).to_arrow()
+    )
+    if not remaining.num_rows:
+        return 0
+    table.delete(orphaned)
+    invalidate_sources(
+        table, set(pc.list_flatten(remaining.column("sources")).to_pylist())
+    )
+    return remaining.num_rows
+
+
+def _chunk_ids_filter(chunk_ids: Iterable[str]) -> str:
+    return (
+        f"chunk_id IN ({', '.join(quote_literal(chunk_id) for chunk_id in chunk_ids)})"
+    )
+
+
+def sync_document(
+    table,
+    source: str,
+    doc_hash: str,
+    chunks: Iterable,
+    embed: Optional[Callable[[List[str]], Sequence]] = None,
+    batch_size: int = 256,
+    dedup: Optional["Deduplicator"] = None,
+) -> SyncStats:
+    """Upsert the chunks of one document, embedding only new or changed chunks.
+
+    Chunks whose content hash is already stored are left untouched, chunks that
+    no longer exist in the document are deleted. With a Deduplicator, a new
+    chunk that duplicates a stored chunk of any source isn't written: the source
+    is added to that row's sources instead. Once everything is written, the
+    document hash is recorded in the source_hashes of every row listing the
+    source, which is what is_unchanged checks.
+
+    Chunks are consumed lazily, batch_size at a time: each window is hashed,
+    its new chunks are embedded and streamed into a single table.add, and only
+    the chunk_ids seen so far are kept to find the stale rows at the end. Peak
+    memory is bounded by batch_size, not by the size of the document.
+
+    Args:
+        table: LanceDB table with the Chunks schema
+        source: Identifier of the source document (URL or path)
+        doc_hash: Hash of the current document content
+        chunks: Chunks produced by a chunker, e.g. StreamingHybridChunker.chunk
+        embed: Optional function returning one vector per text of the new rows
+            (default: the table's embedding function)
+        batch_size: Number of chunks per window and rows per record batch
+        dedup: Index of the table's chunks, updated with the written rows
+
+    Returns:
+        SyncStats with the number of added, deleted, unchanged and duplicate chunks
+
+    Raises:
+        ValueError: If the table stores reduced or quantized vectors and embed
+            isn't given
+    """
+    from utils.schema import ChunkColumns  # utils.schema imports this module
+
+    schema = table.schema
+    if embed is None:
+        if VectorStorage.from_schema(schema) != VectorStorage():
+            raise ValueError("Tables with reduced or quantized vectors need embed")
+        schema = pa.schema([field for field in schema if field.name != "vector"])
+
+    owner_filter = f"source = {quote_literal(source)}"
+    source_filter = f"array_has(sources, {quote_literal(source)})"
+    rows = (
+        table.search()
+        .where(source_filter)
+        .select(["chunk_id", "source", "source_hashes"])
+        .limit(None)
+        .to_arrow()
+    )
+    existing: Set[str] = set(rows.column("chunk_id").to_pylist())
+
+    stats = SyncStats()
+    kept: Set[str] = set()
+    # Rows of other sources that chunks of this one duplicate
+    references: Set[str] = set()
+    # Chunks added by this sync, they aren't references
+    added: Set[str] = set()
+    # Signatures of this source's rows, put back as the chunks come by again. A
+    # changed chunk replaces its previous version instead of matching it, and
+    # released rows this source owns are deleted, even when shared.
+    owned: Dict[str, np.ndarray] = {}
+    if dedup is not None:
+        owners = rows.filter(pc.equal(rows.column("source"), source))
+        for chunk_id in owners.column("chunk_id").to_pylist():
+            signature = dedup.remove(chunk_id)
+            if signature is not None:
+                owned[chunk_id] = signature
+
+    columns = ChunkColumns(source, doc_hash)
+    iterator = iter(chunks)
+    chunk_seconds = 0.0
+
+    def new_batches() -> Iterator[pa.RecordBatch]:
+        nonlocal chunk_seconds
+        while True:
+            start = time.perf_counter()
+            columns.clear()
+            for chunk in iterator:
+                if columns.append(chunk) and len(columns) == batch_size:
+                    break
+            chunk_seconds += time.perf_counter() - start
+            if not len(columns):
+                return
+
+            is_new = [chunk_id not in existing for chunk_id in columns.chunk_ids]
+            for chunk_id in columns.chunk_ids:
+                if chunk_id in existing:
+                    kept.add(chunk_id)
+                    if chunk_id in owned:
+                        dedup.add(chunk_id, owned.pop(chunk_id))  # type: ignore
+            stats.unchanged += len(is_new) - sum(is_new)
+
+            if dedup is not None:
+                columns.signatures = dedup.signatures(columns.texts)
+                for i, chunk_id in enumerate(columns.chunk_ids):
+                    if not is_new[i]:
+                        continue
+                    match = dedup.find(columns.signatures[i])
+                    if match is None:
+                        dedup.add(chunk_id, columns.signatures[i])
+                        added.add(chunk_id)
+                        continue
+
+                    is_new[i] = False
+                    stats.duplicates += 1
+                    if match[0] in existing:
+                        kept.add(match[0])
+                    elif match[0] not in added:
+                        references.add(match[0])
+
+            stats.added += sum(is_new)
+            if any(is_new):
+                # Only the new chunks are sent to the embedding function
+                yield from columns.iter_batches(schema, batch_size, embed, mask=is_new)
+
+    # New rows are added before stale rows go, so a failed write never leaves
+    # the document missing. Chunking and embedding happen while the batches are
+    # streamed, inside this span.
+    with span("write", source=source) as write_span:
+        batches = new_batches()
+        first = next(batches, None)
+        if first is not None:
+            table.add(
+                pa.RecordBatchReader.from_batches(schema, chain([first], batches))
+            )
+        write_span.set_attribute("chunks", stats.added)
+    # Chunks are produced lazily between writes, so they get no span of their own
+    telemetry.observe(STAGE_SECONDS, chunk_seconds, stage="chunk")
+
+    stale = existing - kept
+    if stale:
+        release_sources(table, [source], _chunk_ids_filter(stale))
+        stats.deleted = len(stale)
+
+    if references:
+        table.update(
+            where=_chunk_ids_filter(references),
+            values_sql={"sources": f"array_append(sources, {quote_literal(source)})"},
+        )
+
+    # Mark the kept chunks as belonging to the current version of the document
+    if kept:
+        table.update(where=owner_filter, values={"doc_hash": doc_hash})
+
+    # Recorded last, so an interrupted sync is redone instead of skipped
+    entry = source_hash_entry(source, doc_hash)
+    old = _entries_of(rows.column("source_hashes").to_pylist(), {source})
+    hashes = "source_hashes"
+    if old - {entry}:
+        hashes = f"array_except(source_hashes, {_list_literal(old - {entry})})"
+    table.update(
+        where=f"{source_filter} AND NOT array_has(source_hashes, "
+        f"{quote_literal(entry)})",
+        values_sql={"source_hashes": f"array_append({hashes}, {quote_literal(entry)})"},
+    )
+
+    return stats
+
+
+def delete_missing_sources(table, sources: Iterable[str]) -> int:
+    """Delete all rows whose source is not in the given set of sources.
+
+    Rows shared with sources that are still part of the corpus are kept, only
+    the missing sources are removed from their sources list.
+
+    Args:
+        table: LanceDB table with the Chunks schema
+        sources: Sources that are still part of the corpus
+
+    Returns:
+        Number of deleted rows
+    """
+    stored = table.search().select(["sources"]).limit(None).to_arrow()
+    present = set(pc.list_flatten(stored.column("sources")).to_pylist())
+    return release_sources(table, present - set(sources))
@@ -0,0 +1,251 @@
+import argparse
+import math
+from dataclasses import dataclass
+from typing import List, Optional
+
+import lancedb
+import pyarrow as pa
+from lancedb.index import FTS, HnswPq, HnswSq, IvfFlat, IvfPq
+
+from utils.quantization import VectorStorage
+
+INDEX_NAME = "vector_idx"
+FTS_INDEX_NAME = "text_idx"
+# Index configs of create_index by index type
+INDEX_CONFIGS = {
+    "IVF_PQ": IvfPq,
+    "IVF_HNSW_SQ": HnswSq,
+    "IVF_HNSW_PQ": HnswPq,
+    "IVF_FLAT": IvfFlat,
+}
+INDEX_TYPES = tuple(INDEX_CONFIGS)
+
+# Product quantization needs enough rows to train its codebooks
+MIN_ROWS_FOR_INDEX = 256
+
+
+@dataclass
+class SearchParams:
+    """Per-query ANN tuning knobs.
+
+    nprobes: Number of IVF partitions searched (higher = better recall, slower)
+    refine_factor: Re-rank refine_factor * limit candidates with exact distances
+    ef: Candidate list size for HNSW indexes
+    """
+
+    nprobes: int = 20
+    refine_factor: Optional[int] = None
+    ef: Optional[int] = None
+
+
+def vector_search(table, vector, limit: int = 5, params: Optional[SearchParams] = None):
+    """Build a vector query with the given ANN parameters.
+
+    The query vector is truncated and encoded to match the table's
+    VectorStorage. Results of binary and binary_int8 tables are ranked by Hamming
+    distance, use search_vectors to rescore them.
+
+    Args:
+        table: LanceDB table with a vector column
+        vector: Full float32 query vector
+        limit: Number of results
+        params: ANN tuning parameters (ignored when the table has no index)
+
+    Returns:
+        LanceDB query builder
+    """
+    params = params or SearchParams()
+    storage = VectorStorage.from_schema(table.schema)
+    query = (
+        table.search(storage.query_vector(vector), vector_column_name="vector")
+        .distance_type(storage.distance_type)
+        .limit(limit)
+        .nprobes(params.nprobes)
+    )
+    if params.refine_factor:
+        query = query.refine_factor(params.refine_factor)
+    if params.ef:
+        query = query.ef(params.ef)
+    return query
+
+
+def search_vectors(
+    table,
+    vector,
+    limit: int = 5,
+    params: Optional[SearchParams] = None,
+    columns: Optional[List[str]] = None,
+) -> pa.Table:
+    """Run a vector search, rescoring quantized vectors against the float32 query.
+
+    Args:
+        table: LanceDB table with a vector column
+        vector: Full float32 query vector
+        limit: Number of results
+        params: ANN tuning parameters
+        columns: Columns to return (default: all)
+
+    Returns:
+        Results with a "_distance" column, closest first
+    """
+    storage = VectorStorage.from_schema(table.schema)
+    if not storage.quantized:
+        query = vector_search(table, vector, limit, params)
+        return (query.select(columns) if columns else query).to_arrow()
+
+    query = vector_search(table, vector, limit * storage.rescore_factor, params)
+    if columns:
+        query = query.select(list(dict.fromkeys(columns + storage.rescore_columns)))
+    results = storage.rescore(vector, query.to_arrow(), limit)
+    if columns:
+        results = results.select(columns + ["_distance"])
+    return results
+
+
+def default_partitions(num_rows: int) -> int:
+    """Rule of thumb: about sqrt(rows) partitions."""
+    return max(1, int(math.sqrt(num_rows)))
+
+
+def default_sub_vectors(dims: int) -> int:
+    """Largest sub-vector count that divides dims with sub-vectors of at least 16 dims."""
+    for sub_vectors in range(dims // 16, 0, -1):
+        if dims % sub_vectors == 0:
+            return sub_vectors
+    return 1
+
+
+def build_index(
+    table,
+    index_type: str = "IVF_PQ",
+    num_partitions: Optional[int] = None,
+    num_sub_vectors: Optional[int] = None,
+    metric: str = "l2",
+) -> None:
+    """Build (or replace) the ANN index on the vector column.
+
+    OpenAI embeddings are normalized, so l2 ranks results exactly like cosine.
+    Tables with binary or binary_int8 vectors get an IVF_FLAT index over their
+    sign bits with Hamming distance instead.
+
+    Args:
+        table: LanceDB table with a vector column
+        index_type: One of INDEX_TYPES
+        num_partitions: IVF partitions (default: sqrt(rows))
+        num_sub_vectors: PQ sub-vectors (default: dims / 16)
+        metric: Distance metric, must match the metric used at query time
+    """
+    num_rows = table.count_rows()
+    if num_rows < MIN_ROWS_FOR_INDEX:
+        raise ValueError(
+            f"Table has {num_rows} rows, at least {MIN_ROWS_FOR_INDEX} are needed to train an index"
+        )
+
+    storage = VectorStorage.from_schema(table.schema)
+    if storage.quantized:
+        index_type, metric = "IVF_FLAT", storage.distance_type
+
+    options = {
+        "distance_type": metric,
+        "num_partitions": num_partitions or default_partitions(num_rows),
+    }
+    if index_type.endswith("PQ"):
+        dims = table.schema.field("vector").type.list_size
+        options["num_sub_vectors"] = num_sub_vectors or default_sub_vectors(dims)
+    table.create_index(
+        "vector",
+        config=INDEX_CONFIGS[index_type](**options),
+        replace=True,
+        name=INDEX_NAME,
+    )
+
+
+def refresh_index(table, max_unindexed_fraction: float = 0.2, **build_kwargs) -> str:
+    """Bring the index up to date after an incremental ingest.
+
+    Small deltas are merged into the existing index. When too many rows are
+    unindexed the partitions no longer fit the data, so the index is rebuilt.
+
+    Args:
+        table: LanceDB table with a vector column
+        max_unindexed_fraction: Rebuild above this fraction of unindexed rows
+        build_kwargs: Passed to build_index when (re)building
+
+    Returns:
+        "built", "rebuilt" or "optimized"
+    """
+    stats = table.index_stats(INDEX_NAME)
+    if stats is None:
+        build_index(table, **build_kwargs)
+        return "built"
+
+    total = stats.num_indexed_rows + stats.num_unindexed_rows
+    if total and stats.num_unindexed_rows / total > max_unindexed_fraction:
+        build_index(table, **build_kwargs)
+        return "rebuilt"
+
+    table.optimize()
+    return "optimized"
+
+
+def has_fts_index(table) -> bool:
+    """Check whether the table has a full-text index on the text column."""
+    return any(index.name == FTS_INDEX_NAME for index in table.list_indices())
+
+
+def build_fts_index(table) -> None:
+    """Build (or replace) the BM25 full-text index on the text column."""
+    table.create_index("text", config=FTS(), replace=True, name=FTS_INDEX_NAME)
+
+
+def refresh_fts_index(table) -> str:
+    """Build the full-text index if missing, otherwise index newly added rows.
+
+    Returns:
+        "built", "optimized" or "up to date"
+    """
+    if not has_fts_index(table):
+        build_fts_index(table)
+        return "built"
+
+    stats = table.index_stats(FTS_INDEX_NAME)
+    if stats and stats.num_unindexed_rows:
+        table.optimize()
+        return "optimized"
+    return "up to date"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Manage the ANN index of the docling table"
+    )
+    parser.add_argument("command", choices=["build", "refresh", "fts", "stats"])
+    parser.add_argument("--uri", default="data/lancedb")
+    parser.add_argument("--table", default="docling")
+    parser.add_argument("--type", default="IVF_PQ", choices=INDEX_TYPES)
+    parser.add_argument("--partitions", type=int)
+    parser.add_argument("--sub-vectors", type=int)
+    args = parser.parse_args()
+
+    table = lancedb.connect(args.uri).open_table(args.table)
+    build_kwargs = {
+        "index_type": args.type,
+        "num_partitions": args.partitions,
+        "num_sub_vectors": args.sub_vectors,
+    }
+
+    if args.command == "build":
+        build_index(table, **build_kwargs)
+        print(f"Built {args.type} index on {table.count_rows()} rows")
+    elif args.command == "refresh":
+        print(f"Index {refresh_index(table, **build_kwargs)}")
+    elif args.command == "fts":
+        build_fts_index(table)
+        print(f"Built full-text index on {table.count_rows()} rows")
+
+    for index in table.list_indices():
+        print(index.name, table.index_stats(index.name))
+
+
+if __name__ == "__main__":
+    main()
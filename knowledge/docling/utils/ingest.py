@@ -0,0 +1,260 @@
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Set
+from urllib.parse import urlparse
+
+from utils.converter import ConverterFactory, ensure_artifacts
+from utils.docstore import DocumentStore
+from utils.fetch import Fetcher, read_entry
+
+MANIFEST_FILENAME = "manifest.jsonl"
+
+# Each worker process keeps its own converter so the layout/table models load once per process
+_converter = None
+
+
+@dataclass
+class CrawlStats:
+    """Summary of a crawl-and-convert run."""
+
+    converted: int = 0
+    skipped: int = 0
+    not_modified: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    peak_rss_mb: float = 0.0
+
+    @property
+    def pages_per_sec(self) -> float:
+        return self.converted / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"converted={self.converted} skipped={self.skipped} "
+            f"not_modified={self.not_modified} failed={self.failed} "
+            f"elapsed={self.elapsed:.1f}s pages/sec={self.pages_per_sec:.2f} "
+            f"peak_rss={self.peak_rss_mb:.0f}MB"
+        )
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and its largest child, in MB."""
+    usage = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def load_manifest(output_dir: str | Path) -> Dict[str, dict]:
+    """Load the latest manifest entry per URL.
+
+    Args:
+        output_dir: Directory holding the converted documents and manifest
+
+    Returns:
+        Mapping of URL to its most recent manifest record
+    """
+    manifest_path = Path(output_dir) / MANIFEST_FILENAME
+    entries: Dict[str, dict] = {}
+    if not manifest_path.exists():
+        return entries
+
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave a truncated last line
+                continue
+            entries[record["url"]] = record
+    return entries
+
+
+def _init_worker() -> None:
+    global _converter
+    _converter = ConverterFactory()
+
+
+def _convert_url(url: str, output_dir: str, cache_path: Optional[str] = None) -> dict:
+    start = time.perf_counter()
+    try:
+        # Fetched by the main process, the body is read from the HTTP cache
+        source = read_entry(cache_path).to_stream() if cache_path else url
+        document = _converter.convert(source)  # type: ignore[union-attr]
+        # Written to a temp file first, so a crash never leaves a half-written document behind
+        path = DocumentStore(output_dir).put(url, document)
+
+        return {
+            "url": url,
+            "status": "success",
+            "path": path.name,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+    except Exception as e:
+        return {
+            "url": url,
+            "status": "failed",
+            "error": str(e),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+
+
+def crawl_and_convert(
+    urls: Iterable[str],
+    output_dir: str | Path = "data/docs",
+    max_workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    retry_failed: bool = True,
+    recrawl: bool = False,
+    fetcher: Optional[Fetcher] = None,
+) -> CrawlStats:
+    """Convert URLs in a process pool, checkpointing every finished URL.
+
+    Pages are downloaded concurrently by a pooled Fetcher in this process, and
+    the workers convert the bodies from the HTTP cache. Converted documents are
+    written to ``output_dir`` as soon as they finish, and every outcome is
+    appended to a manifest. Re-running with the same output directory skips
+    URLs that already converted successfully.
+
+    Args:
+        urls: URLs (or local paths) to convert
+        output_dir: Directory for converted documents and the manifest
+        max_workers: Number of worker processes (default: CPU count)
+        max_in_flight: Maximum number of queued conversions (default: 2 * max_workers)
+        retry_failed: Whether URLs that failed on a previous run are retried
+        recrawl: Fetch converted URLs again with conditional GETs and reconvert
+            the ones that changed (the server doesn't answer 304)
+        fetcher: Shared Fetcher (default: a new one, closed when done)
+
+    Returns:
+        CrawlStats for this run
+    """
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * max_workers
+    # Download the models once here, not in every worker at the same time
+    ensure_artifacts()
+
+    records = load_manifest(output_path)
+    converted: Set[str] = {
+        url for url, record in records.items() if record["status"] == "success"
+    }
+    done: Set[str] = {
+        url
+        for url, record in records.items()
+        if record["status"] == "success" or not retry_failed
+    }
+    queued: Set[str] = set()
+
+    stats = CrawlStats()
+    start = time.perf_counter()
+    owns_fetcher = fetcher is None
+    if fetcher is None:
+        fetcher = Fetcher()
+
+    with (
+        open(output_path / MANIFEST_FILENAME, "a", encoding="utf-8") as manifest,
+        ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool,
+    ):
+        pending: Set[Future] = set()
+
+        def write(record: dict) -> None:
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            os.fsync(manifest.fileno())
+
+            if record["status"] == "success":
+                stats.converted += 1
+            else:
+                stats.failed += 1
+
+        def drain(return_when: str) -> None:
+            nonlocal pending
+            finished, pending = wait(pending, return_when=return_when)
+            for future in finished:
+                write(future.result())
+
+        def submit(url: str, cache_path: Optional[str] = None) -> None:
+            # Keep the queue bounded so huge sitemaps don't pile up futures in memory
+            if len(pending) >= max_in_flight:
+                drain(FIRST_COMPLETED)
+            pending.add(pool.submit(_convert_url, url, str(output_path), cache_path))
+
+        def remote_urls() -> Iterator[str]:
+            for url in urls:
+                if url in queued or (
+                    url in done and not (recrawl and url in converted)
+                ):
+                    stats.skipped += 1
+                    continue
+                queued.add(url)
+
+                if urlparse(url).scheme in ("http", "https"):
+                    yield url
+                else:
+                    submit(url)
+
+        try:
+            # Downloads run ahead of the conversions, up to max_in_flight at once
+            for result in fetcher.map(remote_urls(), max_in_flight):
+                if result.error:
+                    write(
+                        {"url": result.url, "status": "failed", "error": result.error}
+                    )
+                elif result.not_modified and result.url in converted:
+                    stats.not_modified += 1
+                else:
+                    submit(result.url, str(result.entry.path))
+
+            while pending:
+                drain(FIRST_COMPLETED)
+        finally:
+            if owns_fetcher:
+                fetcher.close()
+
+    stats.elapsed = time.perf_counter() - start
+    stats.peak_rss_mb = peak_rss_mb()
+    return stats
+
+
+def iter_documents(output_dir: str | Path = "data/docs") -> Iterator:
+    """Lazily load converted documents from disk, one at a time.
+
+    Args:
+        output_dir: Directory written by crawl_and_convert
+
+    Yields:
+        DoclingDocument for every successfully converted URL
+    """
+    store = DocumentStore(output_dir)
+    for url, record in load_manifest(output_dir).items():
+        if record["status"] == "success":
+            yield store.get(url)
+
+
+if __name__ == "__main__":
+    from utils.sitemap import iter_sitemap_entries
+
+    args = [arg for arg in sys.argv[1:] if arg != "--recrawl"]
+    base_url = args[0] if args else "https://ds4sd.github.io/docling/"
+    # Sitemaps and pages share one connection pool and HTTP cache
+    with Fetcher() as fetcher:
+        entries = iter_sitemap_entries(base_url, fetcher=fetcher)
+        print(
+            crawl_and_convert(
+                (entry.url for entry in entries),
+                recrawl="--recrawl" in sys.argv,
+                fetcher=fetcher,
+            )
+        )
+        print(f"HTTP: {fetcher.stats}")
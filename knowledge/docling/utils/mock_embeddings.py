@@ -0,0 +1,163 @@
+import base64
+import json
+import re
+import sys
+import threading
+import time
+from hashlib import blake2b
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import numpy as np
+
+MODEL_DIMENSIONS = {
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-ada-002": 1536,
+}
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def hash_embedding(text: str, dimensions: int = 3072) -> List[float]:
+    """Deterministic stand-in for an embedding model.
+
+    Every word is hashed into a signed bucket (the "hashing trick"), so texts
+    that share words end up close together. Good enough for offline tests and
+    benchmarks, without any network calls.
+
+    Args:
+        text: Text to embed
+        dimensions: Length of the returned vector
+
+    Returns:
+        L2-normalized vector
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in WORD_PATTERN.findall(text.lower()):
+        digest = int.from_bytes(
+            blake2b(word.encode("utf-8"), digest_size=8).digest(), "little"
+        )
+        vector[digest % dimensions] += 1.0 if digest >> 63 else -1.0
+
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+class _RateLimiter:
+    """Token bucket limiting requests per second."""
+
+    def __init__(self, requests_per_second: float):
+        self.rate = requests_per_second
+        self.tokens = requests_per_second
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+def make_handler(limiter: _RateLimiter | None, latency: float):
+    class EmbeddingsHandler(BaseHTTPRequestHandler):
+        """Handles POST /v1/embeddings with OpenAI's request and response format."""
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/embeddings"):
+                self._send_json(404, {"error": {"message": "Not found"}})
+                return
+
+            if limiter and not limiter.try_acquire():
+                self._send_json(
+                    429,
+                    {"error": {"message": "Rate limit reached", "type": "requests"}},
+                    {"retry-after-ms": "200", "x-ratelimit-remaining-requests": "0"},
+                )
+                return
+
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            inputs = body["input"]
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            model = body.get("model", "text-embedding-3-large")
+            dimensions = body.get("dimensions") or MODEL_DIMENSIONS.get(model, 3072)
+
+            if latency:
+                time.sleep(latency)
+
+            data = []
+            for i, text in enumerate(inputs):
+                embedding = hash_embedding(text, dimensions)
+                if body.get("encoding_format") == "base64":
+                    embedding = base64.b64encode(
+                        np.asarray(embedding, dtype="<f4").tobytes()
+                    ).decode("ascii")
+                data.append({"object": "embedding", "index": i, "embedding": embedding})
+
+            tokens = sum(len(WORD_PATTERN.findall(text)) for text in inputs)
+            self._send_json(
+                200,
+                {
+                    "object": "list",
+                    "data": data,
+                    "model": model,
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                },
+            )
+
+        def _send_json(self, status: int, payload: dict, headers: dict | None = None):
+            encoded = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(encoded)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def log_message(self, format, *args):
+            pass
+
+    return EmbeddingsHandler
+
+
+def serve(
+    port: int = 8100,
+    requests_per_second: float | None = None,
+    latency: float = 0.0,
+) -> ThreadingHTTPServer:
+    """Start a local mock of the OpenAI embeddings endpoint in a background thread.
+
+    Point the OpenAI client at it with base_url="http://127.0.0.1:<port>/v1".
+
+    Args:
+        port: Port to listen on
+        requests_per_second: Return 429s above this request rate (default: unlimited)
+        latency: Artificial delay per request in seconds
+
+    Returns:
+        The running server; call shutdown() to stop it
+    """
+    limiter = _RateLimiter(requests_per_second) if requests_per_second else None
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(limiter, latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    rps = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    server = serve(requests_per_second=rps)
+    print(f"Mock embeddings server on http://127.0.0.1:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
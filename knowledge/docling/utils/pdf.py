@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import pypdfium2
+from docling_core.types.doc import DoclingDocument
+
+from utils.converter import ConverterFactory, ensure_artifacts, needs_ocr
+from utils.fetch import shared_fetcher
+
+# Each worker process keeps its own converter so the layout/table models load once per process
+_converter = None
+
+
+def _init_worker() -> None:
+    global _converter
+    _converter = ConverterFactory()
+    _converter.warm_up()
+
+
+def _ready(_: int) -> bool:
+    return _converter is not None
+
+
+def _convert_pages(path: str, start: int, end: int, ocr: bool) -> DoclingDocument:
+    return _converter.convert(  # type: ignore[union-attr]
+        path, ocr=ocr, page_range=(start, end)
+    )
+
+
+def page_count(path: str | Path) -> int:
+    """Number of pages in a PDF file."""
+    pdf = pypdfium2.PdfDocument(str(path))
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def page_ranges(num_pages: int, pages_per_part: int) -> List[Tuple[int, int]]:
+    """Split 1-based pages into inclusive (start, end) ranges of at most pages_per_part."""
+    return [
+        (start, min(start + pages_per_part - 1, num_pages))
+        for start in range(1, num_pages + 1, pages_per_part)
+    ]
+
+
+def merge_documents(parts: Sequence[DoclingDocument]) -> DoclingDocument:
+    """Merge documents converted from consecutive page ranges of one file.
+
+    Args:
+        parts: Partial documents, in page order
+
+    Returns:
+        One document with the name and origin of the source file
+    """
+    merged = DoclingDocument.concatenate(parts)
+    merged.name = parts[0].name
+    merged.origin = parts[0].origin
+    return merged
+
+
+@contextmanager
+def _local_copy(source: str | Path) -> Iterator[Path]:
+    """Download a URL once to a temp file, so workers don't each fetch it."""
+    if urlparse(str(source)).scheme not in ("http", "https"):
+        yield Path(source)
+        return
+
+    # Conditional GET through the shared connection pool and HTTP cache
+    entry = shared_fetcher().fetch(str(source)).entry
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Keep the URL's file name, docling records it as the document's origin
+        path = Path(tmp_dir) / entry.name
+        with entry.open() as body, open(path, "wb") as f:
+            shutil.copyfileobj(body, f, length=1 << 20)
+        yield path
+
+
+class ParallelPdfConverter:
+    """Convert large PDFs by page range in a pool of warm converter processes.
+
+    Layout analysis and OCR run on a single core per conversion. Splitting a PDF
+    into page ranges and converting them in parallel uses every core, and each
+    worker loads the models only once.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        pages_per_part: int = 8,
+        min_pages: int = 16,
+    ):
+        """Start the worker processes.
+
+        Args:
+            max_workers: Number of worker processes (default: CPU count)
+            pages_per_part: Pages converted per task
+            min_pages: PDFs with fewer pages are converted in one task
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pages_per_part = pages_per_part
+        self.min_pages = min_pages
+        # Download the models once here, not in every worker at the same time
+        ensure_artifacts()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, initializer=_init_worker
+        )
+
+    def warm_up(self) -> None:
+        """Start every worker and load its models before the first conversion."""
+        list(self._executor.map(_ready, range(self.max_workers)))
+
+    def convert(self, source: str | Path) -> DoclingDocument:
+        """Convert a PDF from a local path or URL.
+
+        Args:
+            source: Path or URL of the PDF
+
+        Returns:
+            The converted document, with pages in their original order
+        """
+        with _local_copy(source) as path:
+            num_pages = page_count(path)
+            pages_per_part = self.pages_per_part
+            if num_pages < self.min_pages:
+                pages_per_part = max(num_pages, 1)
+            # Decided once for the whole file, not by every task re-reading it
+            ocr = needs_ocr(path)
+
+            futures = [
+                self._executor.submit(_convert_pages, str(path), start, end, ocr)
+                for start, end in page_ranges(num_pages, pages_per_part)
+            ]
+            parts = [future.result() for future in futures]
+
+        return parts[0] if len(parts) == 1 else merge_documents(parts)
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def __enter__(self) -> "ParallelPdfConverter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,221 @@
+import json
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+
+VECTOR_MODES = ("float32", "float16", "binary", "binary_int8")
+
+# Schema metadata key that records how a table stores its vectors
+METADATA_KEY = b"vector_storage"
+
+# Dimensions of text-embedding-3-large, the model the vectors come from
+FULL_DIMS = 3072
+
+
+def truncate(vectors, dims: int) -> np.ndarray:
+    """Shorten Matryoshka embeddings to their first dims components.
+
+    text-embedding-3 models are trained so that a prefix of the vector is itself
+    a usable embedding once it is normalized again, which is what the API's
+    dimensions parameter returns.
+
+    Args:
+        vectors: One vector or a 2D array of vectors
+        dims: Number of leading components to keep
+
+    Returns:
+        L2-normalized float32 vectors with dims components
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)[..., :dims]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+@dataclass(frozen=True)
+class VectorStorage:
+    """How the vectors of a Chunks table are stored and searched.
+
+    float32 and float16 vectors are searched directly with l2 distance. binary
+    and binary_int8 tables are searched by Hamming distance over one sign bit
+    per dimension, then rescore_factor * limit candidates are rescored against
+    the float32 query: binary tables with the sign bits, binary_int8 tables with
+    per-row scaled int8 codes stored next to the sign bits.
+
+    mode: One of VECTOR_MODES
+    dims: Matryoshka dimensions kept (at most FULL_DIMS)
+    rescore_factor: Candidates fetched per result before rescoring (binary modes)
+    """
+
+    mode: str = "float32"
+    dims: int = FULL_DIMS
+    rescore_factor: int = 4
+
+    def __post_init__(self):
+        if self.mode not in VECTOR_MODES:
+            raise ValueError(f"mode must be one of {VECTOR_MODES}, got {self.mode!r}")
+        if not 0 < self.dims <= FULL_DIMS:
+            raise ValueError(f"dims must be between 1 and {FULL_DIMS}")
+        if self.quantized and self.dims % 8:
+            raise ValueError("dims must be a multiple of 8 to pack sign bits")
+
+    def __str__(self) -> str:
+        return self.mode if self.dims == FULL_DIMS else f"{self.mode}@{self.dims}"
+
+    @classmethod
+    def from_schema(cls, schema: pa.Schema) -> "VectorStorage":
+        """Read the storage mode recorded in a table's schema (float32 if none)."""
+        return _from_metadata((schema.metadata or {}).get(METADATA_KEY))
+
+    @property
+    def quantized(self) -> bool:
+        """Whether search results need a float32 rescoring pass."""
+        return self.mode in ("binary", "binary_int8")
+
+    @property
+    def distance_type(self) -> str:
+        return "hamming" if self.quantized else "l2"
+
+    @property
+    def rescore_columns(self) -> List[str]:
+        """Columns read for each candidate to rescore it."""
+        if self.mode == "binary_int8":
+            return ["vector_int8", "vector_scale"]
+        if self.mode == "binary":
+            return ["vector"]
+        return []
+
+    def fields(self) -> List[pa.Field]:
+        """Arrow fields of the vector columns, the searched "vector" column first."""
+        if self.quantized:
+            fields = [pa.field("vector", pa.list_(pa.uint8(), self.dims // 8))]
+        else:
+            value_type = pa.float16() if self.mode == "float16" else pa.float32()
+            fields = [pa.field("vector", pa.list_(value_type, self.dims))]
+        if self.mode == "binary_int8":
+            fields += [
+                pa.field("vector_int8", pa.list_(pa.int8(), self.dims)),
+                pa.field("vector_scale", pa.float32()),
+            ]
+        return fields
+
+    @property
+    def bytes_per_vector(self) -> int:
+        """Bytes of vector columns stored per chunk, all of which the mode reads."""
+        size = 0
+        for field in self.fields():
+            if pa.types.is_fixed_size_list(field.type):
+                size += field.type.list_size * field.type.value_type.bit_width // 8
+            else:
+                size += field.type.bit_width // 8
+        return size
+
+    def schema(self, base: pa.Schema) -> pa.Schema:
+        """Schema of a table with this storage, derived from the float32 schema.
+
+        The embedding function config is dropped, vectors are always computed
+        and encoded before they are written.
+
+        Args:
+            base: Arrow schema of the Chunks model
+
+        Returns:
+            Schema with this storage's vector columns and the mode in its metadata
+        """
+        fields = [field for field in base if not field.name.startswith("vector")]
+        position = base.get_field_index("vector")
+        fields[position:position] = self.fields()
+        return pa.schema(
+            fields, metadata={METADATA_KEY: json.dumps(asdict(self)).encode()}
+        )
+
+    def encode(self, vectors) -> Dict[str, pa.Array]:
+        """Encode full float32 embeddings into the vector columns.
+
+        Args:
+            vectors: 2D array of embeddings, one row per chunk
+
+        Returns:
+            Arrow array per vector column
+        """
+        vectors = truncate(vectors, self.dims)
+        if self.mode in ("float32", "float16"):
+            values = vectors.astype(
+                np.float16 if self.mode == "float16" else np.float32
+            )
+            return {"vector": _fixed_size_list(values)}
+
+        columns = {"vector": _fixed_size_list(np.packbits(vectors > 0, axis=-1))}
+        if self.mode == "binary_int8":
+            scales = np.abs(vectors).max(axis=-1, keepdims=True) / 127
+            scales[scales == 0] = 1.0
+            codes = np.round(vectors / scales).astype(np.int8)
+            columns["vector_int8"] = _fixed_size_list(codes)
+            columns["vector_scale"] = pa.array(scales.ravel(), pa.float32())
+        return columns
+
+    def query_vector(self, vector) -> np.ndarray:
+        """The query as it is compared against the "vector" column."""
+        vector = truncate(vector, self.dims)
+        if self.quantized:
+            return np.packbits(vector > 0)
+        return vector.astype(np.float16 if self.mode == "float16" else np.float32)
+
+    def rescore(self, query_vector, candidates: pa.Table, limit: int) -> pa.Table:
+        """Rank Hamming search candidates by their similarity to the float32 query.
+
+        Args:
+            query_vector: Full float32 query embedding
+            candidates: Search results with rescore_columns
+            limit: Number of results to keep
+
+        Returns:
+            Top rows, with "_distance" replaced by the squared l2 distance of the
+            normalized vectors (2 - 2 * cosine), like an unquantized search
+        """
+        query = truncate(query_vector, self.dims)
+        if candidates.num_rows == 0:
+            return candidates
+
+        if self.mode == "binary_int8":
+            codes = _to_numpy(candidates["vector_int8"], np.int8, self.dims)
+            scales = candidates["vector_scale"].to_numpy()
+            similarity = (codes.astype(np.float32) @ query) * scales
+        else:
+            bits = _to_numpy(candidates["vector"], np.uint8, self.dims // 8)
+            signs = np.unpackbits(bits, axis=-1).astype(np.float32) * 2 - 1
+            # Sign vectors have norm sqrt(dims), so this is a cosine similarity
+            similarity = (signs @ query) / np.sqrt(self.dims)
+
+        best = np.argsort(-similarity, kind="stable")[:limit]
+        distance = pa.array(2 - 2 * similarity[best], pa.float32())
+        results = candidates.take(pa.array(best))
+        if "_distance" in results.column_names:
+            results = results.drop_columns(["_distance"])
+        return results.append_column("_distance", distance)
+
+
+@lru_cache(maxsize=16)
+def _from_metadata(value: Optional[bytes]) -> VectorStorage:
+    return VectorStorage(**json.loads(value)) if value else VectorStorage()
+
+
+def _fixed_size_list(values: np.ndarray) -> pa.FixedSizeListArray:
+    return pa.FixedSizeListArray.from_arrays(pa.array(values.ravel()), values.shape[1])
+
+
+def _to_numpy(column, dtype, width: int) -> np.ndarray:
+    values = (
+        pa.concat_arrays(column.chunks)
+        if isinstance(column, pa.ChunkedArray)
+        else column
+    )
+    return values.flatten().to_numpy().astype(dtype, copy=False).reshape(-1, width)
+
+
+def parse_storage(value: str, rescore_factor: int = 4) -> VectorStorage:
+    """Parse a mode such as "float16" or "binary@1024" (mode@dims)."""
+    mode, _, dims = value.partition("@")
+    return VectorStorage(mode, int(dims) if dims else FULL_DIMS, rescore_factor)
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import time
+from concurrent.futures import Executor
+from dataclasses import asdict
+from datetime import timedelta
+from functools import partial
+from typing import (
+    TYPE_CHECKING,
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import lancedb
+
+from utils.embedding_cache import aembed_query
+from utils.index import SearchParams, has_fts_index, search_vectors
+from utils.retrieval import (
+    RESULT_COLUMNS,
+    SearchResult,
+    dump_results,
+    hybrid_search,
+    join_contexts,
+    to_results,
+)
+from utils.semantic_cache import history_key
+from utils.telemetry import STAGE_SECONDS, span, telemetry
+
+if TYPE_CHECKING:
+    from utils.context import ContextPacker
+    from utils.embedding_cache import EmbeddingCache
+    from utils.rerank import Reranker
+    from utils.semantic_cache import SemanticCache
+
+Event = Tuple[str, dict]
+
+CHAT_MODEL = "gpt-4o-mini"
+TEMPERATURE = 0.7
+
+# ANN tuning for the docling table's vector index (python -m benchmarks.index)
+SEARCH_PARAMS = SearchParams(nprobes=20, refine_factor=10)
+
+
+def open_table(uri: str = "data/lancedb", name: str = "docling"):
+    """Open the docling table for serving.
+
+    Args:
+        uri: LanceDB database location
+        name: Table name
+
+    Returns:
+        LanceDB table object
+    """
+    # Check for new table versions, so re-ingests show up without a restart
+    db = lancedb.connect(uri, read_consistency_interval=timedelta(seconds=10))
+    return db.open_table(name)
+
+
+def retrieve(
+    table,
+    query: str,
+    query_vector,
+    num_results: int = 5,
+    params: SearchParams = SEARCH_PARAMS,
+    hybrid: bool = True,
+    timings: Optional[Dict[str, float]] = None,
+    reranker: Optional["Reranker"] = None,
+    candidates: Optional[int] = None,
+    fts: Optional[bool] = None,
+) -> List[SearchResult]:
+    """Search the table for chunks relevant to an embedded query.
+
+    Args:
+        table: LanceDB table with the Chunks schema
+        query: User's question
+        query_vector: Embedded question
+        num_results: Number of results to return
+        params: ANN search parameters (nprobes, refine_factor)
+        hybrid: Fuse vector search with full-text (BM25) search when the table
+            has a full-text index
+        timings: Dict that receives the latency of each search leg in milliseconds
+        reranker: Cross-encoder that picks the num_results best of the candidates
+        candidates: Results retrieved for reranking (default: 4 * num_results)
+        fts: Whether the table has a full-text index (default: look it up)
+
+    Returns:
+        Relevant chunks with their source information
+    """
+    timings = {} if timings is None else timings
+    limit = (candidates or 4 * num_results) if reranker else num_results
+
+    with span("search", limit=limit) as search_span:
+        hybrid = hybrid and (has_fts_index(table) if fts is None else fts)
+        search_span.set_attribute("hybrid", hybrid)
+        if hybrid:
+            results, leg_timings = hybrid_search(
+                table, query, query_vector, limit, params
+            )
+            timings.update(leg_timings)
+        else:
+            start = time.perf_counter()
+            results = search_vectors(table, query_vector, limit, params, RESULT_COLUMNS)
+            timings["vector_ms"] = (time.perf_counter() - start) * 1000
+
+    if reranker is None:
+        return to_results(results)
+
+    with span("rerank", candidates=results.num_rows):
+        start = time.perf_counter()
+        reranked = reranker.rerank(query, to_results(results), num_results)
+        timings["rerank_ms"] = (time.perf_counter() - start) * 1000
+    return reranked
+
+
+def build_messages(messages, results: List[SearchResult]) -> List[Dict[str, str]]:
+    """Prepend the system prompt with the retrieved context to the chat history.
+
+    Args:
+        messages: Chat history
+        results: Retrieved context from database
+
+    Returns:
+        Messages for the chat completions API
+    """
+    system_prompt = f"""You are a helpful assistant that answers questions based on the provided context.
+    Use only the information from the context to answer questions. If you're unsure or the context
+    doesn't contain the relevant information, say so.
+    
+    Context:
+    {join_contexts(results)}
+    """
+
+    return [{"role": "system", "content": system_prompt}, *messages]
+
+
+async def answer_events(
+    messages: List[Dict[str, str]],
+    search: Callable[[str, object, Dict[str, float]], List[SearchResult]],
+    client,
+    cache: "EmbeddingCache",
+    packer: "ContextPacker",
+    semantic_cache: Optional["SemanticCache"] = None,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[Event]:
+    """Answer the last message as a stream of events.
+
+    The pipeline behind both the RAG service and the chat app's in-process
+    mode: embed the question, replay a cached answer or retrieve, pack the
+    prompt and stream the model's answer. Blocking calls (cache lookups,
+    searches, token counting) run in executor.
+
+    Args:
+        messages: Chat history ending with the user's question
+        search: Blocking function of (question, query vector, timings) returning
+            the retrieved results
+        client: AsyncOpenAI client for the query embedding and the answer
+        cache: Embedding cache for the table's model
+        packer: Fits the results and chat history into the prompt's budgets
+        semantic_cache: Cache of answered questions, if answers may be reused
+        executor: Executor for blocking calls (default: the loop's default)
+
+    Yields:
+        ("results", ...) with the retrieved chunks, ("token", ...) for each piece
+        of the answer and ("done", ...) with the turn's latencies
+    """
+    loop = asyncio.get_running_loop()
+
+    def run(func, *args):
+        return loop.run_in_executor(executor, partial(func, *args))
+
+    prompt = messages[-1]["content"]
+    # Latency of each step of this turn
+    timings: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    prompt_vector = await aembed_query(prompt, cache, client, executor)
+    timings["embed_ms"] = (time.perf_counter() - start) * 1000
+
+    # Near-duplicates of recently answered questions are replayed from the cache
+    cache_hit = None
+    if semantic_cache is not None:
+        start = time.perf_counter()
+        cache_hit = await run(
+            semantic_cache.lookup, prompt_vector, history_key(messages)
+        )
+        timings["answer_cache_ms"] = (time.perf_counter() - start) * 1000
+
+    if cache_hit:
+        yield "results", {
+            "results": json.loads(cache_hit.context),
+            "cache_hit": {
+                "prompt": cache_hit.prompt,
+                "similarity": cache_hit.similarity,
+            },
+        }
+        yield "token", {"text": cache_hit.answer}
+        yield "done", {"timings": timings, "prompt": None}
+        return
+
+    results = await run(search, prompt, prompt_vector, timings)
+    yield "results", {
+        "results": [asdict(result) for result in results],
+        "cache_hit": None,
+    }
+
+    start = time.perf_counter()
+    packed = await run(packer.pack, results, messages)
+    timings["pack_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    stream = await client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=build_messages(packed.messages, packed.results),
+        temperature=TEMPERATURE,
+        stream=True,
+    )
+    pieces = []
+    async for chunk in stream:
+        text = chunk.choices[0].delta.content if chunk.choices else None
+        if text:
+            if "first_token_ms" not in timings:
+                timings["first_token_ms"] = (time.perf_counter() - start) * 1000
+                telemetry.observe(
+                    "docling_time_to_first_token_seconds",
+                    timings["first_token_ms"] / 1000,
+                )
+            pieces.append(text)
+            yield "token", {"text": text}
+    timings["generation_ms"] = (time.perf_counter() - start) * 1000
+    # Histograms rather than spans: this generator is suspended at every yield,
+    # interleaved with other requests on the event loop
+    telemetry.observe(STAGE_SECONDS, timings["generation_ms"] / 1000, stage="generate")
+
+    if semantic_cache is not None:
+        await run(
+            semantic_cache.store,
+            prompt_vector,
+            prompt,
+            dump_results(results),
+            "".join(pieces),
+            history_key(messages),
+        )
+    yield "done", {
+        "timings": timings,
+        "prompt": {
+            "context_tokens": packed.context_tokens,
+            "history_tokens": packed.history_tokens,
+            "dropped_results": packed.dropped_results,
+            "dropped_messages": packed.dropped_messages,
+        },
+    }
+
+
+def iter_sync(
+    events: AsyncGenerator[Event, None], loop: asyncio.AbstractEventLoop
+) -> Iterator[Event]:
+    """Iterate an async event stream from synchronous code, e.g. Streamlit.
+
+    Args:
+        events: Async generator of events, e.g. answer_events
+        loop: Event loop running in another thread
+
+    Yields:
+        (event, data) tuples
+    """
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(
+                    events.__anext__(), loop
+                ).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        # Stops the answer when the consumer stops early
+        asyncio.run_coroutine_threadsafe(events.aclose(), loop).result()
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import List, Optional, Sequence
+
+import numpy as np
+import torch
+from sentence_transformers import CrossEncoder
+
+from utils.retrieval import SearchResult
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class Reranker:
+    """Rescore retrieved chunks against the query with a local cross-encoder.
+
+    A cross-encoder reads query and chunk together, so it ranks more precisely
+    than vector distance. Retrieving many candidates and keeping only the best
+    few after reranking keeps answers good with fewer chunks in the prompt.
+    """
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        batch_size: int = 16,
+        num_threads: int = 4,
+        max_length: int = 512,
+        torch_threads: Optional[int] = None,
+    ):
+        """Load the model on CPU.
+
+        Args:
+            model_name: Hugging Face cross-encoder model
+            batch_size: (query, chunk) pairs scored per forward pass
+            num_threads: Batches scored in parallel
+            max_length: Maximum tokens per pair, longer chunks are truncated
+            torch_threads: Set torch's intra-op thread count, e.g.
+                os.cpu_count() // num_threads so the parallel batches don't
+                oversubscribe the cores. This is a process-wide setting, so it
+                also applies to every other torch user in the process (default:
+                leave it alone)
+        """
+        if torch_threads is not None:
+            torch.set_num_threads(torch_threads)
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=num_threads)
+
+    def _predict(self, pairs: List[List[str]]) -> np.ndarray:
+        with torch.inference_mode():
+            return self.model.predict(
+                pairs,
+                batch_size=len(pairs),
+                show_progress_bar=False,
+                convert_to_numpy=True,
+            )
+
+    def score(self, query: str, texts: Sequence[str]) -> np.ndarray:
+        """Score how well each text answers the query.
+
+        Args:
+            query: The user's question
+            texts: Candidate chunk texts
+
+        Returns:
+            One relevance score per text, higher is better
+        """
+        if not texts:
+            return np.empty(0, dtype=np.float32)
+
+        # Batch texts of similar length together to minimize padding
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        batches = [
+            [[query, texts[i]] for i in order[start : start + self.batch_size]]
+            for start in range(0, len(texts), self.batch_size)
+        ]
+
+        scores = np.empty(len(texts), dtype=np.float32)
+        scores[order] = np.concatenate(list(self._executor.map(self._predict, batches)))
+        return scores
+
+    def rerank(
+        self, query: str, results: List[SearchResult], top_k: int
+    ) -> List[SearchResult]:
+        """Keep the top_k results by cross-encoder score.
+
+        Args:
+            query: The user's question
+            results: Retrieved candidates
+            top_k: Number of results to keep
+
+        Returns:
+            Best results first, with their cross-encoder score
+        """
+        scores = self.score(query, [result.text for result in results])
+        best = np.argsort(-scores, kind="stable")[:top_k]
+        return [replace(results[i], score=float(scores[i])) for i in best]
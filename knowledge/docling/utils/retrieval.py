@@ -0,0 +1,228 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.index import SearchParams, search_vectors
+
+# Standard RRF constant: dampens the influence of the top ranks of each leg
+RRF_K = 60
+
+# Columns needed to build context, everything else (e.g. the vector) stays on disk
+RESULT_COLUMNS = ["text", "metadata", "chunk_id"]
+
+_NULL_STRING = pa.scalar(None, pa.string())
+
+# Runs the full-text leg of hybrid searches, the vector leg runs on the caller's
+# thread. Sized for the RAG service's 64 search threads, so each concurrent
+# query gets a helper; threads are only started when needed.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("RAG_SEARCH_THREADS", "64")),
+    thread_name_prefix="fts",
+)
+
+
+@dataclass(slots=True)
+class SearchResult:
+    """A retrieved chunk with its citation and relevance score.
+
+    context is the chunk as it is shown to the model: its text followed by
+    "Source:" and "Title:" lines.
+    """
+
+    text: str
+    filename: Optional[str]
+    pages: List[int]
+    title: Optional[str]
+    score: float
+    chunk_id: str
+    context: str
+
+    @property
+    def source(self) -> Optional[str]:
+        """Citation such as "report.pdf - p. 1, 2", or None if unknown."""
+        pages = f"p. {', '.join(map(str, self.pages))}" if self.pages else None
+        return " - ".join(part for part in (self.filename, pages) if part) or None
+
+
+def reciprocal_rank_fusion(
+    results: List[pa.Table], limit: int, k: int = RRF_K
+) -> pa.Table:
+    """Fuse ranked result tables with reciprocal rank fusion.
+
+    Each chunk scores sum(1 / (k + rank)) over the result lists it appears in,
+    so chunks ranked well by both legs come first.
+
+    Args:
+        results: Ranked results from each retrieval leg, with RESULT_COLUMNS
+        limit: Number of fused results to return
+        k: RRF constant
+
+    Returns:
+        Top rows by fused score, with the score in a "_score" column
+    """
+    scores: Dict[str, float] = {}
+    first_seen: Dict[str, int] = {}
+    offset = 0
+    for table in results:
+        for rank, chunk_id in enumerate(table["chunk_id"].to_pylist(), start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+            first_seen.setdefault(chunk_id, offset + rank - 1)
+        offset += table.num_rows
+
+    ranked = sorted(scores, key=scores.__getitem__, reverse=True)[:limit]
+    combined = pa.concat_tables([table.select(RESULT_COLUMNS) for table in results])
+    fused = combined.take([first_seen[chunk_id] for chunk_id in ranked])
+    return fused.append_column(
+        "_score", pa.array([scores[chunk_id] for chunk_id in ranked], pa.float64())
+    )
+
+
+def _non_empty(values):
+    """Replace empty strings with nulls."""
+    return pc.if_else(
+        pc.fill_null(pc.not_equal(values, ""), False), values, _NULL_STRING
+    )
+
+
+def format_contexts(results: pa.Table) -> List[str]:
+    """Format each result as its text followed by a source citation.
+
+    The citation is built with Arrow compute kernels over whole columns, so no
+    DataFrame or per-row dicts are created.
+
+    Args:
+        results: Search results with "text" and "metadata" columns
+
+    Returns:
+        One context string per result
+    """
+    metadata = results["metadata"]
+    filename = _non_empty(pc.struct_field(metadata, "filename"))
+    title = _non_empty(pc.struct_field(metadata, "title"))
+    page_numbers = pc.struct_field(metadata, "page_numbers")
+
+    pages = pc.binary_join(pc.cast(page_numbers, pa.list_(pa.string())), ", ")
+    has_pages = pc.fill_null(pc.greater(pc.list_value_length(page_numbers), 0), False)
+    pages = pc.if_else(
+        has_pages, pc.binary_join_element_wise("p. ", pages, ""), _NULL_STRING
+    )
+
+    # "filename - p. 1, 2", or whichever of the two is present
+    source = pc.coalesce(
+        pc.binary_join_element_wise(filename, pages, " - "), filename, pages, ""
+    )
+    title_line = pc.coalesce(pc.binary_join_element_wise("\nTitle: ", title, ""), "")
+
+    contexts = pc.binary_join_element_wise(
+        results["text"], "\nSource: ", source, title_line, ""
+    )
+    return contexts.to_pylist()
+
+
+def _scores(results: pa.Table) -> List[float]:
+    """Relevance scores where higher is better, whichever search produced them."""
+    if "_score" in results.column_names:
+        return results["_score"].to_pylist()
+    if "_distance" in results.column_names:
+        # Squared l2 distance of normalized embeddings: cosine = 1 - d / 2
+        return pc.subtract(1, pc.divide(results["_distance"], 2)).to_pylist()
+    return [0.0] * results.num_rows
+
+
+def to_results(results: pa.Table) -> List[SearchResult]:
+    """Convert a search result table into SearchResult objects.
+
+    Each column is converted in one go and contexts are formatted with
+    format_contexts, so only the final objects are built per row.
+
+    Args:
+        results: Search results with RESULT_COLUMNS and a "_score" or
+            "_distance" column
+
+    Returns:
+        One SearchResult per row, in rank order
+    """
+    metadata = results["metadata"]
+    columns = zip(
+        results["text"].to_pylist(),
+        pc.struct_field(metadata, "filename").to_pylist(),
+        pc.struct_field(metadata, "page_numbers").to_pylist(),
+        pc.struct_field(metadata, "title").to_pylist(),
+        _scores(results),
+        results["chunk_id"].to_pylist(),
+        format_contexts(results),
+    )
+    return [
+        SearchResult(text, filename or None, pages or [], title or None, *rest)
+        for text, filename, pages, title, *rest in columns
+    ]
+
+
+def join_contexts(results: List[SearchResult]) -> str:
+    """Join the results' contexts for the system prompt."""
+    return "\n\n".join(result.context for result in results)
+
+
+def dump_results(results: List[SearchResult]) -> str:
+    """Serialize results to JSON, e.g. to cache them with an answer."""
+    return json.dumps([asdict(result) for result in results])
+
+
+def _timed(run) -> Tuple[pa.Table, float]:
+    start = time.perf_counter()
+    results = run()
+    return results, (time.perf_counter() - start) * 1000
+
+
+def hybrid_search(
+    table,
+    query: str,
+    query_vector,
+    limit: int = 5,
+    params: Optional[SearchParams] = None,
+    candidates: Optional[int] = None,
+) -> Tuple[pa.Table, Dict[str, float]]:
+    """Run vector and full-text (BM25) search in parallel and fuse them with RRF.
+
+    The full-text leg runs on a helper thread while the vector leg runs on the
+    caller's, so concurrent queries don't queue behind each other's legs.
+
+    Exact identifiers such as error codes or API names are found by the BM25
+    leg even when their embeddings aren't close to the query's.
+
+    Args:
+        table: LanceDB table with the Chunks schema and a full-text index on text
+        query: The user's query, for the BM25 leg
+        query_vector: Embedded query, for the vector leg
+        limit: Number of fused results to return
+        params: ANN parameters for the vector leg
+        candidates: Results fetched per leg before fusion (default: 4 * limit)
+
+    Returns:
+        Tuple of fused results and per-leg latencies in milliseconds
+    """
+    candidates = candidates or 4 * limit
+
+    fts_future = _executor.submit(
+        _timed,
+        lambda: table.search(query, query_type="fts")
+        .limit(candidates)
+        .select(RESULT_COLUMNS)
+        .to_arrow(),
+    )
+    vector_results, vector_ms = _timed(
+        lambda: search_vectors(table, query_vector, candidates, params, RESULT_COLUMNS)
+    )
+    fts_results, fts_ms = fts_future.result()
+
+    start = time.perf_counter()
+    fused = reciprocal_rank_fusion([vector_results, fts_results], limit)
+    fusion_ms = (time.perf_counter() - start) * 1000
+
+    return fused, {"vector_ms": vector_ms, "fts_ms": fts_ms, "fusion_ms": fusion_ms}
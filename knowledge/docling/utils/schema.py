@@ -0,0 +1,270 @@
+from typing import Callable, Iterator, List, Optional, Sequence, Set
+
+import numpy as np
+import pyarrow as pa
+from lancedb.embeddings import get_registry
+from lancedb.pydantic import LanceModel, Vector
+
+from utils.dedup import NUM_PERM, minhash_array
+from utils.incremental import hash_chunk_fields
+from utils.quantization import VectorStorage
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+# Get the OpenAI embedding function
+func = get_registry().get("openai").create(name=EMBEDDING_MODEL)
+
+
+# Define a simplified metadata schema
+class ChunkMetadata(LanceModel):
+    """
+    You must order the fields in alphabetical order.
+    This is a requirement of the Pydantic implementation.
+    """
+
+    filename: str | None
+    page_numbers: List[int] | None
+    title: str | None
+
+
+# Define the main Schema
+class Chunks(LanceModel):
+    text: str = func.SourceField()
+    vector: Vector(func.ndims()) = func.VectorField()  # type: ignore
+    metadata: ChunkMetadata
+    source: str  # Input the document was converted from (URL or path)
+    doc_hash: str  # Content hash of the source document
+    chunk_id: str  # Content hash of the chunk
+    # Every source the chunk appears in, duplicates are stored once (see utils/dedup.py)
+    sources: List[str]
+    # "<doc_hash> <source>" of every source in sources, see utils/incremental.py
+    source_hashes: List[str]
+    minhash: Optional[Vector(NUM_PERM, value_type=pa.uint32())] = None  # type: ignore
+
+
+def chunks_schema(storage: VectorStorage = VectorStorage()) -> pa.Schema:
+    """Arrow schema of the Chunks table with vectors stored in the given mode.
+
+    Args:
+        storage: Vector dimensions, precision and quantization
+
+    Returns:
+        The Chunks schema for full float32 vectors, otherwise a schema with the
+        storage's vector columns and the mode recorded in its metadata
+    """
+    schema = Chunks.to_arrow_schema()
+    return schema if storage == VectorStorage() else storage.schema(schema)
+
+
+def open_chunks_table(
+    db, name: str, storage: VectorStorage = VectorStorage(), overwrite: bool = False
+):
+    """Create a Chunks table, or open an existing one after checking its schema.
+
+    A table created by an older version of these scripts misses columns that
+    incremental syncing relies on (e.g. source, doc_hash, chunk_id or
+    source_hashes). Depending on the LanceDB version, create_table(exist_ok=True)
+    either reopens it as it is or fails with a bare schema mismatch; this
+    names the missing columns and the fix instead.
+
+    Args:
+        db: LanceDB connection
+        name: Table name
+        storage: Vector storage of the table
+        overwrite: Drop any existing table and start empty
+
+    Returns:
+        LanceDB table with the Chunks schema
+
+    Raises:
+        ValueError: If the existing table lacks columns of the current schema
+            or stores vectors differently; recreate it with FULL_REFRESH
+    """
+    schema = chunks_schema(storage)
+    if overwrite:
+        return db.create_table(name, schema=schema, mode="overwrite")
+    try:
+        table = db.open_table(name)
+    except ValueError:  # Not created yet
+        return db.create_table(name, schema=schema, exist_ok=True)
+
+    missing = [field.name for field in schema if field.name not in table.schema.names]
+    if missing:
+        raise ValueError(
+            f"Table {name!r} was created by an older version and has no "
+            f"{', '.join(missing)} column(s). Set FULL_REFRESH = True in "
+            "3-embedding.py to recreate it."
+        )
+    stored = VectorStorage.from_schema(table.schema)
+    if (stored.mode, stored.dims) != (storage.mode, storage.dims):
+        raise ValueError(
+            f"Table {name!r} stores {stored} vectors, not {storage}. Set "
+            "FULL_REFRESH = True in 3-embedding.py to recreate it."
+        )
+    return table
+
+
+class ChunkColumns:
+    """Collects chunks of one document column by column into Arrow arrays.
+
+    Text, filename, page numbers and title are appended to flat per-column lists
+    in a single pass over the chunks. Page numbers go into one values list plus
+    offsets, which become a ListArray without any per-row Python dicts.
+    sync_document fills it one window of chunks at a time, clearing it in
+    between.
+    """
+
+    def __init__(self, source: str, doc_hash: str):
+        """Start an empty set of columns.
+
+        Args:
+            source: Identifier of the source document (URL or path)
+            doc_hash: Hash of the source document
+        """
+        self.source = source
+        self.doc_hash = doc_hash
+        self.texts: List[str] = []
+        self.filenames: List[Optional[str]] = []
+        self.titles: List[Optional[str]] = []
+        self.chunk_ids: List[str] = []
+        self.page_values: List[int] = []
+        self.page_offsets: List[int] = [0]
+        self.page_nulls: List[bool] = []
+        # MinHash signatures of the texts, set by sync_document when deduplicating
+        self.signatures: Optional[np.ndarray] = None
+        self._seen: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def append(self, chunk) -> bool:
+        """Add a chunk, skipping it if an identical chunk was already added.
+
+        Args:
+            chunk: Chunk produced by HybridChunker
+
+        Returns:
+            Whether the chunk was added
+        """
+        meta = chunk.meta
+        page_set = set()
+        for item in meta.doc_items:
+            for prov in item.prov:
+                page_set.add(prov.page_no)
+        pages = sorted(page_set)
+        filename = meta.origin.filename
+        title = meta.headings[0] if meta.headings else None
+
+        chunk_id = hash_chunk_fields(chunk.text, filename, pages or None, title)
+        if chunk_id in self._seen:
+            return False
+        self._seen.add(chunk_id)
+
+        self.texts.append(chunk.text)
+        self.filenames.append(filename)
+        self.titles.append(title)
+        self.chunk_ids.append(chunk_id)
+        self.page_values.extend(pages)
+        self.page_offsets.append(len(self.page_values))
+        self.page_nulls.append(not pages)
+        return True
+
+    def extend(self, chunks) -> "ChunkColumns":
+        """Add every chunk of an iterable, see append."""
+        for chunk in chunks:
+            self.append(chunk)
+        return self
+
+    def clear(self) -> None:
+        """Drop the collected rows but keep deduplicating against them."""
+        self.texts, self.filenames, self.titles, self.chunk_ids = [], [], [], []
+        self.page_values, self.page_offsets, self.page_nulls = [], [0], []
+        self.signatures = None
+
+    def to_table(self, schema: pa.Schema) -> pa.Table:
+        """Build the collected rows as an Arrow table.
+
+        Args:
+            schema: Arrow schema of the Chunks table, the vector columns are left
+                out
+
+        Returns:
+            Table with every column of schema except the vector columns
+        """
+        metadata_type = schema.field("metadata").type
+        page_type = metadata_type.field("page_numbers").type
+        page_numbers = pa.ListArray.from_arrays(
+            pa.array(self.page_offsets, pa.int32()),
+            pa.array(self.page_values, page_type.value_type),
+            type=page_type,
+            mask=pa.array(self.page_nulls, pa.bool_()),
+        )
+        fields = {
+            "filename": pa.array(self.filenames, pa.string()),
+            "page_numbers": page_numbers,
+            "title": pa.array(self.titles, pa.string()),
+        }
+        metadata = pa.StructArray.from_arrays(
+            [fields[field.name] for field in metadata_type],
+            fields=list(metadata_type),
+        )
+
+        num_rows = len(self)
+        columns = {
+            "text": pa.array(self.texts, pa.string()),
+            "metadata": metadata,
+            "source": pa.repeat(pa.scalar(self.source, pa.string()), num_rows),
+            "doc_hash": pa.repeat(pa.scalar(self.doc_hash, pa.string()), num_rows),
+            "chunk_id": pa.array(self.chunk_ids, pa.string()),
+            "sources": pa.repeat(
+                pa.scalar([self.source], pa.list_(pa.string())), num_rows
+            ),
+            # Filled in by sync_document once the whole document is written
+            "source_hashes": pa.repeat(pa.scalar([], pa.list_(pa.string())), num_rows),
+            "minhash": (
+                pa.nulls(num_rows, pa.list_(pa.uint32(), NUM_PERM))
+                if self.signatures is None
+                else minhash_array(self.signatures)
+            ),
+        }
+        schema = pa.schema([field for field in schema if field.name in columns])
+        return pa.Table.from_arrays(
+            [columns[field.name] for field in schema], schema=schema
+        )
+
+    def iter_batches(
+        self,
+        schema: pa.Schema,
+        batch_size: int = 256,
+        embed: Optional[Callable[[List[str]], Sequence]] = None,
+        mask: Optional[Sequence[bool]] = None,
+    ) -> Iterator[pa.RecordBatch]:
+        """Slice the collected rows into record batches for table.add.
+
+        Args:
+            schema: Arrow schema of the batches, with vector columns if embed is
+                given
+            batch_size: Number of rows per record batch
+            embed: Optional function returning one full float32 vector per text of
+                a batch, encoded as the schema's VectorStorage
+            mask: Optional row filter, only rows where it is True are yielded
+
+        Yields:
+            Record batches with at most batch_size rows
+        """
+        storage = VectorStorage.from_schema(schema)
+        table = self.to_table(schema)
+        if mask is not None:
+            table = table.filter(pa.array(mask, pa.bool_()))
+
+        for batch in table.to_batches(max_chunksize=batch_size):
+            if embed is None:
+                yield batch
+                continue
+
+            vectors = np.asarray(embed(batch.column("text").to_pylist()), np.float32)
+            columns = dict(zip(batch.schema.names, batch.columns))
+            columns.update(storage.encode(vectors))
+            yield pa.RecordBatch.from_arrays(
+                [columns[field.name] for field in schema], schema=schema
+            )
@@ -0,0 +1,194 @@
+import json
+import time
+from dataclasses import dataclass
+from hashlib import blake2b
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from lancedb.pydantic import LanceModel, Vector
+
+from utils.schema import func
+
+CACHE_TABLE_NAME = "semantic_cache"
+
+
+class CachedAnswer(LanceModel):
+    vector: Vector(func.ndims())  # type: ignore
+    prompt: str
+    context: str
+    answer: str
+    created_at: float
+    corpus_version: int  # Version of the docling table the answer was based on
+    history: str  # history_key of the conversation before the prompt
+
+
+def history_key(messages: Sequence[Dict[str, str]]) -> str:
+    """Key of the conversation before the last message.
+
+    A follow-up like "and how fast is it?" means something else in every
+    conversation, so answers are only reused within the same history. The
+    first question of a conversation has an empty history and is shared.
+
+    Args:
+        messages: Chat history ending with the user's question
+
+    Returns:
+        Hex digest of the earlier messages' roles and contents
+    """
+    history: List[Dict[str, str]] = [
+        {"role": message["role"], "content": message["content"]}
+        for message in messages[:-1]
+    ]
+    return blake2b(json.dumps(history).encode("utf-8"), digest_size=16).hexdigest()
+
+
+@dataclass
+class CacheHit:
+    """A previously answered prompt similar enough to the current one."""
+
+    prompt: str
+    context: str
+    answer: str
+    similarity: float
+
+
+class SemanticCache:
+    """Cache of answered prompts, looked up by embedding similarity.
+
+    Entries live in a LanceDB table next to the corpus and are scoped to the
+    conversation history the prompt was asked in. They expire after a TTL,
+    the oldest entries are evicted beyond max_entries, and everything is dropped
+    when the corpus table changes (e.g. after a re-ingest).
+    """
+
+    def __init__(
+        self,
+        db,
+        corpus,
+        threshold: float = 0.95,
+        ttl: float = 24 * 3600,
+        max_entries: int = 1000,
+    ):
+        """Open (or create) the cache table.
+
+        Args:
+            db: LanceDB connection
+            corpus: The docling table answers are based on
+            threshold: Minimum cosine similarity for a cache hit
+            ttl: Seconds until an entry expires
+            max_entries: Maximum number of cached answers
+        """
+        self.table = db.create_table(
+            CACHE_TABLE_NAME, schema=CachedAnswer, exist_ok=True
+        )
+        self.corpus = corpus
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def _corpus_version(self) -> int:
+        version = self.corpus.version
+        # Drop answers based on an older version of the corpus
+        if self.table.count_rows(f"corpus_version != {version}"):
+            self.table.delete(f"corpus_version != {version}")
+        return version
+
+    def lookup(self, vector, history: str) -> Optional[CacheHit]:
+        """Find the most similar cached prompt above the similarity threshold.
+
+        Args:
+            vector: Embedding of the incoming prompt
+            history: history_key of the conversation the prompt is asked in
+
+        Returns:
+            CacheHit, or None on a miss
+        """
+        version = self._corpus_version()
+        results = (
+            self.table.search(vector)
+            .distance_type("cosine")
+            .where(
+                f"corpus_version = {version} AND history = '{history}' "
+                f"AND created_at >= {time.time() - self.ttl}",
+                prefilter=True,
+            )
+            .limit(1)
+            .to_list()
+        )
+
+        if results and 1 - results[0]["_distance"] >= self.threshold:
+            self.hits += 1
+            row = results[0]
+            return CacheHit(
+                prompt=row["prompt"],
+                context=row["context"],
+                answer=row["answer"],
+                similarity=1 - row["_distance"],
+            )
+
+        self.misses += 1
+        return None
+
+    def store(
+        self, vector, prompt: str, context: str, answer: str, history: str
+    ) -> None:
+        """Cache an answer and evict expired or excess entries.
+
+        Args:
+            vector: Embedding of the prompt
+            prompt: The user's prompt
+            context: Retrieved results the answer was based on, serialized as text
+            answer: The model's answer
+            history: history_key of the conversation the prompt was asked in
+        """
+        now = time.time()
+        self.table.add(
+            [
+                {
+                    "vector": vector,
+                    "prompt": prompt,
+                    "context": context,
+                    "answer": answer,
+                    "created_at": now,
+                    "corpus_version": self._corpus_version(),
+                    "history": history,
+                }
+            ]
+        )
+        self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self.table.delete(f"created_at < {now - self.ttl}")
+
+        count = self.table.count_rows()
+        if count > self.max_entries:
+            created = (
+                self.table.search().select(["created_at"]).limit(None).to_arrow()
+            )["created_at"].to_pylist()
+            cutoff = sorted(created)[count - self.max_entries]
+            self.table.delete(f"created_at < {cutoff}")
+
+    def invalidate(self) -> None:
+        """Drop all cached answers."""
+        self.table.delete("true")
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def replay(answer: str, delay: float = 0.01) -> Iterator[str]:
+    """Stream a cached answer word by word, like a model response.
+
+    Args:
+        answer: The cached answer
+        delay: Seconds between words
+
+    Yields:
+        Pieces of the answer
+    """
+    for i, word in enumerate(answer.split(" ")):
+        yield word if i == 0 else f" {word}"
+        time.sleep(delay)
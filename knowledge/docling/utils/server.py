@@ -0,0 +1,350 @@
+"""Headless RAG service with server-sent event (SSE) streaming.
+
+One process serves many concurrent chat sessions from a single event loop:
+the LanceDB table, embedding cache and AsyncOpenAI connection pool are shared,
+blocking LanceDB calls run in a thread pool, and identical questions that are
+in flight at the same time are answered once. Run from knowledge/docling:
+
+    python -m utils.server [--port 8000] [--rerank]
+
+Point the Streamlit app at it with RAG_API_URL=http://localhost:8000.
+"""
+
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from hashlib import blake2b
+from typing import AsyncIterator, Dict, List, Literal, Optional, Set
+
+import httpx
+import lancedb
+import uvicorn
+from dotenv import load_dotenv
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from openai import AsyncOpenAI
+from pydantic import BaseModel, field_validator
+
+from utils.context import ContextPacker
+from utils.corpus import Corpus
+from utils.embedding_cache import EmbeddingCache
+from utils.rag import Event, answer_events, open_table, retrieve
+from utils.semantic_cache import SemanticCache
+from utils.telemetry import telemetry
+from utils.tokenizer import OpenAITokenizerWrapper
+
+
+class Message(BaseModel):
+    role: Literal["user", "assistant"]
+    content: str
+
+
+class ChatRequest(BaseModel):
+    messages: List[Message]
+    num_results: int = 5
+    hybrid: bool = True
+    shards: Optional[List[str]] = None  # Corpus shards to search instead of docling
+
+    @field_validator("messages")
+    @classmethod
+    def ends_with_question(cls, messages: List[Message]) -> List[Message]:
+        # Rejected with a 422 before anything is searched
+        if not messages or messages[-1].role != "user":
+            raise ValueError("messages must end with a user message")
+        return messages
+
+
+class _Broadcast:
+    """Events of one answer, replayed to every request waiting for it."""
+
+    def __init__(self):
+        self.events: List[Event] = []
+        self.done = False
+        self._condition = asyncio.Condition()
+
+    async def publish(self, event: str, data: dict) -> None:
+        async with self._condition:
+            self.events.append((event, data))
+            self._condition.notify_all()
+
+    async def close(self) -> None:
+        async with self._condition:
+            self.done = True
+            self._condition.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[Event]:
+        seen = 0
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(
+                    lambda: seen < len(self.events) or self.done
+                )
+                pending, done = self.events[seen:], self.done
+            seen += len(pending)
+            for event in pending:
+                yield event
+            if done and seen == len(self.events):
+                return
+
+
+class RAGService:
+    """Answers chat requests as a stream of events.
+
+    Events are ("results", ...) with the retrieved chunks, one ("token", ...)
+    per piece of the answer and a final ("done", ...) with the turn's
+    latencies, or ("error", ...) if the answer failed.
+    """
+
+    def __init__(
+        self,
+        uri: str = "data/lancedb",
+        max_connections: int = 200,
+        max_threads: int = 64,
+        reranker=None,
+    ):
+        """Open the shared resources.
+
+        Args:
+            uri: LanceDB database location
+            max_connections: Size of the connection pool to the OpenAI API
+            max_threads: Threads for blocking LanceDB calls and token counting
+            reranker: Optional Reranker applied to every request's results
+        """
+        self.table = open_table(uri)
+        self.corpus = Corpus(uri)
+        self.cache = EmbeddingCache()
+        self.semantic_cache = SemanticCache(lancedb.connect(uri), corpus=self.table)
+        self.packer = ContextPacker(OpenAITokenizerWrapper("o200k_base"))
+        self.reranker = reranker
+        self.client = AsyncOpenAI(
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections,
+                ),
+                timeout=httpx.Timeout(60.0, connect=5.0),
+            )
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max_threads)
+        self._in_flight: Dict[str, _Broadcast] = {}
+        # The loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self.coalesced = 0
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.client.close()
+        self.corpus.close()
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _key(request: ChatRequest) -> str:
+        return blake2b(
+            request.model_dump_json().encode("utf-8"), digest_size=16
+        ).hexdigest()
+
+    async def answer(self, request: ChatRequest) -> AsyncIterator[Event]:
+        """Stream the answer to a request, sharing it with identical requests.
+
+        Args:
+            request: Chat history ending with the user's question
+
+        Yields:
+            (event, data) tuples
+        """
+        key = self._key(request)
+        broadcast = self._in_flight.get(key)
+        if broadcast is None:
+            broadcast = self._in_flight[key] = _Broadcast()
+            # Runs to completion even if the client disconnects, others may wait on it
+            task = asyncio.create_task(self._produce(key, broadcast, request))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self.coalesced += 1
+
+        async for event in broadcast.subscribe():
+            yield event
+
+    async def _produce(
+        self, key: str, broadcast: _Broadcast, request: ChatRequest
+    ) -> None:
+        try:
+            async for event, data in self._answer(request):
+                await broadcast.publish(event, data)
+        except Exception as e:
+            await broadcast.publish("error", {"message": str(e)})
+        finally:
+            del self._in_flight[key]
+            await broadcast.close()
+
+    def _search(self, request: ChatRequest, prompt: str, vector, timings):
+        if request.shards:
+            return self.corpus.search(
+                prompt,
+                vector,
+                request.shards,
+                request.num_results,
+                hybrid=request.hybrid,
+                timings=timings,
+                reranker=self.reranker,
+            )
+        return retrieve(
+            self.table,
+            prompt,
+            vector,
+            request.num_results,
+            hybrid=request.hybrid,
+            timings=timings,
+            reranker=self.reranker,
+        )
+
+    def _answer(self, request: ChatRequest) -> AsyncIterator[Event]:
+        return answer_events(
+            [message.model_dump() for message in request.messages],
+            partial(self._search, request),
+            self.client,
+            self.cache,
+            self.packer,
+            # The answer cache follows the docling table, sharded requests skip it
+            None if request.shards else self.semantic_cache,
+            self._executor,
+        )
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Encode an event in the text/event-stream format."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def create_app(
+    uri: str = "data/lancedb",
+    service: Optional[RAGService] = None,
+    rerank: bool = False,
+):
+    """Create the FastAPI app.
+
+    Args:
+        uri: LanceDB database location
+        service: Service to serve (default: a RAGService on uri, opened at startup)
+        rerank: Rerank results with a local cross-encoder (default service only)
+
+    Returns:
+        FastAPI app with POST /chat, GET /health and GET /metrics
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if service is None:
+            reranker = None
+            if rerank:
+                # Imported here so torch is only loaded when reranking is enabled
+                from utils.rerank import Reranker
+
+                # torch's thread count is left alone: it is process-wide, so it
+                # would apply to every thread of the server
+                reranker = Reranker()
+            app.state.service = RAGService(uri, reranker=reranker)
+        else:
+            app.state.service = service
+        yield
+        await app.state.service.close()
+        telemetry.export()
+
+    app = FastAPI(title="Docling RAG", lifespan=lifespan)
+
+    @app.post("/chat")
+    async def chat(request: ChatRequest) -> StreamingResponse:
+        async def stream():
+            async for event, data in app.state.service.answer(request):
+                yield format_sse(event, data)
+
+        return StreamingResponse(
+            stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/health")
+    async def health() -> dict:
+        service = app.state.service
+        return {
+            "status": "ok",
+            "in_flight": len(service._in_flight),
+            "coalesced": service.coalesced,
+            "embedding_cache": str(service.cache.stats),
+            "answer_cache_hit_ratio": service.semantic_cache.hit_ratio,
+        }
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics() -> str:
+        # Prometheus text format, for scraping
+        return telemetry.metrics.render()
+
+    return app
+
+
+def iter_events(
+    api_url: str,
+    messages: List[Dict[str, str]],
+    num_results: int = 5,
+    hybrid: bool = True,
+    shards: Optional[List[str]] = None,
+    timeout: float = 60.0,
+):
+    """Call the service and yield its events, for synchronous clients.
+
+    Args:
+        api_url: Base URL of the service
+        messages: Chat history ending with the user's question
+        num_results: Number of chunks to retrieve
+        hybrid: Use hybrid retrieval when the table has a full-text index
+        shards: Corpus shards to search instead of the docling table
+        timeout: Seconds to wait for each read
+
+    Yields:
+        (event, data) tuples
+    """
+    body = {
+        "messages": messages,
+        "num_results": num_results,
+        "hybrid": hybrid,
+        "shards": shards,
+    }
+    with httpx.stream(
+        "POST", f"{api_url.rstrip('/')}/chat", json=body, timeout=timeout
+    ) as response:
+        response.raise_for_status()
+        event = "message"
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: ") :]
+            elif line.startswith("data: "):
+                yield event, json.loads(line[len("data: ") :])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the docling RAG API")
+    parser.add_argument("--uri", default="data/lancedb")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--rerank", action="store_true", help="rerank with a local cross-encoder"
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    # A single worker: one event loop handles all sessions, and identical
+    # in-flight questions are only coalesced within a process
+    uvicorn.run(
+        create_app(args.uri, rerank=args.rerank), host=args.host, port=args.port
+    )
+
+
+if __name__ == "__main__":
+    main()
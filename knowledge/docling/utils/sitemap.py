@@ -1,58 +1,228 @@
+import gzip
+import queue
+import threading
 import xml.etree.ElementTree as ET
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from hashlib import blake2b
+from typing import IO, Iterator, List, NamedTuple, Optional, Tuple
 from urllib.parse import urljoin
 
-import requests
+import httpx
 
+from utils.fetch import CacheEntry, Fetcher
 
-def get_sitemap_urls(base_url: str, sitemap_filename: str = "sitemap.xml") -> List[str]:
-    """Fetches and parses a sitemap XML file to extract URLs.
+
+class SitemapEntry(NamedTuple):
+    """A single <url> (or nested <sitemap>) entry from a sitemap."""
+
+    url: str
+    lastmod: Optional[str] = None
+
+    @property
+    def lastmod_datetime(self) -> Optional[datetime]:
+        """Parse the W3C datetime in lastmod, assuming UTC when no offset is given."""
+        if not self.lastmod:
+            return None
+        try:
+            parsed = datetime.fromisoformat(self.lastmod.strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _open_body(entry: CacheEntry) -> IO[bytes]:
+    """Open a fetched sitemap, transparently decompressing gzipped sitemaps."""
+    # Content-Encoding: gzip is decoded by httpx, .xml.gz files are decompressed here
+    stream = entry.open()
+    magic = stream.read(2)
+    stream.seek(entry.offset)
+    if magic == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj=stream)  # type: ignore[return-value]
+    return stream
+
+
+def parse_sitemap(stream: IO[bytes]) -> Iterator[Tuple[str, SitemapEntry]]:
+    """Incrementally parse a sitemap or sitemap index.
+
+    Elements are cleared as soon as they are read, so memory stays constant
+    no matter how many <loc> entries the file contains.
+
+    Args:
+        stream: Binary file-like object with the sitemap XML
+
+    Yields:
+        Tuples of ("url" | "sitemap", SitemapEntry)
+    """
+    root = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+
+        kind = _local_name(elem.tag)
+        if kind not in ("url", "sitemap"):
+            continue
+
+        loc = lastmod = None
+        for child in elem:
+            name = _local_name(child.tag)
+            if name == "loc" and child.text:
+                loc = child.text.strip()
+            elif name == "lastmod" and child.text:
+                lastmod = child.text.strip()
+
+        if loc:
+            yield kind, SitemapEntry(loc, lastmod)
+
+        # Drop everything parsed so far
+        root.clear()  # type: ignore[union-attr]
+
+
+def iter_sitemap_entries(
+    base_url: str,
+    sitemap_filename: str = "sitemap.xml",
+    max_workers: int = 8,
+    modified_since: Optional[datetime] = None,
+    timeout: int = 10,
+    fetcher: Optional[Fetcher] = None,
+) -> Iterator[SitemapEntry]:
+    """Stream URLs from a sitemap, following nested sitemap indexes concurrently.
+
+    Sitemaps are fetched with conditional GETs through the HTTP cache, so an
+    unchanged sitemap is parsed from disk after a 304.
+
+    URLs are de-duplicated across the whole sitemap tree, so memory grows with
+    the number of unique URLs: an 8-byte digest per URL, about 75 MB per
+    million URLs. For sites beyond tens of millions of URLs, crawl sub-sitemaps
+    separately.
 
     Args:
         base_url: The base URL of the website
         sitemap_filename: The filename of the sitemap (default: sitemap.xml)
+        max_workers: Number of sitemap files fetched in parallel
+        modified_since: Skip entries whose lastmod is older than this (entries without lastmod are kept)
+        timeout: Request timeout in seconds, when no fetcher is given
+        fetcher: Shared Fetcher (default: a new one, closed when done)
 
-    Returns:
-        List of URLs found in the sitemap. If sitemap is not found, returns a list
-        containing only the base URL.
+    Yields:
+        De-duplicated SitemapEntry objects. If the sitemap is not found, yields only the base URL.
 
     Raises:
-        ValueError: If there's an error fetching (except 404) or parsing the sitemap
+        ValueError: If there's an error fetching (except 404) or parsing a sitemap
     """
+    root_url = urljoin(base_url, sitemap_filename)
+    if modified_since and modified_since.tzinfo is None:
+        modified_since = modified_since.replace(tzinfo=timezone.utc)
+
+    # Bounded so a slow consumer applies backpressure instead of buffering millions of entries
+    results: queue.Queue = queue.Queue(maxsize=1024)
+    stop = threading.Event()
+    lock = threading.Lock()
+    seen_sitemaps = {root_url}
+    pending = 1
+
+    owns_fetcher = fetcher is None
+    if fetcher is None:
+        fetcher = Fetcher(timeout=timeout)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def put(item) -> None:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def crawl(sitemap_url: str) -> None:
+        nonlocal pending
+        try:
+            try:
+                result = fetcher.fetch(sitemap_url)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 404:
+                    raise
+                if sitemap_url == root_url:
+                    put(("url", SitemapEntry(base_url.rstrip("/"))))
+                return
+
+            with _open_body(result.entry) as stream:
+                for kind, entry in parse_sitemap(stream):
+                    if stop.is_set():
+                        return
+                    if kind == "url":
+                        put((kind, entry))
+                        continue
+
+                    with lock:
+                        if entry.url in seen_sitemaps:
+                            continue
+                        seen_sitemaps.add(entry.url)
+                        pending += 1
+                    executor.submit(crawl, entry.url)
+        except httpx.HTTPError as e:
+            put(("error", ValueError(f"Failed to fetch sitemap: {str(e)}")))
+        except ET.ParseError as e:
+            put(("error", ValueError(f"Failed to parse sitemap XML: {str(e)}")))
+        except Exception as e:
+            put(("error", ValueError(f"Unexpected error processing sitemap: {str(e)}")))
+        finally:
+            with lock:
+                pending -= 1
+                finished = pending == 0
+            if finished:
+                put(("done", None))
+
+    # Store compact digests rather than full URLs to keep de-duplication cheap.
+    # Unbounded on purpose: forgetting a URL would yield it twice (see above).
+    seen_urls = set()
+    executor.submit(crawl, root_url)
     try:
-        sitemap_url = urljoin(base_url, sitemap_filename)
-
-        # Fetch sitemap URL
-        response = requests.get(sitemap_url, timeout=10)
-
-        # # Return just the base URL if sitemap not found
-        if response.status_code == 404:
-            return [base_url.rstrip("/")]
+        while True:
+            kind, entry = results.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise entry
+
+            digest = blake2b(entry.url.encode("utf-8"), digest_size=8).digest()
+            if digest in seen_urls:
+                continue
+            seen_urls.add(digest)
+
+            if modified_since:
+                lastmod = entry.lastmod_datetime
+                if lastmod and lastmod < modified_since:
+                    continue
+            yield entry
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        if owns_fetcher:
+            fetcher.close()
 
-        response.raise_for_status()
 
-        # Parse XML content
-        root = ET.fromstring(response.content)
-
-        # Handle different XML namespaces that sitemaps might use
-        namespaces = (
-            {"ns": root.tag.split("}")[0].strip("{")} if "}" in root.tag else ""
-        )
+def get_sitemap_urls(base_url: str, sitemap_filename: str = "sitemap.xml") -> List[str]:
+    """Fetches and parses a sitemap XML file to extract URLs.
 
-        # Extract URLs using namespace if present
-        if namespaces:
-            urls = [elem.text for elem in root.findall(".//ns:loc", namespaces)]
-        else:
-            urls = [elem.text for elem in root.findall(".//loc")]
+    Args:
+        base_url: The base URL of the website
+        sitemap_filename: The filename of the sitemap (default: sitemap.xml)
 
-        return urls
+    Returns:
+        List of URLs found in the sitemap. If sitemap is not found, returns a list
+        containing only the base URL.
 
-    except requests.RequestException as e:
-        raise ValueError(f"Failed to fetch sitemap: {str(e)}")
-    except ET.ParseError as e:
-        raise ValueError(f"Failed to parse sitemap XML: {str(e)}")
-    except Exception as e:
-        raise ValueError(f"Unexpected error processing sitemap: {str(e)}")
+    Raises:
+        ValueError: If there's an error fetching (except 404) or parsing the sitemap
+    """
+    return [entry.url for entry in iter_sitemap_entries(base_url, sitemap_filename)]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,326 @@
+"""Per-stage tracing and metrics for ingestion and retrieval.
+
+Stages are wrapped in spans (OpenTelemetry-style: trace and span ids, parent,
+start/end time, attributes). Every span also feeds a Prometheus-style latency
+histogram per stage, next to counters for documents, chunks and tokens. With
+no collector running, export() writes spans as JSON lines and metrics in the
+Prometheus text format to data/telemetry. When OTEL_EXPORTER_OTLP_ENDPOINT is
+set and the opentelemetry SDK is installed, spans are sent there as well.
+Run from knowledge/docling:
+
+    python -m utils.telemetry summary   # per-stage latency and throughput
+"""
+
+import argparse
+import atexit
+import bisect
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TELEMETRY_PATH = Path("data/telemetry")
+
+# Prometheus' default buckets, extended for document conversion
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+STAGE_SECONDS = "docling_stage_seconds"
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations (Prometheus semantics)."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Thread-safe registry of counters and histograms with labels."""
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = defaultdict(dict)
+        self.help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        """Add value to a counter."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.counters[name][key] = self.counters[name].get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Record an observation in a histogram."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self.histograms[name].get(key)
+            if histogram is None:
+                histogram = self.histograms[name][key] = Histogram()
+            histogram.observe(value)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+
+        def label_text(labels: Labels, extra: Labels = ()) -> str:
+            pairs = [f'{k}="{v}"' for k, v in (*labels, *extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{label_text(labels)} {value:g}")
+
+            for name, series in sorted(self.histograms.items()):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    bounds = [*map(str, histogram.buckets), "+Inf"]
+                    for bound, count in zip(bounds, histogram.counts):
+                        cumulative += count
+                        text = label_text(labels, (("le", bound),))
+                        lines.append(f"{name}_bucket{text} {cumulative}")
+                    lines.append(f"{name}_sum{label_text(labels)} {histogram.sum:g}")
+                    lines.append(f"{name}_count{label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    """One timed operation, in the shape of an OpenTelemetry span."""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_span_id",
+        "start_time",
+        "end_time",
+        "attributes",
+        "status",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.start_time = time.time_ns()
+        self.end_time: Optional[int] = None
+        self.attributes = attributes
+        self.status = "OK"
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    @property
+    def seconds(self) -> float:
+        return ((self.end_time or time.time_ns()) - self.start_time) / 1e9
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start_time,
+            "end_time_unix_nano": self.end_time,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class Telemetry:
+    """Collects spans and metrics in memory until they are exported."""
+
+    def __init__(self, max_spans: int = 100_000):
+        """Initialize empty buffers.
+
+        Args:
+            max_spans: Finished spans kept for export, the oldest are dropped
+        """
+        self.metrics = Metrics()
+        self.metrics.help[STAGE_SECONDS] = "Latency of each pipeline stage"
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+        self._otel = _otel_tracer()
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Time a stage as a span nested in the current one.
+
+        The duration is also observed in the docling_stage_seconds histogram
+        with the span name as the stage label.
+
+        Args:
+            name: Stage name, e.g. "convert" or "embed.request"
+            attributes: Span attributes such as the source or batch size
+
+        Yields:
+            The span, to add attributes while it runs
+        """
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        otel = self._otel.start_as_current_span(name) if self._otel else None
+        otel_span = otel.__enter__() if otel else None
+        try:
+            yield span
+        except BaseException as e:
+            span.status = f"ERROR: {type(e).__name__}"
+            raise
+        finally:
+            span.end_time = time.time_ns()
+            _current_span.reset(token)
+            self.spans.append(span)
+            self.metrics.observe(STAGE_SECONDS, span.seconds, stage=name)
+            if otel:
+                otel_span.set_attributes(
+                    {k: v for k, v in span.attributes.items() if v is not None}
+                )
+                otel.__exit__(None, None, None)
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        self.metrics.inc(name, value, **labels)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        self.metrics.observe(name, value, **labels)
+
+    def export(self, path: str | Path = TELEMETRY_PATH) -> Path:
+        """Append finished spans to spans.jsonl and rewrite metrics.prom.
+
+        Args:
+            path: Directory for the files
+
+        Returns:
+            The directory
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        spans = []
+        while self.spans:
+            spans.append(self.spans.popleft())
+        with open(path / "spans.jsonl", "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+        tmp_path = path / f"metrics.prom.{os.getpid()}.tmp"
+        tmp_path.write_text(self.metrics.render(), encoding="utf-8")
+        os.replace(tmp_path, path / "metrics.prom")
+        return path
+
+
+def _otel_tracer():
+    """OpenTelemetry tracer exporting to OTEL_EXPORTER_OTLP_ENDPOINT, if configured."""
+    if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return None
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        return None
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "docling"}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    atexit.register(provider.shutdown)
+    return provider.get_tracer("docling")
+
+
+telemetry = Telemetry()
+span = telemetry.span
+
+
+# Span attributes counting processed items, reported as throughput per stage
+THROUGHPUT_ATTRIBUTES = ("documents", "chunks", "tokens")
+
+
+def summarize(spans: List[dict]) -> List[str]:
+    """Per-stage count, total and p50/p95 latency, slowest stage first.
+
+    Stages whose spans count documents, chunks or tokens also get a rate over
+    the time spent in that stage.
+    """
+    durations: Dict[str, List[float]] = defaultdict(list)
+    items: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for entry in spans:
+        if not entry["end_time_unix_nano"]:
+            continue
+        seconds = (entry["end_time_unix_nano"] - entry["start_time_unix_nano"]) / 1e9
+        durations[entry["name"]].append(seconds)
+        for key in THROUGHPUT_ATTRIBUTES:
+            if isinstance(entry["attributes"].get(key), (int, float)):
+                items[entry["name"]][key] += entry["attributes"][key]
+
+    lines = []
+    for name, seconds in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        total = sum(seconds)
+        rates = " ".join(
+            f"{key}/sec={count / total:.1f}"
+            for key, count in items[name].items()
+            if total > 0
+        )
+        lines.append(
+            f"{name:<16} count={len(seconds):<6} total={total:8.2f}s "
+            f"p50={np.percentile(seconds, 50) * 1000:9.1f}ms "
+            f"p95={np.percentile(seconds, 95) * 1000:9.1f}ms {rates}".rstrip()
+        )
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarize exported telemetry")
+    parser.add_argument("command", choices=["summary"])
+    parser.add_argument("--path", default=str(TELEMETRY_PATH))
+    args = parser.parse_args()
+
+    with open(Path(args.path) / "spans.jsonl", encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    for line in summarize(spans):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
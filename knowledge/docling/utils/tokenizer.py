@@ -1,5 +1,8 @@
-from typing import Dict, List, Tuple
+from itertools import islice
+from typing import Any, Dict, List, Sequence, Tuple
 
+from docling_core.transforms.chunker.tokenizer.base import BaseTokenizer
+from pydantic import ConfigDict
 from tiktoken import get_encoding
 from transformers.tokenization_utils_base import PreTrainedTokenizerBase
 
@@ -9,21 +12,101 @@ class OpenAITokenizerWrapper(PreTrainedTokenizerBase):
     """Minimal wrapper for OpenAI's tokenizer."""
 
     def __init__(
-        self, model_name: str = "cl100k_base", max_length: int = 8191, **kwargs
+        self,
+        model_name: str = "cl100k_base",
+        max_length: int = 8191,
+        cache_size: int = 65536,
+        **kwargs,
     ):
         """Initialize the tokenizer.
 
         Args:
             model_name: The name of the OpenAI encoding to use
             max_length: Maximum sequence length
+            cache_size: Number of text spans whose token counts are cached. When
+                it's full, the oldest half of the entries is dropped (FIFO).
         """
         super().__init__(model_max_length=max_length, **kwargs)
         self.tokenizer = get_encoding(model_name)
         self._vocab_size = self.tokenizer.max_token_value
+        self._vocab: Dict[str, int] | None = None
+        self._counts: Dict[str, int] = {}
+        self._cache_size = cache_size
 
     def tokenize(self, text: str, **kwargs) -> List[str]:
         """Main method used by HybridChunker."""
-        return [str(t) for t in self.tokenizer.encode(text)]
+        return [str(t) for t in self.tokenizer.encode_ordinary(text)]
+
+    def encode(self, text, *args, **kwargs) -> List[int]:
+        """Encode straight to integer ids, skipping the string token round-trip.
+
+        Truncation to max_length is applied here, any other option goes to the
+        base class.
+        """
+        options = dict(kwargs)
+        options.pop("add_special_tokens", None)  # tiktoken adds none
+        truncation = options.pop("truncation", False)
+        max_length = options.pop("max_length", None)
+        if not isinstance(text, str) or args or options:
+            return super().encode(text, *args, **kwargs)
+
+        ids = self.tokenizer.encode_ordinary(text)
+        if truncation and truncation != "do_not_truncate":
+            ids = ids[: max_length or self.model_max_length]
+        return ids
+
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens in text, cached per text span."""
+        count = self._counts.get(text)
+        if count is None:
+            count = len(self.tokenizer.encode_ordinary(text))
+            self._remember(text, count)
+        return count
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text down to its first max_tokens tokens."""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        return self.tokenizer.decode(self.tokenizer.encode_ordinary(text)[:max_tokens])
+
+    def count_tokens_batch(
+        self, texts: Sequence[str], num_threads: int = 8
+    ) -> List[int]:
+        """Count tokens for many texts, encoding the uncached ones across threads.
+
+        Args:
+            texts: Texts to count
+            num_threads: Threads used by tiktoken's batch encoder
+
+        Returns:
+            Token count per text
+        """
+        # Cached counts are read before any new ones are stored, since storing
+        # can evict them
+        counts: Dict[str, int] = {}
+        missing: List[str] = []
+        for text in texts:
+            if text in counts:
+                continue
+            count = self._counts.get(text)
+            if count is None:
+                missing.append(text)
+                counts[text] = -1
+            else:
+                counts[text] = count
+
+        encoded = self.tokenizer.encode_ordinary_batch(missing, num_threads=num_threads)
+        for text, ids in zip(missing, encoded):
+            counts[text] = len(ids)
+            self._remember(text, len(ids))
+        return [counts[t] for t in texts]
+
+    def _remember(self, text: str, count: int) -> None:
+        if len(self._counts) >= self._cache_size:
+            # Dicts keep insertion order, so this drops the oldest half
+            for key in list(islice(self._counts, self._cache_size // 2)):
+                del self._counts[key]
+        self._counts[text] = count
 
     def _tokenize(self, text: str) -> List[str]:
         return self.tokenize(text)
@@ -35,7 +118,10 @@ class OpenAITokenizerWrapper(PreTrainedTokenizerBase):
         return str(index)
 
     def get_vocab(self) -> Dict[str, int]:
-        return dict(enumerate(range(self.vocab_size)))
+        # Build the (large) vocab once, on first use
+        if self._vocab is None:
+            self._vocab = {str(i): i for i in range(self.vocab_size)}
+        return self._vocab
 
     @property
     def vocab_size(self) -> int:
@@ -48,3 +134,25 @@ class OpenAITokenizerWrapper(PreTrainedTokenizerBase):
     def from_pretrained(cls, *args, **kwargs):
         """Class method to match HuggingFace's interface."""
         return cls()
+
+
+class ChunkerTokenizer(BaseTokenizer):
+    """Token-counting fast path for HybridChunker.
+
+    HybridChunker only needs token counts. Passing this instead of the raw wrapper
+    counts integer ids directly and reuses cached counts for repeated text spans.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    tokenizer: OpenAITokenizerWrapper
+    max_tokens: int = 8191
+
+    def count_tokens(self, text: str) -> int:
+        return self.tokenizer.count_tokens(text)
+
+    def get_max_tokens(self) -> int:
+        return self.max_tokens
+
+    def get_tokenizer(self) -> Any:
+        return self.tokenizer